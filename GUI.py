@@ -8,12 +8,17 @@ import colorsys
 import datetime as dt
 import numpy as np
 import os
+import queue
 import time
 import tkinter as tk
 import threading
 from google_speech import Speech
 
+import canvas_board
 import config as CFG
+import fonts
+import render
+import sparkline
 
 def color_brightness(color, amount=0.5):
     crgb = tuple(int(color[i+1:i+3], 16) for i in (0, 2 ,4))
@@ -24,8 +29,12 @@ def color_brightness(color, amount=0.5):
 
 
 class MainWindow(threading.Thread):
+    # the update and warning methods can be called from any thread, they only post to the
+    # renderer, the widgets are changed in the Tk thread. The thread of the window speaks the
+    # warnings.
     def __init__(self):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, daemon=True)
+        self.speech = queue.Queue(maxsize=8)
         self.start()
 
         self.root = tk.Tk()
@@ -39,15 +48,28 @@ class MainWindow(threading.Thread):
         # self.root.wm_state('zoomed')
         self.root.lift()
 
-        self.font = (CFG.FONT_FAMILY, 50, 'bold')
-        self.font_time = (CFG.FONT_FAMILY, 30)
-        self.font_helium = (CFG.FONT_FAMILY, 24)
+        # widgets are changed by the frames of the renderer, not by the update methods
+        self.renderer = render.Renderer(self.root, CFG.GUI_FPS)
+        if CFG.GUI_STATS:
+            self.renderer.add_hook(render.FrameReport(CFG.GUI_STATS))
+        self.renderer.start()
+
+        # one font per size class, resize() changes their sizes
+        self.fonts = fonts.FontLadder(self.root, CFG.FONT_FAMILY, {
+            'value': (1, 'bold'),
+            'small': (CFG.font_ratio_small, 'bold'),
+            'time': (CFG.font_ratio_time, 'normal'),
+            'gradient': (CFG.font_ratio_gradient, 'normal'),
+            'gradient_unit': (CFG.font_ratio_gradient_unit, 'normal'),
+            'helium': (CFG.font_ratio_helium, 'normal'),
+        })
+        self.font_button_helium = (CFG.FONT_FAMILY, 24)
         self.font_gui = (CFG.FONT_FAMILY, CFG.font_size_gui)
 
         self.topmost = False
         self.geometry = '800x600'
 
-        self.root.bind("<Configure>", self.resize)
+        self.resizer = fonts.Resizer(self.root, self.resize, CFG.GUI_RESIZE_DELAY)
         self.root.bind("<F12>", self.toggle_fullscreen)
         self.root.bind("<F11>", self.toggle_zoomed)
         self.root.bind("<F10>", self.toggle_topmost)
@@ -56,10 +78,10 @@ class MainWindow(threading.Thread):
         self.labels_names = {}
         self.labels_values = {}
         self.label_time = None
+        self.board = None
         self.font_scaling_factor = 10
         
         self.warnings = {}
-        self.warning_notification_output = False
         
         self.measure_helium_symbol = u"\u21bb"
         self.measure_animation_current = 0
@@ -84,6 +106,9 @@ class MainWindow(threading.Thread):
         
     def init_labels(self, labels, colors, sizes):
         """initialiyes layout with labels"""
+        if CFG.GUI_BACKEND == 'canvas':
+            self.init_board(labels, colors, sizes)
+            return
 
         self.menu_top = tk.Frame(self.root, height=12, borderwidth=0, highlightthickness=0, bg=CFG.COLOR_BACKGROUND_WINDOW)
         self.main_area = tk.Frame(self.root, borderwidth=0, highlightthickness=0, bg=CFG.COLOR_BACKGROUND_WINDOW)
@@ -112,7 +137,7 @@ class MainWindow(threading.Thread):
 
         row_num = 0
         row_height_relative = []
-        self.label_time = tk.Label(self.main_area, text="", font=self.font_time, fg=CFG.COLOR_TIME, bg=CFG.COLOR_BACKGROUND) 
+        self.label_time = tk.Label(self.main_area, text="", font=self.fonts['time'], fg=CFG.COLOR_TIME, bg=CFG.COLOR_BACKGROUND) 
         self.label_time.grid(column=0, row=row_num, columnspan=4, padx=0, pady=0, sticky=tk.N + tk.E + tk.W)
         tk.Grid.rowconfigure(self.main_area, row_num, weight=CFG.height_ratio_time)
         row_height_relative.append(CFG.height_ratio_time)
@@ -122,6 +147,7 @@ class MainWindow(threading.Thread):
         self.labels_values = {}
         self.labels_values_gradient = {}
         self.labels_values_gradient_unit = {}
+        self.sparklines = {}
         self.labels_small = {}
         total_size = 0
         # TODO: so far only sizes 1 and 2 are supported
@@ -136,16 +162,23 @@ class MainWindow(threading.Thread):
             if extra_column == 0:
                 row_num += 1
             self.labels_values_container[l] = tk.Frame(self.main_area, borderwidth=0, highlightthickness=0, bg=CFG.COLOR_BACKGROUND_WINDOW)
-            self.labels_names[l] = tk.Label(self.main_area, text=val, font=self.font, fg=colors[l], bg=CFG.COLOR_BACKGROUND)
-            self.labels_values[l] = tk.Label(self.labels_values_container[l], text="", font=self.font, fg=colors[l], bg=CFG.COLOR_BACKGROUND)
+            font = self.fonts['value'] if sizes[l] >= 2 else self.fonts['small']
+            self.labels_names[l] = tk.Label(self.main_area, text=val, font=font, fg=colors[l], bg=CFG.COLOR_BACKGROUND)
+            self.labels_values[l] = tk.Label(self.labels_values_container[l], text="", font=font, fg=colors[l], bg=CFG.COLOR_BACKGROUND)
             if sizes[l] >= 2:  # no gradients for the small labels
-                self.labels_values_gradient[l] = tk.Label(self.labels_values_container[l], text="      ", font=self.font, fg=color_brightness(colors[l], CFG.COLOR_gradient_brightness_factor), bg=CFG.COLOR_BACKGROUND)
-                self.labels_values_gradient_unit[l] = tk.Label(self.labels_values_container[l], text="/{}s".format(CFG.GRADIENT_SHOW), font=self.font, fg=color_brightness(colors[l], CFG.COLOR_gradient_unit_brightness_factor), bg=CFG.COLOR_BACKGROUND)
+                self.labels_values_gradient[l] = tk.Label(self.labels_values_container[l], text="      ", font=self.fonts['gradient'], fg=color_brightness(colors[l], CFG.COLOR_gradient_brightness_factor), bg=CFG.COLOR_BACKGROUND)
+                self.labels_values_gradient_unit[l] = tk.Label(self.labels_values_container[l], text="/{}s".format(CFG.GRADIENT_SHOW), font=self.fonts['gradient_unit'], fg=color_brightness(colors[l], CFG.COLOR_gradient_unit_brightness_factor), bg=CFG.COLOR_BACKGROUND)
             self.labels_values[l].grid(column=0, row=0, rowspan=2, padx=0, pady=0, sticky=tk.N + tk.S + tk.E)
             if sizes[l] >= 2:
                 self.labels_values_gradient[l].grid(column=1, row=0, padx=0, pady=0, sticky=tk.N + tk.S + tk.W)
                 self.labels_values_gradient_unit[l].grid(column=1, row=1, padx=0, pady=0, sticky=tk.N + tk.E + tk.W)
                 self.labels_values_container[l].columnconfigure(1, weight=1)
+                if CFG.SPARKLINE_SECONDS is not None:
+                    # history of the last SPARKLINE_SECONDS
+                    canvas = tk.Canvas(self.labels_values_container[l], width=CFG.SPARKLINE_WIDTH, height=1,
+                                       bg=CFG.COLOR_BACKGROUND, borderwidth=0, highlightthickness=0)
+                    canvas.grid(column=2, row=0, rowspan=2, padx=4, pady=4, sticky=tk.N + tk.S + tk.W)
+                    self.sparklines[l] = sparkline.Sparkline(canvas, colors[l], CFG.SPARKLINE_WIDTH)
             self.labels_values_container[l].rowconfigure(0, weight = 1)
             self.labels_values_container[l].rowconfigure(1, weight = 1)
             self.labels_values_container[l].columnconfigure(0, weight=1)
@@ -168,12 +201,12 @@ class MainWindow(threading.Thread):
             self.frame_helium.grid(column=0, row=row_num, columnspan=4, padx=0, pady=0, sticky=tk.N + tk.S + tk.E + tk.W)
             self.button_measure_helium = tk.Button(
                 self.frame_helium, text=self.measure_helium_symbol, command=self.measure_helium,
-                font=self.font_helium, fg=CFG.COLOR_button_helium_fg, bg=CFG.COLOR_button_helium_bg,
+                font=self.font_button_helium, fg=CFG.COLOR_button_helium_fg, bg=CFG.COLOR_button_helium_bg,
                 borderwidth=0, highlightthickness=0
             )
             self.button_measure_helium.pack(side=tk.LEFT)
             
-            self.label_helium = tk.Label(self.frame_helium, text="", font=self.font_helium, fg=CFG.COLOR_HELIUM, bg=CFG.COLOR_BACKGROUND)
+            self.label_helium = tk.Label(self.frame_helium, text="", font=self.fonts['helium'], fg=CFG.COLOR_HELIUM, bg=CFG.COLOR_BACKGROUND)
             self.label_helium.pack()
         
             tk.Grid.rowconfigure(self.main_area, row_num, weight=CFG.height_ratio_helium)
@@ -185,21 +218,104 @@ class MainWindow(threading.Thread):
         for i in range(4):
             tk.Grid.columnconfigure(self.main_area, i, weight=1)
 
+    def init_board(self, labels, colors, sizes):
+        """same layout as init_labels, drawn on one canvas"""
+        self.board = canvas_board.Board(self.root, self.font_gui, CFG.COLOR_BACKGROUND)
+
+        self.label_gui_ontop = self.board.top_text(u"\u25C9", CFG.COLOR_status_gui_inactive)
+        self.label_gui_ontop.bind("<Button-1>", self.toggle_topmost)
+
+        self.label_gui_spacers = {}
+        self.label_gui_warnings = {}
+        for l in labels:
+            self.label_gui_spacers[l] = canvas_board.Spacer()
+            self.label_gui_warnings[l] = self.board.warning(CFG.COLOR_status_gui_inactive)
+            self.label_gui_warnings[l].bind("<Button-1>", lambda event, key=l: self.remove_warning(key))
+
+        row_height_relative = [CFG.height_ratio_time]
+        row_num = self.board.row(CFG.height_ratio_time)
+        self.label_time = self.board.text(row_num, 2, 'n', self.fonts['time'], CFG.COLOR_TIME, y=0)
+
+        self.labels_names = {}
+        self.labels_values = {}
+        self.labels_values_gradient = {}
+        self.labels_values_gradient_unit = {}
+        self.sparklines = {}
+        self.labels_small = {}
+        total_size = 0
+        for l, val in labels.items():
+            extra_column = total_size % 2
+            if sizes[l] >= 2:
+                if extra_column:
+                    total_size += total_size % 2
+                    extra_column = 0
+            else:
+                self.labels_small[l] = True
+            if extra_column == 0:
+                row_num = self.board.row(CFG.height_ratio_normal)
+                row_height_relative.append(CFG.height_ratio_normal)
+            if sizes[l] >= 2:
+                column = 2
+                font = self.fonts['value']
+            else:
+                column = extra_column * 2 + 1
+                font = self.fonts['small']
+            self.labels_names[l] = self.board.text(row_num, column, 'e', font, colors[l], text=val)
+            self.labels_values[l] = self.board.text(row_num, column, 'w', font, colors[l])
+            if sizes[l] >= 2:
+                value = (self.labels_values[l],)
+                self.labels_values_gradient[l] = self.board.text(
+                    row_num, column, 'sw', self.fonts['gradient'],
+                    color_brightness(colors[l], CFG.COLOR_gradient_brightness_factor), text="      ", after=value)
+                self.labels_values_gradient_unit[l] = self.board.text(
+                    row_num, column, 'nw', self.fonts['gradient_unit'],
+                    color_brightness(colors[l], CFG.COLOR_gradient_unit_brightness_factor),
+                    text="/{}s".format(CFG.GRADIENT_SHOW), after=value)
+                if CFG.SPARKLINE_SECONDS is not None:
+                    canvas = tk.Canvas(self.board.canvas, width=CFG.SPARKLINE_WIDTH, height=1,
+                                       bg=CFG.COLOR_BACKGROUND, borderwidth=0, highlightthickness=0)
+                    self.board.window(canvas, row_num, column, 'w', height=0.8,
+                                      after=(self.labels_values_gradient[l], self.labels_values_gradient_unit[l]))
+                    self.sparklines[l] = sparkline.Sparkline(canvas, colors[l], CFG.SPARKLINE_WIDTH)
+            total_size += sizes[l]
+
+        if CFG.HELIUM != None:
+            row_num = self.board.row(CFG.height_ratio_helium)
+            row_height_relative.append(CFG.height_ratio_helium)
+            self.button_measure_helium = tk.Button(
+                self.board.canvas, text=self.measure_helium_symbol, command=self.measure_helium,
+                font=self.font_button_helium, fg=CFG.COLOR_button_helium_fg, bg=CFG.COLOR_button_helium_bg,
+                borderwidth=0, highlightthickness=0
+            )
+            self.board.window(self.button_measure_helium, row_num, 0, 'w')
+            self.label_helium = self.board.text(row_num, 2, 'center', self.fonts['helium'], CFG.COLOR_HELIUM)
+
+        row_height_relative = np.array(row_height_relative)
+        self.font_scaling_factor = np.sum(row_height_relative / np.max(row_height_relative))
+
     def update_values(self, values, str_time):
         '''updates values'''
         for k, v in values.items():
-            self.labels_values[k]['text'] = v
-        self.label_time['text'] = str_time
+            self.renderer.set(self.labels_values[k], 'text', v)
+        self.renderer.set(self.label_time, 'text', str_time)
 
     def update_values_gradient(self, values):
         '''updates values'''
         for k, v in values.items():
             if k in self.labels_values_gradient:
-                self.labels_values_gradient[k]['text'] = v
+                self.renderer.set(self.labels_values_gradient[k], 'text', v)
+
+    def update_sparklines(self, columns):
+        '''key -> (newest column, mins, maxs) of a sparkline.Decimator'''
+        for k, (last, mins, maxs) in columns.items():
+            if k in self.sparklines:
+                self.renderer.call(('sparkline', k), self.sparklines[k].update, last, mins, maxs)
 
     def update_helium(self, str_helium):
-        self.label_helium['text'] = str_helium
-        
+        self.renderer.set(self.label_helium, 'text', str_helium)
+        self.renderer.call('helium', self.measure_helium_done)
+
+    def measure_helium_done(self):
         if self.measure_helium_animation_timer_id:
             self.root.after_cancel(self.measure_helium_animation_timer_id)
         self.measure_animation_current = 0
@@ -286,56 +402,38 @@ class MainWindow(threading.Thread):
         else:
             self.label_gui_ontop.config(fg=CFG.COLOR_status_gui_inactive)
 
-    def resize(self, event):
-        if (event.widget == self.root):
-            size = min(event.height / 3, event.width / 4)
-            s = int(size / self.font_scaling_factor * CFG.FONT_SCALING)
-            ssmall = int(s * CFG.font_ratio_small)
-            stime = int(s * CFG.font_ratio_time)
-            sgradient = int(s * CFG.font_ratio_gradient)
-            sgradientsmall = int(ssmall * CFG.font_ratio_gradient)
-            sgradientunit = int(s * CFG.font_ratio_gradient_unit)
-            sgradientunitsmall = int(ssmall * CFG.font_ratio_gradient_unit)
-            if CFG.HELIUM != None:
-                shelium = int(s * CFG.font_ratio_helium)
-            self.font = (CFG.FONT_FAMILY, s, 'bold')
-            self.font_small = (CFG.FONT_FAMILY, ssmall, 'bold')
-            self.font_time = (CFG.FONT_FAMILY, stime)
-            self.font_gradient = (CFG.FONT_FAMILY, sgradient)
-            self.font_gradientsmall = (CFG.FONT_FAMILY, sgradientsmall)
-            self.font_gradientunit = (CFG.FONT_FAMILY, sgradientunit)
-            self.font_gradientunitsmall = (CFG.FONT_FAMILY, sgradientunitsmall)
-            if CFG.HELIUM != None:
-                self.font_helium = (CFG.FONT_FAMILY, shelium)
-            for k in self.labels_values:
-                if k in self.labels_small:
-                    self.labels_values[k].config(font=self.font_small)
-                    # self.labels_values_gradient[k].config(font=self.font_gradientsmall)
-                    # self.labels_values_gradient_unit[k].config(font=self.font_gradientunitsmall)
-                    self.labels_names[k].config(font=self.font_small)
-                else:
-                    self.labels_values[k].config(font=self.font)
-                    self.labels_values_gradient[k].config(font=self.font_gradient)
-                    self.labels_values_gradient_unit[k].config(font=self.font_gradientunit)
-                    self.labels_names[k].config(font=self.font)
-            if self.label_time is not None:
-                self.label_time.config(font=self.font_time)
-            if CFG.HELIUM != None:
-                if self.label_helium is not None:
-                    self.label_helium.config(font=self.font_helium)
-            # print("New size is: {}x{}".format(event.width, event.height))
-            
+    def resize(self, width, height):
+        '''sizes of the fonts for a window of width x height, called by the resizer once the size settled'''
+        size = min(height / 3, width / 4)
+        if self.fonts.set(int(size / self.font_scaling_factor * CFG.FONT_SCALING)) and self.board is not None:
+            self.board.layout()
+
+    def run(self):
+        # speaks the warnings one after the other, the GUI does not wait for it
+        while True:
+            text = self.speech.get()
+            try:
+                speech = Speech(text, 'en')
+                speech.play()
+            except Exception as e:
+                print('Speech: {}'.format(e))
+            time.sleep(3)
+
     def warning_notification(self, text):
         print(dt.datetime.now().strftime('%b %d, %H:%M:%S'), text)
-        while self.warning_notification_output:
-            time.sleep(0.5)
-        self.warning_notification_output = True
-        speech = Speech(text, 'en')
-        speech.play()
-        time.sleep(3)
-        self.warning_notification_output = False
-        
+        try:
+            self.speech.put_nowait(text)
+        except queue.Full:
+            pass
+
     def warning(self, key, text, text_short):
+        # the latest warning or dewarning of a key is shown in the next frame
+        self.renderer.call(('warning', key), self.show_warning, key, text, text_short)
+
+    def dewarning(self, key):
+        self.renderer.call(('warning', key), self.show_dewarning, key)
+
+    def show_warning(self, key, text, text_short):
         if key not in self.warnings:
             self.warnings[key] = {}
             self.warnings[key]['last_sound'] = dt.datetime.now()-dt.timedelta(hours=24*365*10)
@@ -350,7 +448,7 @@ class MainWindow(threading.Thread):
         self.label_gui_spacers[key].pack(side=tk.LEFT)
         self.label_gui_warnings[key].config(fg=CFG.COLOR_status_gui_warning)
         
-    def dewarning(self, key):
+    def show_dewarning(self, key):
         if key in self.warnings:
             self.label_gui_warnings[key].config(fg=CFG.COLOR_status_gui_inactive)
             self.warnings[key]['num_warnings'] = 0
@@ -358,10 +456,14 @@ class MainWindow(threading.Thread):
     def warning_remove(self, event):
         for key, label in self.label_gui_warnings.items():
             if event.widget == label:
-                label.pack_forget()
-                self.label_gui_spacers[key].pack_forget()
-                self.warnings[key]['num_warnings'] = 0
+                self.remove_warning(key)
                 return
+
+    def remove_warning(self, key):
+        self.label_gui_warnings[key].pack_forget()
+        self.label_gui_spacers[key].pack_forget()
+        if key in self.warnings:
+            self.warnings[key]['num_warnings'] = 0
         
 def initGUI():
     gui = MainWindow()
@@ -0,0 +1,180 @@
+# background sampling of the ADS1115 adc chips
+#
+# One thread scans all configured adc channels in a fixed order at the data rate of the
+# chips and writes every sample to a preallocated ring buffer per channel. Readers average
+# a window of the latest samples instead of triggering conversions themselves.
+#
+# The ADS1115 only converts one input continuously, diode and resistor channels share a
+# chip, so the sampler switches the input for every sample and runs the chip at a high data
+# rate instead. Failed conversions are stored as -4000 like before.
+#
+# run this file directly for a comparison with single-shot reads on a fake adc,
+# python -m pytest test_adc_sampler.py for the tests on it
+
+import threading
+import time
+
+import numpy as np
+
+ERROR_VALUE = -4000
+
+
+class RingBuffer:
+    # fixed size buffer of float samples, one writer and any number of readers
+    def __init__(self, size):
+        self.size = size
+        self.data = np.zeros(size)
+        self.index = 0          # next position to write
+        self.count = 0          # number of samples written so far
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count += 1
+
+    def last(self, n):
+        # copy of the latest n samples (less if there are not enough yet), oldest first
+        end = self.index
+        n = min(n, self.count, self.size)
+        start = end - n
+        if start >= 0:
+            return self.data[start:end].copy()
+        return np.concatenate((self.data[start:], self.data[:end]))
+
+    def since(self, count):
+        # samples written after the buffer had 'count' samples, returns them and the new count
+        total = self.count
+        return self.last(total - count), total
+
+
+class ADCSampler:
+    def __init__(self, data_rate=860, size=1024, interval=0.0):
+        self.data_rate = data_rate      # samples per second of the chips
+        self.size = size                # samples kept per channel
+        self.interval = interval        # pause after every scan over all channels
+        self.schedule = []              # (buffer, adc, channel, gain, lock) in scan order
+        self.buffers = {}
+        self.condition = threading.Condition()
+        self.scans = 0
+        self.active = threading.Event()     # cleared while sampling is paused
+        self.active.set()
+        self.running = False
+        self.thread = None
+
+    def add_channel(self, name, adc, channel, gain=1, lock=None):
+        # add a channel to the scan, lock is held during every conversion (e.g. lock of the i2c bus)
+        buffer = RingBuffer(self.size)
+        self.buffers[name] = buffer
+        self.schedule.append((buffer, adc, channel, gain, lock))
+        return buffer
+
+    def start(self):
+        if not self.schedule:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='adc_sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.active.set()           # a paused sampler waits for it
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def pause(self):
+        # stop sampling after the current conversion, e.g. for timing critical work
+        self.active.clear()
+
+    def resume(self):
+        self.active.set()
+
+    def read(self, adc, channel, gain):
+        try:
+            return adc.read_volts(channel=channel, gain=gain, data_rate=self.data_rate)
+        except TypeError:
+            # chip driver without data rate argument
+            return adc.read_volts(channel=channel, gain=gain)
+
+    def run(self):
+        while self.running:
+            self.active.wait()
+            if not self.running:
+                break
+            for buffer, adc, channel, gain, lock in self.schedule:
+                try:
+                    if lock is not None:
+                        with lock:
+                            value = self.read(adc, channel, gain)
+                    else:
+                        value = self.read(adc, channel, gain)
+                except Exception:
+                    value = ERROR_VALUE
+                buffer.append(value)
+            with self.condition:
+                self.scans += 1
+                self.condition.notify_all()
+            if self.interval:
+                time.sleep(self.interval)
+
+    def wait(self, scans=1, timeout=None):
+        # block until every channel got 'scans' more samples
+        with self.condition:
+            target = self.scans + scans
+            return self.condition.wait_for(lambda: self.scans >= target or not self.running, timeout)
+
+    def last(self, name, n):
+        return self.buffers[name].last(n)
+
+
+class FakeADS1115:
+    # fake adc with the conversion time of the ADS1115 and the cost of an i2c transfer, the
+    # n-th conversion of a channel returns channel + 0.001 * n volts
+    def __init__(self, i2c_time=0.0005):
+        self.i2c_time = i2c_time
+        self.conversions = {}       # channel -> conversions so far
+
+    def read_volts(self, channel, gain=1, data_rate=128):
+        time.sleep(self.i2c_time + 1.0 / data_rate)
+        n = self.conversions.get(channel, 0)
+        self.conversions[channel] = n + 1
+        return channel + 0.001 * n
+
+
+if __name__ == '__main__':
+    adc = FakeADS1115()
+    channels = {'TSTM': 0, 'TMAN': 1, 'TCRY': 2}
+    duration = 2
+
+    # single shot reads like read_analog did: 15 reads per channel one after another at the default rate
+    t_end = time.time() + duration
+    samples = 0
+    t_reads = []
+    while time.time() < t_end:
+        for name, channel in channels.items():
+            t = time.time()
+            values = [adc.read_volts(channel, 2, 128) for _ in range(15)]
+            np.mean(values)
+            t_reads.append(time.time() - t)
+            samples += 15
+    print('single shot: {:6.0f} samples/s, {:6.2f} ms per temperature'.format(
+        samples / duration, 1000 * np.mean(t_reads)))
+
+    # background sampler, reading a temperature averages a window of the ring buffer
+    sampler = ADCSampler(data_rate=860)
+    for name, channel in channels.items():
+        sampler.add_channel(name, adc, channel, gain=2)
+    sampler.start()
+    time.sleep(duration)
+    samples = sum(buffer.count for buffer in sampler.buffers.values())
+    for window in [15, 100, 1000]:
+        t = time.time()
+        for _ in range(1000):
+            for name in channels:
+                values = sampler.last(name, window)
+                np.mean(values)
+                np.std(values)
+        t_read = (time.time() - t) / 1000 / len(channels)
+        print('sampler:     {:6.0f} samples/s, {:6.3f} ms per temperature (window {})'.format(
+            samples / duration, 1000 * t_read, window))
+    sampler.stop()
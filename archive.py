@@ -0,0 +1,219 @@
+# compressed archive of finished daily logs
+#
+# Logs of days which are over are compressed to <name>.log.z, then the plain log and its time
+# index are removed. The rows are compressed in blocks of about BLOCK_SIZE bytes, every block
+# on its own, and an index with the time range of every block is appended, so reading an
+# hour decompresses a few blocks instead of the whole day. logindex.py reads compressed and
+# plain days alike. Off unless CFG.ARCHIVE_KEEP_DAYS is set, the plain logs are deleted.
+#
+# file: MAGIC, uint32 length of the header line, header line, zlib blocks of whole rows,
+#       block index (first and last time [s], offset and size of every block),
+#       uint64 offset of the block index, uint64 number of blocks, MAGIC
+#
+# python archive.py compress <log pattern> <date format> [days to keep]: compress the logs of
+#   the days which are over at low priority, started by status-read.py
+# python archive.py [days]: compression ratio and random reads on generated logs
+
+import datetime as dt
+import glob
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b'RPILOGZ1'
+SUFFIX = '.z'
+BLOCK_SIZE = 64 * 1024
+BLOCK = np.dtype([('start', '<i8'), ('end', '<i8'), ('offset', '<i8'), ('size', '<i8')])
+TRAILER = struct.Struct('<QQ8s')
+
+
+def compress(path, parse, block_size=BLOCK_SIZE, level=9, pause=0):
+    # path + SUFFIX from the plain log at path, a row cut off at the end is left out
+    # parse: str -> time [s] of a row (see logindex.time_parser), pause: seconds after every block
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    temporary = path + SUFFIX + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header)) + header)
+        blocks = []
+        position = 0
+        while position < end:
+            stop = data.find(b'\n', min(position + block_size, end) - 1) + 1
+            chunk = data[position:stop]
+            times = []
+            for line in chunk.split(b'\n'):
+                try:
+                    times.append(parse(line[:line.index(b'\t')].decode()))
+                except ValueError:
+                    pass
+            compressed = zlib.compress(chunk, level)
+            blocks.append((min(times) if times else -1, max(times) if times else -1, f.tell(), len(compressed)))
+            f.write(compressed)
+            position = stop
+            if pause:
+                time.sleep(pause)
+        offset = f.tell()
+        f.write(np.array(blocks, BLOCK).tobytes())
+        f.write(TRAILER.pack(offset, len(blocks), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path + SUFFIX)
+    return header + data[:end]
+
+
+def read_index(f):
+    # (header line, block index) of an open compressed log
+    f.seek(0)
+    start = f.read(len(MAGIC) + 4)
+    if len(start) < len(MAGIC) + 4 or not start.startswith(MAGIC):
+        raise ValueError('not a compressed log')
+    header = f.read(struct.unpack('<I', start[len(MAGIC):])[0])
+    f.seek(-TRAILER.size, os.SEEK_END)
+    offset, count, magic = TRAILER.unpack(f.read(TRAILER.size))
+    if magic != MAGIC:
+        raise ValueError('incomplete compressed log')
+    f.seek(offset)
+    return header, np.frombuffer(f.read(count * BLOCK.itemsize), BLOCK)
+
+
+def read_lines(path, start=None, end=None):
+    # (header line, rows) of a compressed log, the rows of the blocks overlapping start to end [s]
+    with open(path, 'rb') as f:
+        header, blocks = read_index(f)
+        if start is not None:
+            blocks = blocks[blocks['end'] >= start]
+        if end is not None:
+            blocks = blocks[blocks['start'] <= end]
+        lines = []
+        for block in blocks:
+            f.seek(int(block['offset']))
+            lines += zlib.decompress(f.read(int(block['size']))).splitlines(keepends=True)
+    return header, lines
+
+
+def archive(pattern, parse, keep=1, pause=0.01):
+    # compress the logs of pattern (strftime pattern) except those of the last keep days
+    recent = {(dt.date.today() - dt.timedelta(days=n)).strftime(pattern) for n in range(keep + 1)}
+    done = 0
+    for path in sorted(glob.glob(re.sub(r'%.', '*', pattern))):
+        if path in recent:
+            continue
+        original = compress(path, parse, pause=pause)
+        header, lines = read_lines(path + SUFFIX)
+        if header + b''.join(lines) != original:
+            print('Archive: {} differs after compression, keeping the plain log'.format(path))
+            os.remove(path + SUFFIX)
+            continue
+        for name in [path, path + '.idx']:
+            if os.path.exists(name):
+                os.remove(name)
+        done += 1
+    return done
+
+
+def start(pattern, date_fmt, keep):
+    # run archive() in a separate process, its priority is lowered there
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), 'compress', pattern, date_fmt, str(keep)])
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['compress']:
+    import logindex
+    try:
+        # the whole process, os.nice only changes the calling thread on linux
+        os.nice(19)
+    except (AttributeError, OSError):
+        pass
+    t = time.time()
+    count = archive(sys.argv[2], logindex.time_parser(sys.argv[3]), int(sys.argv[4]) if len(sys.argv) > 4 else 1)
+    if count:
+        print('Archive: {} logs compressed in {:.1f} s'.format(count, time.time() - t))
+
+elif __name__ == '__main__':
+    import gzip
+    import shutil
+    import tempfile
+
+    import logindex
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    date_fmt = '%Y-%m-%d_%H:%M:%S'
+    parse = logindex.time_parser(date_fmt)
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    formats = ['.2e', '.2e', '.2e', '.3f', '.3f', '.2f', '.2f', '.2f']
+    directory = tempfile.mkdtemp()
+    pattern = os.path.join(directory, '%Y', 'pressure-LT-%Y-%m-%d.log')
+
+    # days before yesterday with a row every 2 s, noisy pressures and temperatures
+    random = np.random.RandomState(1)
+    paths = []
+    size = 0
+    for n in range(days):
+        day = dt.date.today() - dt.timedelta(days=days + 1 - n)
+        path = day.strftime(pattern)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        t0 = time.mktime(day.timetuple())
+        seconds = np.arange(0, 86400, 2)
+        base = np.array([1e-9, 2e-7, 5e-3, 4.2, 3.1, 295, 290, 296])
+        columns = base * (1 + 0.01 * np.sin(seconds[:, None] / 3000)) * (1 + 0.002 * random.randn(len(seconds), len(keys)))
+        rows = ['Time\t' + '\t'.join('{}[mbar]'.format(key) for key in keys) + '\n']
+        for i, second in enumerate(seconds):
+            rows.append(time.strftime(date_fmt, time.localtime(t0 + second)) + ''.join(
+                '\t{: {}}'.format(value, fmt) for value, fmt in zip(columns[i], formats)) + '\n')
+        with open(path, 'w') as f:
+            f.write(''.join(rows))
+        paths.append(path)
+        size += os.path.getsize(path)
+        logindex.update(path, parse)
+
+    # plain logs: random hours through the time index, whole day gzip for comparison
+    starts = [time.mktime((dt.date.today() - dt.timedelta(days=days + 1)).timetuple()) +
+              random.randint(0, days * 86400 - 3600) for _ in range(50)]
+    t = time.time()
+    plain = [logindex.query_columns(pattern, keys, start, start + 3600, date_fmt) for start in starts]
+    t_plain = (time.time() - t) / len(starts)
+    gzipped = 0
+    t = time.time()
+    for path in paths:
+        with open(path, 'rb') as f, gzip.open(path + '.gz', 'wb') as g:
+            shutil.copyfileobj(f, g)
+        gzipped += os.path.getsize(path + '.gz')
+    t_gzip = time.time() - t
+    t = time.time()
+    for start in starts[:10]:
+        with gzip.open(dt.datetime.fromtimestamp(start).strftime(pattern) + '.gz') as g:
+            g.read()
+    t_gunzip = (time.time() - t) / 10
+    for path in paths:
+        os.remove(path + '.gz')
+
+    t = time.time()
+    archive(pattern, parse, keep=1, pause=0)
+    t_archive = time.time() - t
+    compressed = sum(os.path.getsize(path + SUFFIX) for path in paths)
+    t = time.time()
+    packed = [logindex.query_columns(pattern, keys, start, start + 3600, date_fmt) for start in starts]
+    t_packed = (time.time() - t) / len(starts)
+    t = time.time()
+    for start in starts:
+        read_lines(dt.datetime.fromtimestamp(start).strftime(pattern) + SUFFIX, start, start + 3600)
+    t_lines = (time.time() - t) / len(starts)
+    for (a_times, a_values), (b_times, b_values) in zip(plain, packed):
+        assert np.array_equal(a_times, b_times) and np.array_equal(a_values, b_values)
+    print('{} days with a row every 2 s: {:.1f} MB plain'.format(days, size / 2 ** 20))
+    print('blocks:    {:5.1f} MB, ratio {:4.1f}, compressed in {:5.2f} s per day'.format(
+        compressed / 2 ** 20, size / compressed, t_archive / days))
+    print('whole gzip {:5.1f} MB, ratio {:4.1f}, compressed in {:5.2f} s per day'.format(
+        gzipped / 2 ** 20, size / gzipped, t_gzip / days))
+    print('random hour: rows of the blocks {:.2f} ms, inflating the whole gzip day {:.1f} ms'.format(
+        1000 * t_lines, 1000 * t_gunzip))
+    print('random hour parsed (all channels): plain log {:.2f} ms, blocks {:.2f} ms'.format(
+        1000 * t_plain, 1000 * t_packed))
+    shutil.rmtree(directory)
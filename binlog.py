@@ -0,0 +1,221 @@
+# binary pressure logs
+#
+# A file starts with a header describing its layout, then fixed size records follow:
+#   int64 time [ns since epoch], then for every logged channel float64 value and int8 status
+# The status is the index of the value in conv_to_decode (0 ok, 1 underrange, 2 overrange,
+# 3 error, 4 off, 5 not found, 6 id error), -1 for other values. Values are stored at full
+# precision. Readers memory-map the records as numpy structured array, nothing is parsed.
+#
+# header: MAGIC, uint32 length of the json part, json (channels, record dtype), padded to 16 bytes
+#
+# python binlog.py [tsv logs]: convert logs (.log -> .bin) and compare size and load time
+
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'RPIBLOG1'
+VERSION = 1
+
+
+def record_dtype(keys):
+    fields = [('time', '<i8')]
+    for key in keys:
+        fields += [(key, '<f8'), (key + '_status', 'i1')]
+    return np.dtype(fields)
+
+
+def status_codes(conv_to_decode):
+    # value of a status -> code in the file
+    return {value: code for code, value in conv_to_decode.items()}
+
+
+def make_header(channels, conv_to_decode):
+    # channels: list of (key, unit)
+    keys = [key for key, unit in channels]
+    description = {
+        'version': VERSION,
+        'channels': [{'key': key, 'unit': unit} for key, unit in channels],
+        'status': {str(code): value for code, value in conv_to_decode.items()},
+        'dtype': record_dtype(keys).descr,
+    }
+    text = json.dumps(description).encode()
+    length = len(MAGIC) + 4 + len(text) + 1
+    text += b' ' * (-length % 16) + b'\n'
+    return MAGIC + struct.pack('<I', len(text)) + text
+
+
+def parse_header(f):
+    # (description, size of the header) of an open file, None if it is not a complete header
+    start = f.read(len(MAGIC) + 4)
+    if len(start) < len(MAGIC) + 4 or not start.startswith(MAGIC):
+        return None
+    length = struct.unpack('<I', start[len(MAGIC):])[0]
+    text = f.read(length)
+    if len(text) < length:
+        return None
+    try:
+        description = json.loads(text.decode())
+    except ValueError:
+        return None
+    return description, len(MAGIC) + 4 + length
+
+
+def dtype_of(description):
+    return np.dtype([tuple(field) for field in description['dtype']])
+
+
+class BinarySink:
+    # sink for logwriter.LogWriter
+    def __init__(self, pattern, data, conv_to_decode):
+        self.pattern = pattern
+        self.channels = [(key, data[key]['unit']) for key in data if data[key]['log_to_file']]
+        self.conv_to_decode = conv_to_decode
+        self.codes = status_codes(conv_to_decode)
+        self.dtype = record_dtype([key for key, unit in self.channels])
+        self.struct = struct.Struct('<q' + 'db' * len(self.channels))
+
+    def path(self, t):
+        return time.strftime(self.pattern, time.localtime(t))
+
+    def header(self):
+        return make_header(self.channels, self.conv_to_decode)
+
+    def encode(self, t, latest):
+        fields = [int(t * 1e9)]
+        for key, unit in self.channels:
+            record = latest[key]
+            try:
+                value = float(record.value)
+            except (TypeError, ValueError):
+                value = float('nan')
+            fields += [value, self.codes.get(record.status, -1)]
+        return self.struct.pack(*fields)
+
+    def recover(self, f, size):
+        # header and complete records, None if the file has another layout
+        f.seek(0)
+        parsed = parse_header(f)
+        if parsed is None:
+            return 0
+        description, offset = parsed
+        if dtype_of(description) != self.dtype:
+            return None
+        return offset + (size - offset) // self.dtype.itemsize * self.dtype.itemsize
+
+
+def read(path):
+    # (description, records) of a file, records are memory-mapped
+    with open(path, 'rb') as f:
+        parsed = parse_header(f)
+    if parsed is None:
+        raise ValueError('{} is not a binary log'.format(path))
+    description, offset = parsed
+    dtype = dtype_of(description)
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return description, np.zeros(0, dtype)
+    return description, np.memmap(path, dtype, mode='r', offset=offset, shape=(count,))
+
+
+def read_range(pattern, start, end):
+    # memory-mapped records of every file from day start to day end (dates), one array per file
+    arrays = []
+    day = start
+    while day <= end:
+        path = day.strftime(pattern)
+        if os.path.isfile(path):
+            arrays.append(read(path)[1])
+        day = day.fromordinal(day.toordinal() + 1)
+    return arrays
+
+
+def convert(tsv_path, bin_path, conv_to_decode, date_fmt):
+    # binary log from a tsv log, status codes follow from the sentinel values
+    codes = status_codes(conv_to_decode)
+    with open(tsv_path) as f:
+        names = f.readline().rstrip('\n').split('\t')[1:]
+        channels = [(name.split('[')[0], name.split('[')[1].rstrip(']') if '[' in name else '') for name in names]
+        dtype = record_dtype([key for key, unit in channels])
+        rows = []
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            # channels which are not logged leave empty fields
+            values = [field for field in fields[1:] if field.strip()]
+            if len(values) != len(channels):
+                continue
+            try:
+                t = time.mktime(time.strptime(fields[0], date_fmt))
+                values = [float(value) for value in values]
+            except ValueError:
+                continue
+            row = [int(t * 1e9)]
+            for value in values:
+                row += [value, codes.get(value, 0)]
+            rows.append(tuple(row))
+    records = np.array(rows, dtype)
+    with open(bin_path, 'wb') as f:
+        f.write(make_header(channels, conv_to_decode))
+        f.write(records.tobytes())
+    return len(records)
+
+
+def parse_tsv(path, date_fmt):
+    # tsv log as arrays of times and values, for comparison
+    times = []
+    values = []
+    with open(path) as f:
+        f.readline()
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            times.append(time.mktime(time.strptime(fields[0], date_fmt)))
+            values.append([float(field) for field in fields[1:] if field.strip()])
+    return np.array(times), np.array(values)
+
+
+if __name__ == '__main__':
+    import collections
+    import sys
+    import tempfile
+
+    import config as CFG
+    conv_to_decode = CFG.conv_to_decode
+    date_fmt = CFG.date_fmt
+    paths = sys.argv[1:]
+    if not paths:
+        # a synthetic day of 8 channels, one row every 2 s
+        import logwriter
+        Record = collections.namedtuple('Record', ['value', 'status', 'unreliable', 'time'])
+        keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+        formats = ['.2e', '.2e', '.2e', '.3f', '.3f', '.2f', '.2f', '.2f']
+        data = collections.OrderedDict((key, {'unit': 'K', 'format': fmt, 'log_to_file': True})
+                                       for key, fmt in zip(keys, formats))
+        tsv = logwriter.TSVSink('', data, date_fmt)
+        path = os.path.join(tempfile.mkdtemp(), 'synthetic.log')
+        t0 = time.time()
+        with open(path, 'wb') as f:
+            f.write(tsv.header())
+            for i in range(43200):
+                latest = {key: Record(np.random.random() * 300, 0, False, 0) for key in keys}
+                f.write(tsv.encode(t0 + 2 * i, latest))
+        paths = [path]
+
+    for path in paths:
+        bin_path = os.path.splitext(path)[0] + '.bin'
+        t = time.time()
+        rows = convert(path, bin_path, conv_to_decode, date_fmt)
+        t_convert = time.time() - t
+        t = time.time()
+        parse_tsv(path, date_fmt)
+        t_tsv = time.time() - t
+        t = time.time()
+        description, records = read(bin_path)
+        np.asarray(records['time'])
+        t_bin = time.time() - t
+        print('{}: {} rows converted in {:.2f} s'.format(os.path.basename(path), rows, t_convert))
+        print('  tsv: {:8.0f} kB, parse {:8.2f} ms'.format(os.path.getsize(path) / 1024, 1000 * t_tsv))
+        print('  bin: {:8.0f} kB, load  {:8.2f} ms (memory-mapped, full precision)'.format(
+            os.path.getsize(bin_path) / 1024, 1000 * t_bin))
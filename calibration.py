@@ -0,0 +1,145 @@
+# temperature calibrations as precompiled lookup tables
+#
+# The calibration curves are pickled interpolators (tempdiode.pickle, ...). They are compiled
+# once into a dense table '<name>.npy' with the rows x, y and the error bound of every
+# interval against the original curve. The table is memory-mapped at startup, no pickle
+# has to be loaded, and converts whole arrays of raw values with one np.interp call. A curve
+# without nodes (no x attribute) has no known range, it is loaded and used as it is.
+#
+# python calibration.py [name ...]: compile tables and compare them with the scalar calls
+
+import os
+import pickle as pk
+
+import numpy as np
+
+POINTS = 4096       # points of the dense grid
+CHECKS = 8          # points per interval compared with the original curve
+
+
+def curve_range(curve):
+    # range of a pickled interpolator (scipy interp1d keeps its nodes in x)
+    try:
+        x = np.asarray(curve.x, float)
+    except AttributeError:
+        raise ValueError('cannot determine the range of the calibration curve')
+    return np.min(x), np.max(x), np.unique(x)
+
+
+def evaluate(curve, x):
+    # evaluate original curve point by point, that is how it is called at runtime
+    return np.array([float(curve(v)) for v in x])
+
+
+class CalibrationTable:
+    def __init__(self, table):
+        self.table = table
+        self.x = table[0]
+        self.y = table[1]
+        self.error = table[2]       # max deviation from the original curve in [x[i], x[i+1]]
+        self.x_min = self.x[0]
+        self.x_max = self.x[-1]
+
+    @classmethod
+    def compile(cls, curve, points=POINTS):
+        # sample curve on a dense grid, nodes of the curve are kept so linear curves are exact
+        x_min, x_max, nodes = curve_range(curve)
+        x = np.union1d(np.linspace(x_min, x_max, points), nodes)
+        y = evaluate(curve, x)
+        # error bound of every interval from points in between
+        t = np.linspace(0, 1, CHECKS + 2)[1:-1]
+        x_check = (x[:-1, None] + (x[1:] - x[:-1])[:, None] * t).ravel()
+        deviation = np.abs(evaluate(curve, x_check) - np.interp(x_check, x, y)).reshape(-1, CHECKS)
+        error = np.append(np.max(deviation, axis=1), 0)
+        return cls(np.vstack((x, y, error)))
+
+    def __call__(self, values):
+        # convert raw value(s), raises ValueError outside of the calibrated range like interp1d
+        values = np.asarray(values, float)
+        if np.any(values < self.x_min) or np.any(values > self.x_max):
+            raise ValueError('value out of calibration range')
+        result = np.interp(values, self.x, self.y)
+        if result.ndim == 0:
+            return float(result)
+        return result
+
+    def error_bound(self, values=None):
+        # maximum deviation from the original curve, overall or at the given raw values
+        if values is None:
+            return float(np.max(self.error))
+        index = np.clip(np.searchsorted(self.x, values, side='right') - 1, 0, len(self.x) - 1)
+        return self.error[index]
+
+    def save(self, path):
+        np.save(path, self.table)
+
+
+def load(name, path='.', points=POINTS):
+    # calibration table of '<name>.pickle', compiled and cached as '<name>.npy' if necessary
+    table_file = os.path.join(path, name + '.npy')
+    pickle_file = os.path.join(path, name + '.pickle')
+    if os.path.isfile(table_file) and (not os.path.isfile(pickle_file) or
+                                       os.path.getmtime(table_file) >= os.path.getmtime(pickle_file)):
+        return CalibrationTable(np.load(table_file, mmap_mode='r'))
+    with open(pickle_file, 'rb') as f:
+        curve = pk.load(f)
+    try:
+        table = CalibrationTable.compile(curve, points)
+    except ValueError:
+        return curve
+    try:
+        table.save(table_file)
+    except OSError:
+        pass
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    class Curve:
+        # stand-in for a pickled interpolator: smooth curve called with one value at a time
+        def __init__(self):
+            self.x = np.linspace(0.1, 1.7, 200)
+
+        def __call__(self, v):
+            if v < self.x[0] or v > self.x[-1]:
+                raise ValueError('out of range')
+            return 500 * np.exp(-2.5 * v) + 1.0 * v ** 3
+
+    names = sys.argv[1:]
+    curves = {}
+    for name in names:
+        with open(name + '.pickle', 'rb') as f:
+            curves[name] = pk.load(f)
+    if not curves:
+        curves['synthetic'] = Curve()
+
+    for name, curve in curves.items():
+        t = time.time()
+        table = CalibrationTable.compile(curve)
+        t_compile = time.time() - t
+        if name in names:
+            table.save(name + '.npy')
+            t = time.time()
+            load(name)
+            t_load = time.time() - t
+            t = time.time()
+            with open(name + '.pickle', 'rb') as f:
+                pk.load(f)
+            t_unpickle = time.time() - t
+            print('{}: load table {:.2f} ms, unpickle {:.2f} ms'.format(name, 1000 * t_load, 1000 * t_unpickle))
+
+        x_min, x_max, nodes = curve_range(curve)
+        window = np.random.uniform(x_min, x_max, 1000)
+        t = time.time()
+        for v in window:
+            curve(v)
+        t_scalar = (time.time() - t) / len(window)
+        t = time.time()
+        for _ in range(100):
+            table(window)
+        t_table = (time.time() - t) / 100 / len(window)
+        print('{}: compile {:.0f} ms, max error {:.2e}, {:.2f} us per value (scalar calls) vs {:.4f} us (table, window of {})'.format(
+            name, 1000 * t_compile, table.error_bound(), 1e6 * t_scalar, 1e6 * t_table, len(window)))
@@ -0,0 +1,150 @@
+# the status board drawn on one canvas (CFG.GUI_BACKEND = 'canvas')
+#
+# Instead of a label per text in nested grid frames, every text of the board is a text item of
+# one tk canvas. The place of every item is given once (row, column, anchor) and turned into
+# coordinates by layout() when the canvas or the fonts change size. A new value is an
+# itemconfigure of its item and does not go through the geometry managers of Tk.
+#
+# Items are configured like labels (configure, config, item['text'] = ...), so GUI.MainWindow
+# and the renderer use them like the labels of the default backend. Texts after a value (the
+# gradient after the large values) are placed after the widest text the value had so far, the
+# fonts are monospaced.
+#
+# run gui_bench.py for update times and Tk commands compared with the labels
+
+import tkinter as tk
+import tkinter.font as tkfont
+
+COLUMNS = 4
+PAD = 2
+
+
+class Item:
+    # text item of a Board
+    def __init__(self, board, id, font):
+        self.board = board
+        self.id = id
+        self.font = font
+        self.chars = 0              # longest text so far
+
+    def configure(self, **options):
+        text = options.get('text')
+        if 'fg' in options:
+            options['fill'] = options.pop('fg')
+        self.board.canvas.itemconfigure(self.id, **options)
+        if text is not None and len(text) > self.chars:
+            self.chars = len(text)
+            self.board.layout()
+
+    config = configure
+
+    def __setitem__(self, option, value):
+        self.configure(**{option: value})
+
+    def width(self):
+        return self.chars * self.font.measure('0')
+
+    def bind(self, sequence, function):
+        self.board.canvas.tag_bind(self.id, sequence, function)
+
+    def pack(self, **options):
+        # warnings: shown in the top line, in the order they were first shown
+        if self not in self.board.shown:
+            self.board.shown.append(self)
+            self.board.layout_top()
+
+    def pack_forget(self):
+        if self in self.board.shown:
+            self.board.shown.remove(self)
+            self.board.canvas.coords(self.id, -1000, -1000)
+            self.board.layout_top()
+
+
+class Spacer:
+    # the spacers of the labels backend, the top line is spaced by layout_top
+    def pack(self, **options):
+        pass
+
+    def pack_forget(self):
+        pass
+
+
+class Board:
+    def __init__(self, parent, font_top, background):
+        self.canvas = tk.Canvas(parent, bg=background, borderwidth=0, highlightthickness=0)
+        self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.font_top = tkfont.Font(root=parent, font=font_top)
+        self.rows = []              # weights of the rows below the top line
+        self.places = {}            # item or window id -> (row, column, anchor, y, after)
+        self.windows = {}           # window id -> height as part of the row height
+        self.top = []               # items at the right of the top line
+        self.shown = []             # warnings shown, left of the top line
+        self.size = (1, 1)
+        self.canvas.bind('<Configure>', self.resize)
+
+    def row(self, weight):
+        self.rows.append(weight)
+        return len(self.rows) - 1
+
+    def text(self, row, column, anchor, font, fill, text='', y=0.5, after=None):
+        # text at column (in quarters of the width) of row, y as part of the row height, or after
+        # the widest text of the items in after
+        item = Item(self, self.canvas.create_text(0, 0, text=text, font=font, fill=fill, anchor=anchor), font)
+        item.chars = len(text)
+        self.places[item] = (row, column, anchor, y, after)
+        return item
+
+    def window(self, widget, row, column, anchor, y=0.5, after=None, height=None):
+        # widget (e.g. a button or the canvas of a sparkline) on the board, height as part of the row
+        id = self.canvas.create_window(0, 0, window=widget, anchor=anchor)
+        self.places[id] = (row, column, anchor, y, after)
+        if height is not None:
+            self.windows[id] = height
+        return id
+
+    def top_text(self, text, fill):
+        # text in the top line, right aligned
+        item = Item(self, self.canvas.create_text(0, 0, text=text, font=self.font_top, fill=fill, anchor='ne'),
+                    self.font_top)
+        self.top.append(item)
+        return item
+
+    def warning(self, fill):
+        # warning in the top line, hidden until shown by pack()
+        return Item(self, self.canvas.create_text(-1000, -1000, text='', font=self.font_top, fill=fill, anchor='nw'),
+                    self.font_top)
+
+    def resize(self, event):
+        if (event.width, event.height) != self.size:
+            self.size = (event.width, event.height)
+            self.layout()
+
+    def layout(self):
+        # coordinates of all items for the size of the canvas and the fonts
+        width, height = self.size
+        top = self.font_top.metrics('linespace') + PAD
+        total = sum(self.rows) or 1
+        tops = [top]
+        for weight in self.rows:
+            tops.append(tops[-1] + (height - top) * weight / total)
+        x = {}
+        # items placed after others last
+        for key, (row, column, anchor, y, after) in sorted(self.places.items(), key=lambda p: p[1][4] is not None):
+            if after is None:
+                x[key] = column * width / COLUMNS + (PAD if anchor.endswith('w') else 0)
+            else:
+                x[key] = max(x[item] + item.width() for item in after) + 2 * PAD
+            self.canvas.coords(key.id if isinstance(key, Item) else key, x[key], tops[row] + y * (tops[row + 1] - tops[row]))
+            if key in self.windows:
+                self.canvas.itemconfigure(key, height=max(int(self.windows[key] * (tops[row + 1] - tops[row])), 1))
+        self.layout_top()
+
+    def layout_top(self):
+        x = self.size[0] - PAD
+        for item in self.top:
+            self.canvas.coords(item.id, x, 0)
+            x -= item.width() + 2 * PAD
+        x = PAD
+        for item in self.shown:
+            self.canvas.coords(item.id, x, 0)
+            x += item.width() + self.font_top.measure(' ')
@@ -1,5 +1,5 @@
 import collections
-import pickle as pk
+import calibration
 from Adafruit_MAX31856 import MAX31856 as MAX31856
 
 MACHINE='LT'
@@ -7,6 +7,17 @@ MACHINE='LT'
 HELIUM_CHECK = '/pressure-logs/measure-helium-LT'
 HELIUM_LOG = '/pressure-logs/helium-LT-%Y.log'
 PRESSURE_LOGS = '/pressure-logs/%Y/pressure-LT-%Y-%m-%d.log'
+BINARY_LOGS = None  # e.g. '/pressure-logs/%Y/pressure-LT-%Y-%m-%d.bin' to also write binary logs (see binlog.py)
+LOG_QUEUE = 1000  # rows waiting for the log writer, rows are dropped if it is full
+LOG_FLUSH_INTERVAL = 30  # write rows to the card at least every n seconds
+LOG_FLUSH_ROWS = 64  # or as soon as n rows are waiting
+LOG_FSYNC = False  # also wait until the card has written them
+LOG_INDEX_STRIDE = 64  # time index entry every n rows for range queries (see logindex.py), None for no index
+ROLLUP = '/pressure-logs/rollup'  # min/max/mean per minute, hour and day of the logs (see rollup.py), None to disable
+ROLLUP_RUNEVERY = 10  # read new log rows into the rollup every n seconds
+ROLLUP_BUDGET = 2  # seconds per run for backfilling the archive
+ARCHIVE_KEEP_DAYS = None  # e.g. 7: logs of older days are compressed to .z and the plain logs deleted (see archive.py), None to keep them plain
+ARCHIVE_RUNEVERY = 3600  # look for days to compress every n seconds
 
 COM_PORT_MAXIGAUGE = '/dev/serial/by-id/usb-FTDI_FT232R_USB_UART_A505YB2G-if00-port0'
 COM_PORT_MVC_GAUGE_PREP = None
@@ -15,13 +26,39 @@ COM_PORT_ION_PREP = None
 COM_PORT_ION_CRYO = None
 COM_PORT_ION_STM = None
 
+MAXIGAUGE_STREAM = True         # use continuous output of the maxigauge controller instead of polling every channel
+MAXIGAUGE_STREAM_INTERVAL = 0   # output interval of the controller: 0 - 100 ms, 1 - 1 s, 2 - 1 min
+
 HELIUM=True
 
 FPS_SHOW=False
+GUI_SEPARATE_PROCESS = False  # run the window in its own process, measurement and logging go on if it hangs or crashes
+GUI_FPS = 10  # changed values are shown at most n times per second, unchanged labels are not touched
+GUI_STATS = 600  # print render times and skipped frames of the GUI every n seconds (0 - never)
+GUI_RESIZE_DELAY = 150  # ms without a new window size before the fonts are resized
+HEADLESS = False  # no window, the values are only served over HTTP, set HTTP_STATUS_PORT (also: status-read.py --headless)
+HTTP_STATUS_PORT = None  # e.g. 8080, serves /snapshot (JSON), /events (Server-Sent Events) and /metrics, None for no server
+HTTP_STATUS_HOST = '127.0.0.1'  # address the server listens on, '' for all interfaces (no authentication!)
+HTTP_STATUS_INTERVAL = 0.5  # s, at most one event per interval
+GUI_BACKEND = 'labels'  # 'labels' - a tk label for every text, 'canvas' - the whole board as items of one canvas, less work per update
+
+WORKERS = 6  # threads running the periodic tasks (analog values, helium, gradient, log, checks, main loop)
+
+# reading channels:
+# 'single-rate' - all channels are read as fast as the main loop runs
+# 'deadline' - every channel is read after its poll_interval, higher priority first
+SCHEDULER_PROFILE = 'deadline'
+SCHEDULER_REPORT = 600  # print how late the reads ran every n seconds (0 - never)
 
 GRADIENT = 30  # calc gradient from last n seconds
-GRADIENT_RUNEVERY = 5  # save past values every n seconds
+GRADIENT_RUNEVERY = 5  # update gradients every n seconds
+HISTORY_MEMORY = 64  # MB for the history of all values, about 5 h for 8 channels read at 10 Hz
 GRADIENT_SHOW = 60  # show gradient per n seconds
+GRADIENT_WINDOWS = [30, 300, 3600]  # gradients are kept up to date for these windows [s]
+GRADIENT_LOG = True  # fit pressures (unit mbar) in log space
+SPARKLINE_SECONDS = 3600  # history shown next to the large values (gui_size 2), None for no sparklines
+SPARKLINE_WIDTH = 120  # px, min and max of the values of every column are drawn
+SPARKLINE_RUNEVERY = 1  # update the sparklines every n seconds
 
 # temperature chip
 SPI0_DEV = 0
@@ -35,13 +72,14 @@ SPI1_CS0 = None
 SPI0_CS0_temp_type = MAX31856.MAX31856_K_TYPE
 SPI1_CS1 = None
 SPI0_CS1_temp_type = MAX31856.MAX31856_K_TYPE
+SPI_AUTO_CONVERSION = True  # chips convert continuously, results are read when a new conversion is ready
 
 data = collections.OrderedDict()
 # unit: unit in which the values are measure (mbar, K, C, A)
 # color: color which is used in the GUI
 # sensor type: sensor with which values are recorded (maxigauges, ADC_diods, ADC_resistor, SPI0, SPI1, mvc_stm, mvc_prep, ser_ion_stm, ser_ion_cryo, ser_ion_prep)
 # sensor: sensor number (channel)
-# value: current value (initial value -4000 - Not found)
+# value: initial value (-4000 - Not found), measured values are published as snapshots
 # limit_max: if value > limit_max -> # WARNING:
 # limit_max_warning: warning, which appears if value > limit_max
 # format: format of value displayed in GUI (check https://www.programiz.com/python-programming/methods/string/format )
@@ -50,6 +88,8 @@ data = collections.OrderedDict()
 # gui_size: size of value in GUI (1 or 2)
 # gui_order: set order for appearance in GUI
 # used_sensor: sensor assigned to value (None at beginning)
+# poll_interval: read value every n seconds (optional, 'deadline' scheduler only)
+# priority: channels with higher priority are read first if several are due (optional, 'deadline' scheduler only)
 data['PSTM'] = {'unit': 'mbar',
                      'color': '#837C00',
                      'sensor_type': 'maxigauges',
@@ -63,6 +103,8 @@ data['PSTM'] = {'unit': 'mbar',
                      'log_to_file': True,
                      'gui_size': 2,
                      'gui_order': 0,
+                     'poll_interval': 0.1,
+                     'priority': 2,
                      'used_sensor':None}
 data['PROU'] = {'unit': 'mbar',
                      'color': '#606060',
@@ -76,6 +118,8 @@ data['PROU'] = {'unit': 'mbar',
                      'log_to_file': True,
                      'gui_size': 1,
                      'gui_order': 6,
+                     'poll_interval': 1,
+                     'priority': 0,
                      'used_sensor':None}
 data['PPRP'] = {'unit': 'mbar',
                      'color': '#E6DD23',
@@ -90,6 +134,8 @@ data['PPRP'] = {'unit': 'mbar',
                      'log_to_file': True,
                      'gui_size': 2,
                      'gui_order': 1,
+                     'poll_interval': 0.1,
+                     'priority': 2,
                      'used_sensor':None}
 data['TSTM'] = {'unit': 'K',
                      'color': '#AC0D2F',
@@ -104,6 +150,8 @@ data['TSTM'] = {'unit': 'K',
                      'log_to_file': True,
                      'gui_size': 2,
                      'gui_order': 2,
+                     'poll_interval': 0.5,
+                     'priority': 1,
                      'used_sensor':None}
 data['TCRY'] = {'unit': 'K',
                      'color': '#606060',
@@ -118,6 +166,8 @@ data['TCRY'] = {'unit': 'K',
                      'log_to_file': True,
                      'gui_size': 1,
                      'gui_order': 8,
+                     'poll_interval': 1,
+                     'priority': 1,
                      'used_sensor':None}
 data['TSAM'] = {'unit': 'C',
                      'color': '#ABDA21',
@@ -130,6 +180,8 @@ data['TSAM'] = {'unit': 'C',
                      'log_to_file': True,
                      'gui_size': 2,
                      'gui_order': 4,
+                     'poll_interval': 0.5,
+                     'priority': 1,
                      'used_sensor':None}
 data['TMAN'] = {'unit': 'C',
                      'color': '#606060',
@@ -144,6 +196,8 @@ data['TMAN'] = {'unit': 'C',
                      'log_to_file': True,
                      'gui_size': 2,
                      'gui_order': 5,
+                     'poll_interval': 1,
+                     'priority': 0,
                      'used_sensor':None}
 data['TLAB'] = {'unit': 'C',
                      'color': '#606060',
@@ -155,6 +209,8 @@ data['TLAB'] = {'unit': 'C',
                      'log_to_file': True,
                      'gui_size': 1,
                      'gui_order': 7,
+                     'poll_interval': 5,
+                     'priority': 0,
                      'used_sensor':None}
 
 
@@ -182,18 +238,21 @@ SPI_PORT=0
 #adc
 ADC_ADDR_DIODS = 0x48
 ADC_ADDR_VARIOUS = 0x49
+ADC_DATA_RATE = 860     # samples per second of the adc chips (8, 16, 32, 64, 128, 250, 475, 860)
+ADC_AVERAGE = 15        # number of latest samples averaged for one value
+ADC_BUFFER = 1024       # samples kept per adc channel
 
 # decoding
 conv_to_decode = {0: 0, 1: 1e-12, 2: -1000, 3: -2000, 4: -3000, 5: -4000, 6: -5000}
 decoding_dict = {1e-12: 'Underrange', -1000: 'Overrange', -2000: 'Error', -3000: 'Off', -4000: 'Not found', -5000: 'ID error'}
 
-# temperature calibrations
+# temperature calibrations (lookup tables compiled from the pickled curves, see calibration.py)
 # voltage to temperature calibration for diode measuerement
-temp_calib_diode = pk.load(open("tempdiode.pickle", "rb"))
+temp_calib_diode = calibration.load("tempdiode")
 # voltage to temperature calibration for type-k thermocouple
-temp_calib_type_K = pk.load(open("temptypek.pickle", "rb"))
+temp_calib_type_K = calibration.load("temptypek")
 # resistance to temperature calibration for pt100 sensor
-temp_calib_resistor = pk.load(open("tempresistor.pickle", "rb"))
+temp_calib_resistor = calibration.load("tempresistor")
 
 # GUI
 FONT_FAMILY = 'Liberation Mono'
@@ -0,0 +1,123 @@
+# registry for the hardware handles (serial ports, i2c bus, adc and temperature chips)
+#
+# Every device is opened once, all channels using it share the same handle. Handles are
+# reference counted and the device is closed when the last channel releases it. Devices
+# on the same bus share one lock, so threads do not interleave transfers on that bus.
+#
+# run this file directly for a benchmark of init time and open file descriptors
+
+import threading
+
+
+class Handle:
+    def __init__(self, registry, name, device, lock, close):
+        self.registry = registry
+        self.name = name
+        self.device = device
+        self.lock = lock        # lock of the bus the device is connected to
+        self.close = close
+        self.refcount = 0
+
+    def release(self):
+        self.registry.release(self.name)
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self.handles = {}
+        self.bus_locks = {}
+        self.lock = threading.Lock()
+
+    def bus_lock(self, bus):
+        # lock shared by all devices on a bus
+        with self.lock:
+            if bus not in self.bus_locks:
+                self.bus_locks[bus] = threading.RLock()
+            return self.bus_locks[bus]
+
+    def acquire(self, name, opener, bus=None, close=None):
+        # return handle of device 'name', opener(): creates the device if it is not open yet
+        # close(device) is called when the last user released it, exceptions of opener() are passed on
+        if bus is None:
+            bus = name
+        lock = self.bus_lock(bus)
+        with lock:
+            handle = self.handles.get(name)
+            if handle is None:
+                device = opener()
+                handle = Handle(self, name, device, lock, close)
+                self.handles[name] = handle
+            handle.refcount += 1
+        return handle
+
+    def release(self, name):
+        handle = self.handles.get(name)
+        if handle is None:
+            return
+        with handle.lock:
+            handle.refcount -= 1
+            if handle.refcount > 0:
+                return
+            del self.handles[name]
+        self._close(handle)
+
+    def _close(self, handle):
+        try:
+            if handle.close is not None:
+                handle.close(handle.device)
+            elif hasattr(handle.device, 'close'):
+                handle.device.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        for name in list(self.handles):
+            handle = self.handles.pop(name, None)
+            if handle is not None:
+                self._close(handle)
+
+    def open_handles(self):
+        return len(self.handles)
+
+
+if __name__ == '__main__':
+    # every channel opening its own port (like measure did before) against the registry
+    import os
+    import time
+
+    class FakePort:
+        # opening costs some time and one file descriptor, like a serial port or i2c bus
+        def __init__(self, name):
+            time.sleep(0.005)
+            self.fd = os.open(os.devnull, os.O_RDONLY)
+
+        def close(self):
+            os.close(self.fd)
+
+    def open_fds():
+        return len(os.listdir('/proc/self/fd'))
+
+    print('channels | per channel: init [ms] fds | registry: init [ms] fds handles')
+    for num_channels in [1, 4, 16, 64]:
+        # four devices, channels are spread over them
+        names = ['port{}'.format(n % 4) for n in range(num_channels)]
+
+        fds = open_fds()
+        t = time.time()
+        ports = [FakePort(name) for name in names]
+        t_single = time.time() - t
+        fds_single = open_fds() - fds
+        for port in ports:
+            port.close()
+
+        fds = open_fds()
+        registry = DeviceRegistry()
+        t = time.time()
+        handles = [registry.acquire(name, lambda name=name: FakePort(name)) for name in names]
+        t_registry = time.time() - t
+        fds_registry = open_fds() - fds
+        print('{:8d} | {:17.1f} {:3d} | {:14.1f} {:3d} {:7d}'.format(
+            num_channels, 1000 * t_single, fds_single, 1000 * t_registry, fds_registry, registry.open_handles()))
+        for handle in handles:
+            handle.release()
+        assert registry.open_handles() == 0
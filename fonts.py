@@ -0,0 +1,84 @@
+# shared fonts of the GUI and debounced resizing
+#
+# Every size class of text (large values, small values, clock, gradients, helium) has one
+# named tkinter font, the labels are created with these fonts. Resizing changes the size of
+# the named fonts and Tk updates the labels using them, no label is configured. The sizes of
+# all classes for a base size are computed once and kept (the ladder), a class whose size did
+# not change is not touched.
+#
+# Resizer collects the <Configure> events of the window: dragging or going fullscreen sends
+# dozens of them, the fonts are resized once after the size did not change for 'delay' ms.
+#
+# run gui_bench.py for resize times
+
+import time
+import tkinter.font as tkfont
+
+
+class FontLadder:
+    def __init__(self, root, family, classes, base=50):
+        # classes: name -> (ratio of the base size, weight)
+        self.classes = classes
+        self.ladder = {}            # base size -> {name: size}
+        self.base = base
+        self.fonts = {name: tkfont.Font(root=root, family=family, size=size, weight=classes[name][1])
+                      for name, size in self.sizes(base).items()}
+
+    def __getitem__(self, name):
+        return self.fonts[name]
+
+    def sizes(self, base):
+        if base not in self.ladder:
+            self.ladder[base] = {name: int(base * ratio) for name, (ratio, weight) in self.classes.items()}
+        return self.ladder[base]
+
+    def set(self, base):
+        # resize to base, returns the number of fonts changed
+        if base == self.base:
+            return 0
+        old = self.sizes(self.base)
+        changed = 0
+        for name, size in self.sizes(base).items():
+            if size != old[name]:
+                self.fonts[name].configure(size=size)
+                changed += 1
+        self.base = base
+        return changed
+
+
+class Resizer:
+    def __init__(self, root, settled, delay=150):
+        # settled(width, height) once a burst of <Configure> events of root is over
+        self.root = root
+        self.settled = settled
+        self.delay = delay
+        self.size = None            # size of the last settled call
+        self.pending = None         # size of the last event
+        self.timer = None
+        self.events = 0             # events of the current burst
+        self.start = None           # time of the first event of the burst
+        self.last = None            # (events, seconds from the first event to settled) of the last burst
+        root.bind('<Configure>', self.configure, add='+')
+
+    def configure(self, event):
+        # events of the children reach the root too
+        if event.widget is not self.root:
+            return
+        size = (event.width, event.height)
+        if self.timer is None:
+            if size == self.size:
+                return
+            self.events = 0
+            self.start = time.perf_counter()
+        else:
+            self.root.after_cancel(self.timer)
+        self.events += 1
+        self.pending = size
+        self.timer = self.root.after(self.delay, self.settle)
+
+    def settle(self):
+        self.timer = None
+        if self.pending != self.size:
+            self.size = self.pending
+            self.settled(*self.size)
+        self.last = (self.events, time.perf_counter() - self.start)
@@ -0,0 +1,236 @@
+# incremental linear regression over sliding windows of the history
+#
+# For every window (e.g. 30 s, 5 min, 1 h) the sums n, Sx, Sy, Sxx and Sxy of the samples in
+# the window are kept up to date: new samples of the channel history are added, samples
+# which fell out of the window are subtracted again. The slope is then O(1), independent
+# of the window length. Sentinel values (-4000, ... see decoding_dict) and non finite values
+# are skipped, pressures can be fitted in log space. To keep rounding errors from piling up,
+# the sums are recomputed exactly from the history every 'recompute' samples.
+#
+# python gradient.py [pressure log]: compare with np.polyfit on recorded (or synthetic) data,
+# python -m pytest test_gradient.py checks the slopes against np.polyfit
+
+import numpy as np
+
+
+class WindowSums:
+    # sums of the valid samples in one window, x and y relative to an origin to keep them small
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.tail = 0           # number of the oldest sample in the window
+        self.t0 = 0             # origin of x [ns]: newest sample at the last exact computation
+        self.y0 = 0.0           # origin of y: mean at the last exact computation
+        self.clear()
+
+    def clear(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, t, y, sign=1):
+        # t [ns] and y arrays of valid samples, sign -1 removes them again
+        if len(t) < 16:
+            # numpy calls cost more than they save for a few samples
+            for ti, yi in zip(t.tolist(), y.tolist()):
+                x = (ti - self.t0) / 1e9
+                yi = yi - self.y0
+                self.n += sign
+                self.sx += sign * x
+                self.sy += sign * yi
+                self.sxx += sign * x * x
+                self.sxy += sign * x * yi
+            return
+        x = (t - self.t0) / 1e9
+        y = y - self.y0
+        self.n += sign * len(x)
+        self.sx += sign * np.sum(x)
+        self.sy += sign * np.sum(y)
+        self.sxx += sign * np.dot(x, x)
+        self.sxy += sign * np.dot(x, y)
+
+    def slope(self):
+        # slope of the least squares line, None with less than two samples
+        if self.n < 2:
+            return None
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if denominator <= 0:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / denominator
+
+    def value_at(self, t, slope):
+        # fitted value at time t [ns]
+        return self.y0 + (self.sy - slope * self.sx) / self.n + slope * (t - self.t0) / 1e9
+
+
+class GradientEngine:
+    def __init__(self, channel, windows=(30, 300, 3600), sentinels=(), log=False, recompute=10000):
+        self.channel = channel      # history.ChannelHistory
+        self.windows = {seconds: WindowSums(seconds) for seconds in windows}
+        self.sentinels = list(sentinels)
+        self.log = log              # fit log10 of the values, e.g. for pressures
+        self.recompute = recompute
+        self.head = 0               # number of the next sample to add
+        self.added = 0              # samples added since the last exact computation
+
+    def samples(self, start, end):
+        # times [ns], transformed values and validity of the samples number start to end - 1
+        times, values, status = self.channel.last(self.channel.count - start)
+        times, values = times[:end - start], values[:end - start]
+        ok = np.isfinite(values)
+        for sentinel in self.sentinels:
+            ok &= values != sentinel
+        if self.log:
+            ok &= values > 0
+        y = values[ok]
+        if self.log:
+            y = np.log10(y)
+        return times[ok], y
+
+    def update(self):
+        # add the samples appended to the channel since the last update, drop old ones from the windows
+        count = self.channel.count
+        if count == self.head:
+            return
+        oldest = count - min(count, self.channel.capacity)
+        if self.head < oldest or self.added >= self.recompute:
+            # missed samples or rounding errors piled up
+            self.recompute_sums()
+            return
+        t, y = self.samples(self.head, count)
+        for window in self.windows.values():
+            window.add(t, y)
+        self.added += count - self.head
+        self.head = count
+        t_newest = self.channel.last(1)[0][0]
+        for window in self.windows.values():
+            if t_newest - window.t0 > window.seconds * 1e9 or window.tail < oldest:
+                # origin is far away or the window is longer than the history, start again
+                self.recompute_window(window)
+                continue
+            times = self.channel.last(count - window.tail)[0]
+            limit = t_newest - window.seconds * 1e9
+            old = 0
+            while old < 16 and times[old] < limit:
+                # usually just a sample or two
+                old += 1
+            if old == 16:
+                old = np.searchsorted(times, limit)
+            if old:
+                t, y = self.samples(window.tail, window.tail + old)
+                window.add(t, y, -1)
+                window.tail += old
+
+    def recompute_window(self, window):
+        # exact sums from the history, origin at the newest sample
+        count = self.channel.count
+        times = self.channel.last()[0]
+        start = count - len(times) + np.searchsorted(times, times[-1] - window.seconds * 1e9)
+        t, y = self.samples(start, count)
+        window.tail = start
+        window.t0 = times[-1]
+        window.y0 = np.mean(y) if len(y) else 0.0
+        window.clear()
+        window.add(t, y)
+
+    def recompute_sums(self):
+        for window in self.windows.values():
+            self.recompute_window(window)
+        self.head = self.channel.count
+        self.added = 0
+
+    def slope(self, seconds):
+        # change of the value per second over the window, None if there are not enough valid samples
+        # in log space it is the slope of the fitted exponential at the newest sample
+        window = self.windows[seconds]
+        slope = window.slope()
+        if slope is None or not self.log:
+            return slope
+        value = 10 ** window.value_at(self.channel.last(1)[0][0], slope)
+        return value * np.log(10) * slope
+
+
+def polyfit_slope(channel, seconds, sentinels=(), log=False):
+    # the same slope with np.polyfit over the valid samples of the window, for comparison
+    times, values, status = channel.last()
+    x = (times - times[-1]) / 1e9
+    start = np.searchsorted(x, x[-1] - seconds)
+    x, values = x[start:], values[start:]
+    ok = np.isfinite(values) & ~np.isin(values, list(sentinels))
+    if log:
+        ok &= values > 0
+    if np.sum(ok) < 2:
+        return None
+    y = np.log10(values[ok]) if log else values[ok]
+    k, d = np.polyfit(x[ok], y, 1)
+    if log:
+        return 10 ** d * np.log(10) * k
+    return k
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    import history
+
+    sentinels = [-4000, -3000, -2000, -1000, -5000]
+    if len(sys.argv) > 1:
+        # pressure log: date and time, then one column per channel, first channel is used
+        rows = []
+        with open(sys.argv[1]) as f:
+            for line in f:
+                fields = line.split('\t')
+                try:
+                    t = time.mktime(time.strptime(fields[0], '%Y-%m-%d_%H:%M:%S'))
+                    rows.append((t, float(fields[1])))
+                except (ValueError, IndexError):
+                    pass
+        data = np.array(rows)
+        name = sys.argv[1]
+    else:
+        # synthetic pressure: pump down with noise and sensor dropouts, 10 Hz for 3 h
+        t = time.time() + np.arange(0, 3 * 3600, 0.1)
+        p = 1e-9 * (1 + 50 * np.exp(-(t - t[0]) / 2000)) * (1 + 0.02 * np.random.randn(len(t)))
+        p[np.random.random(len(t)) < 0.001] = -4000
+        data = np.column_stack((t, p))
+        name = 'synthetic'
+
+    channel = history.ChannelHistory(len(data))
+    windows = (30, 300, 3600)
+    for log in [False, True]:
+        channel = history.ChannelHistory(len(data))
+        engine = GradientEngine(channel, windows, sentinels, log=log)
+        checks = np.linspace(len(data) // 10, len(data), 10).astype(int)
+        deviation = {seconds: 0.0 for seconds in windows}
+        t_engine = 0.0
+        t_polyfit = {seconds: 0.0 for seconds in windows}
+        start = 0
+        for check in checks:
+            for t, value in data[start:check]:
+                channel.append(t, value, 0)
+            start = check
+            t = time.time()
+            engine.update()
+            t_engine += time.time() - t
+            for seconds in windows:
+                t = time.time()
+                reference = polyfit_slope(channel, seconds, sentinels, log)
+                t_polyfit[seconds] += time.time() - t
+                slope = engine.slope(seconds)
+                if reference is not None and slope is not None:
+                    # relative to the slope, at least 1 ppb/s of the value for flat curves
+                    scale = max(abs(reference), 1e-9 * abs(channel.last(1)[1][0]))
+                    deviation[seconds] = max(deviation[seconds], abs(slope - reference) / scale)
+
+        # cost of an update with one new sample
+        t = time.time()
+        for i in range(1000):
+            channel.append(data[-1, 0] + 0.1 * (i + 1), data[-1, 1], 0)
+            engine.update()
+            for seconds in windows:
+                engine.slope(seconds)
+        t_update = (time.time() - t) / 1000
+        print('{} ({} samples, {} space): update with one sample and all slopes {:.1f} us'.format(
+            name, len(data), 'log' if log else 'linear', 1e6 * t_update))
+        for seconds in windows:
+            print('  window {:5d} s: max relative deviation from np.polyfit {:.1e}, np.polyfit {:8.1f} us'.format(
+                seconds, deviation[seconds], 1e6 * t_polyfit[seconds] / len(checks)))
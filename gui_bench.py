@@ -0,0 +1,558 @@
+# render benchmarks of the GUI
+#
+# python gui_bench.py [hours]: sparklines of 4 channels with 10 Hz samples, a frame per second
+# of data, compared with drawing every sample of the window as one line. The time per frame
+# is checked against FRAME_BUDGET. On a display the frames are drawn on a Tk window, without
+# one (e.g. over ssh) on a canvas which only counts the calls, the time is then the python
+# side only.
+# Then the labels of LABELS channels and the clock, updated by a main loop every LOOP seconds:
+# every label set on every pass, compared with render.Renderer at FPS frames per second.
+# Last, window drags of BURST <Configure> events EVENT_SPACING s apart: the fonts of all
+# labels set on every event, compared with fonts.Resizer and the shared fonts.
+# Last, the same stream of values rendered by labels in grid frames (the 'labels' backend) and
+# by canvas_board.Board (the 'canvas' backend): CPU time and Tk commands per frame and per
+# text changed. Without display the widgets count the commands, the time is the python side
+# only, the geometry work of the labels is not in it.
+
+import sys
+import time
+
+import numpy as np
+
+import canvas_board
+import fonts
+import history
+import render
+import sparkline
+
+FRAME_BUDGET = 0.005        # seconds per frame for all sparklines on a Raspberry Pi
+CHANNELS = 4
+RATE = 10                   # samples per second
+WIDTH = 120                 # columns of a sparkline
+SECONDS = 3600              # shown by a sparkline
+LABELS = 8                  # large values
+LOOP = 0.08                 # seconds per pass of the main loop
+FPS = 10
+BURST = 40                  # <Configure> events of a window drag
+EVENT_SPACING = 0.015       # seconds between them
+
+
+class CountingCanvas:
+    # the canvas calls of Sparkline, counted instead of drawn
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.calls = 0
+        self.numbers = 0        # coordinates sent
+        self.item = 0
+
+    def bind(self, sequence, function):
+        event = type('Event', (), {'width': self.size[0], 'height': self.size[1]})
+        function(event)
+
+    def create_line(self, *coords, **options):
+        self.calls += 1
+        self.numbers += len(coords)
+        self.item += 1
+        return self.item
+
+    def coords(self, item, *coords):
+        self.calls += 1
+        self.numbers += len(coords)
+
+    def move(self, tag, dx, dy):
+        self.calls += 1
+
+    def delete(self, item):
+        self.calls += 1
+
+
+class CountingLabel:
+    # configure calls of a label, counted instead of drawn
+    configures = 0
+
+    def configure(self, **options):
+        CountingLabel.configures += 1
+
+
+class CountingBoardCanvas:
+    # the canvas calls of canvas_board.Board, counted instead of drawn
+    calls = 0
+
+    def __init__(self, parent=None, **options):
+        self.item = 0
+
+    def pack(self, **options):
+        pass
+
+    def bind(self, sequence, function):
+        pass
+
+    def create_text(self, *coords, **options):
+        CountingBoardCanvas.calls += 1
+        self.item += 1
+        return self.item
+
+    def itemconfigure(self, item, **options):
+        CountingBoardCanvas.calls += 1
+
+    def coords(self, item, *coords):
+        CountingBoardCanvas.calls += 1
+
+
+class ManualRoot:
+    # frames of a Renderer are run by the benchmark, not by Tk timers
+    def after(self, ms, function):
+        pass
+
+
+class CountingFont:
+    # named font without Tk, size changes counted
+    configures = 0
+
+    def __init__(self, root=None, **options):
+        pass
+
+    def configure(self, **options):
+        CountingFont.configures += 1
+
+    def measure(self, text):
+        # monospaced, 10 pixels per character
+        return 10 * len(text)
+
+    def metrics(self, option):
+        return 20
+
+
+class VirtualRoot:
+    # bind and after of a Tk root with a clock of its own, without display
+    def __init__(self):
+        self.now = 0.0
+        self.timers = {}
+        self.handlers = []
+        self.ids = 0
+
+    def bind(self, sequence, function, add=None):
+        self.handlers.append(function)
+        return function
+
+    def unbind(self, sequence, function):
+        self.handlers.remove(function)
+
+    def after(self, ms, function):
+        self.ids += 1
+        self.timers[self.ids] = (self.now + ms / 1000, function)
+        return self.ids
+
+    def after_cancel(self, id):
+        del self.timers[id]
+
+    def configure_event(self, width, height):
+        event = type('Event', (), {'widget': self, 'width': width, 'height': height})
+        for handler in self.handlers:
+            handler(event)
+
+    def wait(self, seconds):
+        end = self.now + seconds
+        while True:
+            due = [(t, id) for id, (t, function) in self.timers.items() if t <= end]
+            if not due:
+                break
+            self.now, id = min(due)
+            self.timers.pop(id)[1]()
+        self.now = end
+
+
+def canvases(root, count, width, height):
+    # Tk canvases on root, or counting ones without display
+    if root is None:
+        return [CountingCanvas(width, height) for _ in range(count)]
+    import tkinter as tk
+    result = []
+    for i in range(count):
+        canvas = tk.Canvas(root, width=width, height=height, bg='#000000', highlightthickness=0)
+        canvas.grid(row=i, column=0)
+        result.append(canvas)
+    root.update()
+    return result
+
+
+def open_display():
+    # Tk root window, None without display
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print('no display ({}): canvas calls are counted, not drawn'.format(str(e).split('\n')[0]))
+        return None
+    root.title('gui_bench')
+    return root
+
+
+def frame_times(root, frames, draw, clock=time.perf_counter):
+    # seconds of every frame, with the Tk event processing of the frame
+    times = []
+    for frame in range(frames):
+        t = clock()
+        draw(frame)
+        if root is not None:
+            root.update_idletasks()
+        times.append(clock() - t)
+    return np.array(times)
+
+
+def report(name, times, calls):
+    print('{:22s}: mean {:7.3f} ms, p99 {:7.3f} ms, max {:7.3f} ms, {:6.1f} canvas calls per frame, {}'.format(
+        name, 1000 * times.mean(), 1000 * np.percentile(times, 99), 1000 * times.max(), calls,
+        'within budget' if np.percentile(times, 99) < FRAME_BUDGET else 'over budget'))
+
+
+def bench_sparklines(root, hours):
+    # history of an hour before the frames, so the sparklines are full from the start
+    channels = [history.ChannelHistory(int((SECONDS + hours * 3600 + 60) * RATE)) for _ in range(CHANNELS)]
+    random = np.random.RandomState(1)
+    t0 = time.time() - SECONDS
+    frames = int(hours * 3600)
+
+    def samples(seconds):
+        t = t0 + np.arange(seconds * RATE) / RATE
+        return t, 1e-9 * (1 + 0.5 * np.sin(t / 900)) * (1 + 0.02 * random.randn(len(t)))
+
+    t, p = samples(SECONDS + frames)
+    start = SECONDS * RATE
+    for channel in channels:
+        for i in range(start):
+            channel.append(t[i], p[i], 0)
+
+    # sparklines: decimation, then incremental drawing
+    decimators = [sparkline.Decimator(channel, WIDTH, SECONDS, log=True) for channel in channels]
+    lines = [sparkline.Sparkline(canvas, '#c0c0c0', WIDTH) for canvas in canvases(root, CHANNELS, WIDTH, 60)]
+    calls = []
+
+    def draw_sparklines(frame):
+        n = 0
+        for channel, decimator, line in zip(channels, decimators, lines):
+            for i in range(start + frame * RATE, start + (frame + 1) * RATE):
+                channel.append(t[i], p[i], 0)
+            decimator.update()
+            line.update(*decimator.columns())
+            n += line.calls
+        calls.append(n)
+
+    times = frame_times(root, frames, draw_sparklines)
+    report('sparklines', times, np.mean(calls))
+    print('{:22s}  {} full redraws in {} frames'.format('', sum(line.redraws for line in lines), frames))
+
+    # every sample of the window as one line, drawn again every frame
+    if root is None:
+        plain = [CountingCanvas(WIDTH, 60) for _ in range(CHANNELS)]
+    else:
+        for canvas in root.grid_slaves():
+            canvas.destroy()
+        plain = canvases(root, CHANNELS, WIDTH, 60)
+    items = [canvas.create_line(0, 0, 0, 0, fill='#c0c0c0') for canvas in plain]
+
+    def draw_all_samples(frame):
+        for channel, canvas, item in zip(channels, plain, items):
+            times, values, status = channel.window(SECONDS, now=t[start + frame * RATE])
+            y = np.log10(values)
+            x = (times - times[0]) / (times[-1] - times[0]) * WIDTH
+            y = 59 - (y - y.min()) / (y.max() - y.min()) * 58
+            canvas.coords(item, *np.column_stack((x, y)).ravel().tolist())
+
+    # it is slow, a few frames are enough
+    times = frame_times(root, min(frames, 20), draw_all_samples)
+    report('all samples', times, CHANNELS)
+    print('{:22s}  {} coordinates per frame'.format('', 2 * CHANNELS * SECONDS * RATE))
+
+
+def bench_labels(root, hours):
+    # pressures change in the last digit now and then, temperatures more often
+    passes = int(hours * 3600 / LOOP)
+    random = np.random.RandomState(2)
+    t0 = time.time()
+    steps = np.cumsum(random.rand(passes, LABELS) < np.linspace(0.02, 0.5, LABELS), axis=0)
+    if root is None:
+        labels = [CountingLabel() for _ in range(LABELS + 1)]
+    else:
+        import tkinter as tk
+        for widget in root.grid_slaves():
+            widget.destroy()
+        labels = [tk.Label(root, text='', font=('Helvetica', 40, 'bold')) for _ in range(LABELS + 1)]
+        for i, label in enumerate(labels):
+            label.grid(row=i, column=0)
+        root.update()
+        configure = tk.Label.configure
+
+        def counted(self, cnf=None, **options):
+            CountingLabel.configures += 1
+            return configure(self, cnf, **options)
+        tk.Label.configure = counted
+
+    def texts(i):
+        clock = time.strftime('%H:%M:%S', time.localtime(t0 + i * LOOP))
+        return ['{:.2e}'.format(1e-9 * (1 + 0.01 * s)) for s in steps[i]] + [clock]
+
+    # every label on every pass
+    CountingLabel.configures = 0
+
+    def set_all(i):
+        for label, text in zip(labels, texts(i)):
+            label.configure(text=text)
+
+    times = frame_times(root, passes, set_all)
+    seconds = times.sum()
+    print('{:22s}: {:7.3f} ms per second of data, {:6.1f} label configures per second'.format(
+        'labels, every pass', 1000 * seconds / (passes * LOOP), CountingLabel.configures / (passes * LOOP)))
+
+    # renderer: passes only leave the texts, a frame every 1 / FPS seconds
+    CountingLabel.configures = 0
+    renderer = render.Renderer(ManualRoot(), FPS)
+    renderer.next = time.perf_counter()
+    stats = []
+    renderer.add_hook(stats.append)
+    frame = [0.0]
+
+    def set_rendered(i):
+        for label, text in zip(labels, texts(i)):
+            renderer.set(label, 'text', text)
+        if i * LOOP >= frame[0]:
+            frame[0] += 1 / FPS
+            renderer.next = time.perf_counter()
+            renderer.frame()
+
+    times = frame_times(root, passes, set_rendered)
+    durations = np.array([s.duration for s in stats])
+    print('{:22s}: {:7.3f} ms per second of data, {:6.1f} label configures per second, '
+          'frame mean {:.3f} ms, max {:.3f} ms'.format(
+              'labels, renderer', 1000 * times.sum() / (passes * LOOP), CountingLabel.configures / (passes * LOOP),
+              1000 * durations.mean(), 1000 * durations.max()))
+    if root is not None:
+        tk.Label.configure = configure
+
+
+def bench_resize(root, bursts):
+    # labels of the main window: name, value, gradient and unit of LABELS channels, clock and helium
+    classes = {'value': (1, 'bold'), 'time': (0.75, 'normal'), 'gradient': (0.4, 'normal'),
+               'gradient_unit': (0.35, 'normal'), 'helium': (0.75, 'normal')}
+    names = ['value', 'value', 'gradient', 'gradient_unit'] * LABELS + ['time', 'helium']
+    sizes = [(800 + 20 * i, 600 + 15 * i) for i in range(BURST)]
+    if root is None:
+        # virtual clock, the events are 15 ms apart without waiting, times are of the python side only
+        timers = VirtualRoot()
+        clock = lambda: timers.now
+        wait = timers.wait
+        event = timers.configure_event
+        font = fonts.tkfont.Font
+        fonts.tkfont.Font = CountingFont
+        labels = [CountingLabel() for _ in names]
+        idle = lambda: None
+    else:
+        import tkinter as tk
+        for widget in root.grid_slaves():
+            widget.destroy()
+        timers = root
+        clock = time.perf_counter
+        idle = root.update_idletasks
+
+        def wait(seconds):
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                root.update()
+                time.sleep(0.001)
+
+        def event(width, height):
+            root.event_generate('<Configure>', width=width, height=height, when='now')
+
+        labels = [tk.Label(root, text='1.23e-09') for _ in names]
+        for i, label in enumerate(labels):
+            label.grid(row=i // 4, column=i % 4)
+        root.update()
+
+    applied = [None]            # clock when the fonts were set last
+    configures = [0]
+    settle_work = [0.0]
+
+    def base(width, height):
+        return int(min(height / 3, width / 4) / 5 * 2)
+
+    def drag(name):
+        # work in the handlers and relayout, time from the first event until the last fonts are set
+        work = []
+        latency = []
+        configures[0] = 0
+        for burst in range(bursts):
+            busy = 0.0
+            start = clock()
+            for i, (width, height) in enumerate(sizes[::-1] if burst % 2 else sizes):
+                t = time.perf_counter()
+                event(width, height)
+                idle()
+                busy += time.perf_counter() - t
+                if i < BURST - 1:
+                    wait(EVENT_SPACING)
+            wait(0.5)
+            work.append(busy + settle_work[0])
+            settle_work[0] = 0.0
+            latency.append(applied[0] - start)
+        print('{:22s}: {:7.3f} ms work per drag, settled {:6.1f} ms after the first event, '
+              '{:6.1f} configures per drag'.format(name, 1000 * np.mean(work), 1000 * np.mean(latency),
+                                                   configures[0] / bursts))
+
+    # fonts of all labels set on every event, as GUI.resize did
+    def set_fonts(event):
+        s = base(event.width, event.height)
+        for label, name in zip(labels, names):
+            label.configure(font=('Liberation Mono', int(s * classes[name][0]), classes[name][1]))
+        configures[0] += len(labels)
+        applied[0] = clock()
+
+    binding = timers.bind('<Configure>', set_fonts)
+    drag('fonts on every event')
+    timers.unbind('<Configure>', binding)
+
+    # shared fonts, resized once per drag
+    ladder = fonts.FontLadder(root, 'Liberation Mono', classes)
+    for label, name in zip(labels, names):
+        label.configure(font=ladder[name])
+
+    def settled(width, height):
+        t = time.perf_counter()
+        configures[0] += ladder.set(base(width, height))
+        idle()
+        settle_work[0] += time.perf_counter() - t
+        applied[0] = clock()
+
+    fonts.Resizer(timers, settled, 150)
+    drag('fonts, debounced')
+    if root is None:
+        fonts.tkfont.Font = font
+
+
+def bench_board(root, hours):
+    # at most 5 minutes of frames, the backends take the same time every minute
+    frames = int(min(hours * 3600, 300) * FPS)
+    random = np.random.RandomState(3)
+    steps = np.cumsum(random.rand(frames, LABELS) < np.linspace(0.05, 0.8, LABELS), axis=0)
+    t0 = time.time()
+    value_font = ('Liberation Mono', 30, 'bold')
+    small_font = ('Liberation Mono', 15)
+
+    def updates(frame):
+        # texts of the frame: values, gradients every 5 s, the clock
+        texts = ['{:.2e}'.format(1e-9 * (1 + 0.01 * s)) for s in steps[frame]]
+        gradients = ['{:+.1e}'.format(1e-11 * (steps[frame][i] - steps[max(frame - 50, 0)][i])) if frame % 50 == 0 else None
+                     for i in range(LABELS)]
+        return texts, gradients, time.strftime('%H:%M:%S', time.localtime(t0 + frame / FPS))
+
+    def run(name, values, gradients, clock, commands):
+        # commands(): Tk commands so far
+        renderer = render.Renderer(ManualRoot(), FPS)
+        renderer.next = time.perf_counter()
+        stats = []
+        renderer.add_hook(stats.append)
+
+        def frame(i):
+            texts, new_gradients, now = updates(i)
+            for label, text in zip(values, texts):
+                renderer.set(label, 'text', text)
+            for label, text in zip(gradients, new_gradients):
+                if text is not None:
+                    renderer.set(label, 'text', text)
+            renderer.set(clock, 'text', now)
+            renderer.next = time.perf_counter()
+            renderer.frame()
+        before = commands()
+        times = frame_times(root, frames, frame, time.process_time)
+        changed = sum(s.changed for s in stats)
+        print('{:22s}: CPU mean {:7.3f} ms, p99 {:7.3f} ms per frame, {:6.1f} us per text changed, '
+              '{:5.1f} Tk commands per frame'.format(
+                  name, 1000 * times.mean(), 1000 * np.percentile(times, 99), 1e6 * times.sum() / max(changed, 1),
+                  (commands() - before) / frames))
+
+    if root is None:
+        # counting stand-ins, the time is the python side of both backends
+        values = [CountingLabel() for _ in range(LABELS)]
+        gradients = [CountingLabel() for _ in range(LABELS)]
+        run('labels backend', values, gradients, CountingLabel(), lambda: CountingLabel.configures)
+        canvas, font = canvas_board.tk.Canvas, canvas_board.tkfont.Font
+        canvas_board.tk.Canvas, canvas_board.tkfont.Font = CountingBoardCanvas, CountingFont
+        value_font, small_font = CountingFont(), CountingFont()
+    else:
+        import tkinter as tk
+        import tkinter.font as tkfont
+        for widget in root.grid_slaves() + root.pack_slaves():
+            widget.destroy()
+        root.geometry('800x600')
+        # labels in grid frames, as GUI.init_labels
+        area = tk.Frame(root)
+        area.pack(expand=True, fill=tk.BOTH)
+        clock = tk.Label(area, text='', font=small_font)
+        clock.grid(row=0, column=0, columnspan=4)
+        values, gradients = [], []
+        for i in range(LABELS):
+            container = tk.Frame(area)
+            tk.Label(area, text='P{}'.format(i), font=value_font).grid(row=i + 1, column=0, columnspan=2, sticky=tk.E)
+            values.append(tk.Label(container, text='', font=value_font))
+            values[-1].grid(row=0, column=0, rowspan=2, sticky=tk.N + tk.S + tk.E)
+            gradients.append(tk.Label(container, text='      ', font=small_font))
+            gradients[-1].grid(row=0, column=1, sticky=tk.N + tk.S + tk.W)
+            tk.Label(container, text='/60s', font=small_font).grid(row=1, column=1, sticky=tk.N + tk.E + tk.W)
+            container.grid(row=i + 1, column=2, columnspan=2, sticky=tk.N + tk.S + tk.W)
+            area.rowconfigure(i + 1, weight=1)
+        for i in range(4):
+            area.columnconfigure(i, weight=1)
+        root.update()
+        configure = tk.Label.configure
+
+        def counted(self, cnf=None, **options):
+            CountingLabel.configures += 1
+            return configure(self, cnf, **options)
+        tk.Label.configure = counted
+        run('labels backend', values, gradients, clock, lambda: CountingLabel.configures)
+        tk.Label.configure = configure
+        area.destroy()
+        value_font, small_font = tkfont.Font(font=value_font), tkfont.Font(font=small_font)
+
+    # items of one canvas
+    status = canvas_board.Board(root, small_font, '#000000')
+    clock = status.text(status.row(1), 2, 'n', small_font, '#ffffff', y=0)
+    values, gradients = [], []
+    for i in range(LABELS):
+        row = status.row(1)
+        status.text(row, 2, 'e', value_font, '#ffffff', text='P{}'.format(i))
+        values.append(status.text(row, 2, 'w', value_font, '#ffffff'))
+        gradients.append(status.text(row, 2, 'sw', small_font, '#ffffff', text='      ', after=(values[-1],)))
+        status.text(row, 2, 'nw', small_font, '#ffffff', text='/60s', after=(values[-1],))
+    if root is None:
+        status.size = (800, 600)
+        status.layout()
+        run('canvas backend', values, gradients, clock, lambda: CountingBoardCanvas.calls)
+        canvas_board.tk.Canvas, canvas_board.tkfont.Font = canvas, font
+    else:
+        itemconfigure, coords = tk.Canvas.itemconfigure, tk.Canvas.coords
+
+        def counted_items(self, *args, **options):
+            CountingBoardCanvas.calls += 1
+            return itemconfigure(self, *args, **options)
+
+        def counted_coords(self, *args):
+            CountingBoardCanvas.calls += 1
+            return coords(self, *args)
+        tk.Canvas.itemconfigure, tk.Canvas.coords = counted_items, counted_coords
+        root.update()
+        run('canvas backend', values, gradients, clock, lambda: CountingBoardCanvas.calls)
+        tk.Canvas.itemconfigure, tk.Canvas.coords = itemconfigure, coords
+        status.canvas.destroy()
+
+
+if __name__ == '__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    root = open_display()
+    print('{} channels, {} Hz, {} s in {} columns, budget {} ms per frame'.format(
+        CHANNELS, RATE, SECONDS, WIDTH, 1000 * FRAME_BUDGET))
+    bench_sparklines(root, hours)
+    bench_labels(root, hours)
+    bench_resize(root, 10)
+    bench_board(root, hours)
+    if root is not None:
+        root.destroy()
@@ -0,0 +1,215 @@
+# Tk GUI in a separate process
+#
+# With CFG.GUI_SEPARATE_PROCESS the measurement process does not run tkinter at all (GUI is
+# imported only for a window in the same process). GUIProxy has the methods of
+# GUI.MainWindow that measure calls and forwards them as json lines to a child process
+# running the window. Calls never block: they go to a bounded queue and a sender thread
+# writes to the pipe. The child only shows the latest of the value updates, so if the
+# queue is full the oldest value update is dropped. Warnings, dewarnings and init_labels are
+# never dropped, a warning or dewarning only replaces the same one still waiting, which
+# keeps the queue bounded while the window hangs. If the GUI process crashes it is started
+# again. Logging goes on in both cases. Closing the window ends the program like before.
+#
+# python gui_process.py gui: run the window (started by GUIProxy)
+# python gui_process.py: acquisition jitter with a simulated GUI load in a thread vs a process
+
+import collections
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+# messages where only the latest one is shown
+LATEST = ('update_values', 'update_values_gradient', 'update_sparklines', 'update_helium')
+
+
+class GUIProxy:
+    def __init__(self, queue_size=32, restart_delay=5):
+        self.queue_size = queue_size
+        self.messages = collections.deque()     # (method, args) waiting for the sender thread
+        self.condition = threading.Condition()
+        self.restart_delay = restart_delay
+        self.process = None
+        self.labels = None              # arguments of init_labels, sent again to a restarted GUI
+        self.closed = threading.Event()
+        self.dropped = 0
+        self.restarts = 0
+        self.thread = threading.Thread(target=self.run, name='gui_proxy', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    # methods of GUI.MainWindow
+    def init_labels(self, labels, colors, sizes):
+        self.labels = (labels, colors, sizes)
+        self.send('init_labels', labels, colors, sizes)
+
+    def update_values(self, values, str_time):
+        self.send('update_values', values, str_time)
+
+    def update_values_gradient(self, values):
+        self.send('update_values_gradient', values)
+
+    def update_sparklines(self, columns):
+        self.send('update_sparklines', columns)
+
+    def update_helium(self, str_helium):
+        self.send('update_helium', str_helium)
+
+    def warning(self, key, text, text_short):
+        self.send('warning', key, text, text_short)
+
+    def dewarning(self, key):
+        self.send('dewarning', key)
+
+    def send(self, method, *args):
+        # never blocks, drops the oldest value update if the GUI does not keep up
+        message = (method, args)
+        with self.condition:
+            if method not in LATEST and message in self.messages:
+                self.messages.remove(message)
+            self.messages.append(message)
+            if len(self.messages) > self.queue_size:
+                for old in self.messages:
+                    if old[0] in LATEST:
+                        self.messages.remove(old)
+                        self.dropped += 1
+                        break
+            self.condition.notify()
+
+    def next(self, timeout):
+        # oldest waiting message, None if there was none within timeout
+        with self.condition:
+            if self.condition.wait_for(lambda: self.messages, timeout):
+                return self.messages.popleft()
+        return None
+
+    def spawn(self):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'gui'], stdin=subprocess.PIPE)
+
+    def write(self, message):
+        try:
+            self.process.stdin.write((json.dumps(message) + '\n').encode())
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            # GUI process is gone, noticed by run()
+            pass
+
+    def run(self):
+        # sender thread: forwards the messages, restarts the GUI process if it crashed
+        self.spawn()
+        while not self.closed.is_set():
+            message = self.next(1)
+            if self.process.poll() is not None:
+                if self.process.returncode == 0:
+                    # window was closed
+                    self.closed.set()
+                    break
+                print('GUI process exited with {}, restarting in {} s.'.format(self.process.returncode, self.restart_delay))
+                time.sleep(self.restart_delay)
+                self.restarts += 1
+                self.spawn()
+                if self.labels is not None:
+                    self.write(('init_labels', self.labels))
+                continue
+            if message is not None:
+                self.write(message)
+
+    def close(self):
+        # closes the window, like closing it by hand
+        self.send('quit')
+
+    def wait_closed(self, timeout=None):
+        # blocks until the window was closed
+        return self.closed.wait(timeout)
+
+
+def read_messages(stream, messages):
+    for line in stream:
+        try:
+            messages.put(json.loads(line.decode(), object_pairs_hook=collections.OrderedDict))
+        except ValueError:
+            pass
+    # measurement process is gone
+    messages.put(('quit', ()))
+
+
+def main(poll_ms=40):
+    # GUI process: window with the messages from stdin applied every poll_ms
+    import GUI
+    gui = GUI.initGUI()
+    messages = queue.Queue()
+    threading.Thread(target=read_messages, args=(sys.stdin.buffer, messages), daemon=True).start()
+
+    def poll():
+        latest = collections.OrderedDict()
+        while True:
+            try:
+                method, args = messages.get_nowait()
+            except queue.Empty:
+                break
+            if method == 'quit':
+                gui.endApp()
+                return
+            if method in LATEST:
+                latest[method] = args
+            else:
+                getattr(gui, method)(*args)
+        for method, args in latest.items():
+            getattr(gui, method)(*args)
+        gui.root.after(poll_ms, poll)
+
+    gui.root.after(poll_ms, poll)
+    gui.startApp()
+    # window closed, exit code 0 tells the measurement process, the reader thread still blocks on stdin
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def simulated_gui_load(duration):
+    # pure python work like reconfiguring all labels in GUI.resize, 30 ms every 50 ms
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        t_busy = time.time() + 0.03
+        while time.time() < t_busy:
+            sum(i * i for i in range(1000))
+        time.sleep(0.02)
+
+
+def acquisition_jitter(duration, period=0.08):
+    # deviation of the wakeups of a loop like main_loop_sensors from its grid
+    import numpy as np
+    lateness = []
+    t_next = time.time() + period
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        delay = t_next - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lateness.append(time.time() - t_next)
+        np.polyfit(np.arange(100), np.random.random(100), 1)
+        t_next += period
+    return 1000 * np.array(lateness)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['gui']:
+        main()
+
+    import multiprocessing
+    duration = 5
+    results = [('no GUI load', acquisition_jitter(duration))]
+    load = threading.Thread(target=simulated_gui_load, args=(duration,), daemon=True)
+    load.start()
+    results.append(('GUI in thread', acquisition_jitter(duration)))
+    load.join()
+    load = multiprocessing.Process(target=simulated_gui_load, args=(duration,), daemon=True)
+    load.start()
+    results.append(('GUI in process', acquisition_jitter(duration)))
+    load.join()
+    for name, lateness in results:
+        print('{:15s}: lateness mean {:6.2f} ms, p99 {:6.2f} ms, max {:6.2f} ms'.format(
+            name, lateness.mean(), sorted(lateness)[int(0.99 * len(lateness))], lateness.max()))
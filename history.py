@@ -0,0 +1,131 @@
+# history of all measured values as preallocated numpy columns
+#
+# Every channel keeps its values (float64), statuses (float64, they are the sentinel values of
+# conv_to_decode like 1e-12 for underrange) and timestamps (int64, ns since epoch) in ring
+# buffers of fixed size. Each sample is written twice, at i and i + capacity, so the latest n
+# samples are always one contiguous slice: windows are views without copies, an append is
+# O(1). The capacity follows from a memory budget for all channels.
+#
+# A view stays valid until the writer has appended capacity - n more samples, readers use it
+# right away or copy it.
+#
+# run this file directly for memory and throughput numbers
+
+import time
+
+import numpy as np
+
+BYTES_PER_SAMPLE = 2 * (8 + 8 + 8)      # value, status, timestamp, written twice
+
+
+class ChannelHistory:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = np.full(2 * capacity, np.nan)
+        self.status = np.zeros(2 * capacity)
+        self.times = np.zeros(2 * capacity, np.int64)
+        self.index = 0          # next position to write
+        self.count = 0          # number of samples written so far
+
+    def append(self, t, value, status):
+        # t in seconds since epoch like time.time()
+        i = self.index
+        j = i + self.capacity
+        t = int(t * 1e9)
+        self.values[i] = self.values[j] = value
+        self.status[i] = self.status[j] = status
+        self.times[i] = self.times[j] = t
+        self.index = (i + 1) % self.capacity
+        self.count += 1
+
+    def last(self, n=None):
+        # (times, values, status) of the latest n samples (all if None), oldest first, views
+        stored = min(self.count, self.capacity)
+        n = stored if n is None else min(n, stored)
+        end = self.index + self.capacity
+        return self.times[end - n:end], self.values[end - n:end], self.status[end - n:end]
+
+    def window(self, seconds, now=None):
+        # samples of the last 'seconds' seconds
+        times, values, status = self.last()
+        if now is None:
+            now = time.time()
+        start = np.searchsorted(times, int((now - seconds) * 1e9))
+        return times[start:], values[start:], status[start:]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.status.nbytes + self.times.nbytes
+
+
+class History:
+    def __init__(self, keys, memory=64 * 2 ** 20):
+        # memory: budget in bytes for all channels
+        keys = list(keys)
+        self.capacity = max(int(memory / len(keys) / BYTES_PER_SAMPLE), 1) if keys else 1
+        self.channels = {key: ChannelHistory(self.capacity) for key in keys}
+
+    def __getitem__(self, key):
+        return self.channels[key]
+
+    def append_records(self, records):
+        # records: key -> snapshot.Record
+        for key, record in records.items():
+            self.channels[key].append(record.time, record.value, record.status)
+
+    @property
+    def nbytes(self):
+        return sum(channel.nbytes for channel in self.channels.values())
+
+
+if __name__ == '__main__':
+    import collections
+    import copy
+    import tracemalloc
+
+    # channel dictionary like in the config
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    data = collections.OrderedDict()
+    for key in keys:
+        data[key] = {'unit': 'mbar', 'color': '#837C00', 'sensor_type': 'maxigauges', 'sensor': 1, 'status': 5,
+                     'value': -4000, 'limit_max': 1e-7, 'limit_max_warning': 'Cryo chamber pressure is high',
+                     'format': '.2e', 'format_gradient': '.0e', 'log_to_file': True, 'gui_size': 2, 'gui_order': 0,
+                     'used_sensor': None, 'poll_interval': 0.1, 'priority': 2}
+
+    # previous gradient history: one deep copy of all channels and a datetime per tick
+    import datetime as dt
+    rows = 1000
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    t = time.time()
+    deepcopies = [copy.deepcopy(data) for _ in range(rows)]
+    timestamps = [dt.datetime.now() for _ in range(rows)]
+    t_deepcopy = (time.time() - t) / rows
+    per_row = (tracemalloc.get_traced_memory()[0] - before) / rows
+    tracemalloc.stop()
+    print('deep copies: {:8.0f} bytes per tick of {} channels, {:7.2f} us per tick'.format(
+        per_row, len(keys), 1e6 * t_deepcopy))
+
+    history = History(keys)
+    rate = 10
+    print('columns:     {:8.0f} bytes per tick of {} channels, {} samples per channel in {:.0f} MB, {:.1f} h at {} Hz'.format(
+        BYTES_PER_SAMPLE * len(keys), len(keys), history.capacity, history.nbytes / 2 ** 20,
+        history.capacity / rate / 3600, rate))
+
+    # append throughput
+    channel = history['PSTM']
+    n = 200000
+    t = time.time()
+    now = t
+    for i in range(n):
+        channel.append(now + i * 0.1, 1e-9 * i, 0)
+    t_append = (time.time() - t) / n
+    print('append:      {:8.2f} us per sample ({:.0f} samples/s)'.format(1e6 * t_append, 1 / t_append))
+
+    # windows are views
+    t = time.time()
+    for _ in range(10000):
+        times, values, status = channel.window(30, now=now + n * 0.1)
+    t_window = (time.time() - t) / 10000
+    print('window:      {:8.2f} us for the last 30 s ({} samples), shares memory: {}'.format(
+        1e6 * t_window, len(values), np.shares_memory(values, channel.values)))
@@ -0,0 +1,301 @@
+# status over HTTP: the latest snapshot as JSON and a stream of Server-Sent Events
+#
+#   GET /snapshot   latest values of all channels as JSON
+#   GET /events     text/event-stream, an event with the same JSON for every update
+#   GET /metrics    counters and timings of the acquisition (see metrics.py)
+#
+# The JSON of a snapshot is made once per version, whoever asks first, and the same bytes are
+# sent to every client. For the event stream one thread waits for new snapshots (at most one
+# event every 'interval' seconds) and wakes the client threads, which all send the same
+# encoded event. A slow client skips to the newest event, nothing waits for a client, so the
+# number of viewers does not change what the acquisition threads do.
+#
+# The server has no authentication, it listens on CFG.HTTP_STATUS_HOST (by default only on
+# this computer) and is off unless CFG.HTTP_STATUS_PORT is set.
+#
+# With CFG.HEADLESS status-read.py runs without a window, NoGUI takes the calls of the GUI.
+#
+# run this file directly for a load test: lateness of an acquisition loop with and without
+# many clients
+
+import http.server
+import json
+import math
+import threading
+import time
+
+import metrics
+
+
+def channel_json(record, unit, fmt, decoding):
+    value = float(record.value)
+    if value in decoding:
+        text = decoding[value]
+    else:
+        text = '{0:{1}}'.format(value, fmt)
+        if record.unreliable is not False:
+            text += '*'
+    return {'value': value if math.isfinite(value) else None, 'text': text, 'unit': unit,
+            'status': record.status if isinstance(record.status, (int, float)) and math.isfinite(record.status) else None,
+            'unreliable': record.unreliable is not False, 'time': record.time}
+
+
+class SnapshotEncoder:
+    # JSON of the latest snapshot, made once per version
+    def __init__(self, snapshots, channels, decoding):
+        self.snapshots = snapshots
+        self.channels = channels    # key -> (unit, format)
+        self.decoding = decoding    # value -> text, like 'Off'
+        self.lock = threading.Lock()
+        self.version = None
+        self.data = b''
+        self.encoded = 0            # snapshots encoded
+
+    def latest(self):
+        # (version, JSON bytes)
+        latest = self.snapshots.latest()
+        with self.lock:
+            if latest.version != self.version:
+                self.data = json.dumps({
+                    'version': latest.version, 'time': latest.time,
+                    'channels': {key: channel_json(latest[key], unit, fmt, self.decoding)
+                                 for key, (unit, fmt) in self.channels.items()}}).encode()
+                self.version = latest.version
+                self.encoded += 1
+            return self.version, self.data
+
+
+class EventBroadcaster:
+    # one encoded event for all clients of the event stream
+    def __init__(self, snapshots, encoder, interval=0.5, keepalive=15):
+        self.snapshots = snapshots
+        self.encoder = encoder
+        self.interval = interval
+        self.keepalive = keepalive
+        self.condition = threading.Condition()
+        self.number = 0             # number of the current event
+        self.event = b''
+        self.clients = 0
+        self.running = True
+        threading.Thread(target=self.run, name='http-events', daemon=True).start()
+
+    def run(self):
+        version = -1
+        while self.running:
+            latest = self.snapshots.wait_next(version, timeout=self.keepalive)
+            if latest.version > version:
+                version, data = self.encoder.latest()
+                event = b'id: ' + str(version).encode() + b'\ndata: ' + data + b'\n\n'
+            else:
+                # comment, lets the clients find closed connections
+                event = b': keepalive\n\n'
+            with self.condition:
+                self.number += 1
+                self.event = event
+                self.condition.notify_all()
+            time.sleep(self.interval)
+
+    def next(self, number, timeout):
+        # (number, event) after number, (number, None) if there was none within timeout
+        with self.condition:
+            self.condition.wait_for(lambda: self.number > number or not self.running, timeout)
+            if self.number > number:
+                return self.number, self.event
+            return number, None
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    server_version = 'RPi-lab-status'
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/snapshot'):
+            version, data = self.server.encoder.latest()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(data)
+        elif path == '/events':
+            self.events()
+        elif path == '/metrics' and self.server.metrics is not None:
+            data = self.server.metrics.render()
+            self.send_response(200)
+            self.send_header('Content-Type', metrics.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_error(404)
+
+    def events(self):
+        broadcaster = self.server.broadcaster
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        # the current event first, the client does not wait for the next update
+        version, data = self.server.encoder.latest()
+        event = b'id: ' + str(version).encode() + b'\ndata: ' + data + b'\n\n'
+        number = broadcaster.number
+        with broadcaster.condition:
+            broadcaster.clients += 1
+        try:
+            while broadcaster.running:
+                self.wfile.write(event)
+                self.wfile.flush()
+                event = None
+                while event is None and broadcaster.running:
+                    number, event = broadcaster.next(number, broadcaster.keepalive)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            pass
+        finally:
+            with broadcaster.condition:
+                broadcaster.clients -= 1
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StatusServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, snapshots, channels, decoding, host='127.0.0.1', port=8080, interval=0.5, metrics=None):
+        super().__init__((host, port), Handler)
+        self.metrics = metrics      # metrics.Registry
+        self.encoder = SnapshotEncoder(snapshots, channels, decoding)
+        self.broadcaster = EventBroadcaster(snapshots, self.encoder, interval)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='http-status', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.broadcaster.stop()
+        self.shutdown()
+        self.server_close()
+
+
+class NoGUI:
+    # takes the calls of the GUI in headless mode, warnings are printed once until they go away
+    def __init__(self):
+        self.warnings = set()
+
+    def init_labels(self, labels, colors, sizes):
+        pass
+
+    def update_values(self, values, str_time):
+        pass
+
+    def update_values_gradient(self, values):
+        pass
+
+    def update_sparklines(self, columns):
+        pass
+
+    def update_helium(self, str_helium):
+        pass
+
+    def warning(self, key, text, text_short):
+        if key not in self.warnings:
+            self.warnings.add(key)
+            print(time.strftime('%b %d, %H:%M:%S'), text)
+
+    def dewarning(self, key):
+        self.warnings.discard(key)
+
+
+def load_clients(port, streams, pollers, duration, result):
+    # streams reading the events and pollers reading snapshots for duration seconds, puts the counts to result
+    import http.client
+
+    def stream(counts, i):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', '/events')
+        response = connection.getresponse()
+        while not stop.is_set():
+            line = response.fp.readline()
+            if not line:
+                break
+            if line.startswith(b'data: '):
+                json.loads(line[6:])
+                counts[i] += 1
+        connection.close()
+
+    def poll(counts, i):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        while not stop.is_set():
+            connection.request('GET', '/snapshot')
+            json.loads(connection.getresponse().read())
+            counts[i] += 1
+            time.sleep(0.05)
+        connection.close()
+
+    stop = threading.Event()
+    events = [0] * streams
+    polls = [0] * pollers
+    threads = [threading.Thread(target=stream, args=(events, i), daemon=True) for i in range(streams)]
+    threads += [threading.Thread(target=poll, args=(polls, i), daemon=True) for i in range(pollers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    result.put((events, polls))
+
+
+if __name__ == '__main__':
+    import sys
+
+    import numpy as np
+
+    import snapshot
+
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    duration = 5
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    channels = {key: ('mbar', '.2e') if key.startswith('P') else ('K', '.2f') for key in keys}
+    store = snapshot.SnapshotStore({key: snapshot.Record(0.0, 0, False, time.time()) for key in keys})
+    server = StatusServer(store, channels, {-3000: 'Off'}, '127.0.0.1', 0, interval=0.1).start()
+    port = server.server_address[1]
+
+    def acquisition(duration, period=0.08):
+        # lateness of a loop like main_loop_sensors, which publishes a snapshot every pass
+        lateness = []
+        t_next = time.time() + period
+        t_end = time.time() + duration
+        random = np.random.RandomState(1)
+        while time.time() < t_end:
+            delay = t_next - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(time.time() - t_next)
+            store.publish({key: snapshot.Record(float(random.rand()), 0, False, time.time()) for key in keys})
+            np.polyfit(np.arange(100), np.random.random(100), 1)
+            t_next += period
+        return 1000 * np.array(lateness)
+
+    results = [('no clients', acquisition(duration))]
+    # the clients in a process of their own, like viewers on other computers
+    import multiprocessing
+    counts = multiprocessing.Queue()
+    load = multiprocessing.Process(target=load_clients, args=(port, clients, 4, duration + 1, counts), daemon=True)
+    load.start()
+    time.sleep(1)
+    encoded = server.encoder.encoded
+    results.append(('{} streams, 4 pollers'.format(clients), acquisition(duration)))
+    encoded = server.encoder.encoded - encoded
+    events, polls = counts.get()
+    load.join()
+    for name, lateness in results:
+        print('{:22s}: lateness mean {:6.2f} ms, p99 {:6.2f} ms, max {:6.2f} ms'.format(
+            name, lateness.mean(), np.percentile(lateness, 99), lateness.max()))
+    print('{:22s}  {:.0f} events per stream (min {}), {} snapshot requests, {} snapshots encoded'.format(
+        '', np.mean(events), min(events), sum(polls), encoded))
+    server.stop()
@@ -0,0 +1,334 @@
+# time index of the tab separated logs
+#
+# Next to every log <name>.log there is <name>.log.idx with an entry (time [s since epoch],
+# byte offset of the row) for every 'stride'th row, 16 bytes each. A query looks up the last
+# entry before the start of the range and reads the log from there until the end of the
+# range, so it costs the rows returned (plus less than a stride), not the size of the archive.
+#
+# The log writer appends entries while it writes the rows (see logwriter.TSVSink). Rows behind
+# the last entry (logs written without index, a crash before the index was flushed) are
+# scanned from the last entry on. Queries save what they scanned for days which are over,
+# the index of today belongs to the writer. Entries behind the end of the log are dropped and
+# an index which does not match its log is built again from the start. Days compressed by
+# archive.py are read through their block index instead.
+#
+# run this file directly for a benchmark on a generated archive of several years
+
+import datetime as dt
+import os
+import re
+import struct
+import time
+
+import numpy as np
+
+import archive
+
+SUFFIX = '.idx'
+STRIDE = 64
+ENTRY = np.dtype([('time', '<i8'), ('offset', '<i8')])
+ENTRY_STRUCT = struct.Struct('<qq')
+
+FIELDS = ['%Y', '%m', '%d', '%H', '%M', '%S']
+
+
+def time_parser(date_fmt):
+    # function str -> seconds since epoch (local time) for the time column of the logs
+    directives = re.findall(r'%.', date_fmt)
+    if sorted(directives) != sorted(FIELDS):
+        return lambda text: time.mktime(time.strptime(text, date_fmt))
+    # numbers only, a regular expression is a few times faster than strptime
+    pattern = ''
+    for part in re.split(r'(%.)', date_fmt):
+        pattern += r'(\d{4})' if part == '%Y' else r'(\d\d?)' if part in FIELDS else re.escape(part)
+    regex = re.compile(pattern + '$')
+    year, month, day, hour, minute, second = [directives.index(field) for field in FIELDS]
+    hours = {}      # start of the hour -> seconds since epoch, mktime is slow as well
+
+    def parse(text):
+        match = regex.match(text)
+        if match is None:
+            raise ValueError('{!r} does not match {!r}'.format(text, date_fmt))
+        fields = match.groups()
+        key = fields[year], fields[month], fields[day], fields[hour]
+        start = hours.get(key)
+        if start is None:
+            if len(hours) > 10000:
+                hours.clear()
+            start = hours[key] = time.mktime(tuple(int(field) for field in key) + (0, 0, 0, 0, -1))
+        return start + 60 * int(fields[minute]) + int(fields[second])
+    return parse
+
+
+def row_time(line, parse):
+    # time of a row (bytes), ValueError for the header, comments and incomplete rows
+    if not line.endswith(b'\n'):
+        raise ValueError('incomplete row')
+    return parse(line[:line.index(b'\t')].decode())
+
+
+def scan(f, offset, end, parse, stride=STRIDE, rows=None):
+    # entries for the rows of the open log from offset to end
+    # rows: rows since the last entry before offset, None if there is none
+    # returns ([(time, offset)], rows since the last entry)
+    entries = []
+    f.seek(offset)
+    while offset < end:
+        line = f.readline()
+        if not line:
+            break
+        try:
+            t = row_time(line, parse)
+        except ValueError:
+            offset += len(line)
+            continue
+        if rows is None or rows >= stride:
+            entries.append((int(t), offset))
+            rows = 1
+        else:
+            rows += 1
+        offset += len(line)
+    return entries, rows
+
+
+def load(path, size):
+    # (entries, bytes in the index file) of the log at path, without entries behind size
+    try:
+        with open(path + SUFFIX, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return np.zeros(0, ENTRY), 0
+    entries = np.frombuffer(raw[:len(raw) // ENTRY.itemsize * ENTRY.itemsize], ENTRY)
+    return entries[:np.searchsorted(entries['offset'], size)], len(raw)
+
+
+def save(path, entries):
+    # whole index, replaced at once so readers see the old or the new one
+    temporary = path + SUFFIX + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(np.asarray(entries, ENTRY).tobytes())
+    os.replace(temporary, path + SUFFIX)
+
+
+def update(path, parse, stride=STRIDE, write=True):
+    # (entries, rows since the last entry) of a log, rows behind the last entry are indexed
+    # and, with write, the index file is updated
+    size = os.path.getsize(path)
+    entries, stored = load(path, size)
+    with open(path, 'rb') as f:
+        if len(entries):
+            # the row of the last entry is scanned again as check
+            last = tuple(int(value) for value in entries[-1])
+            new, rows = scan(f, last[1], size, parse, stride)
+            if new and new[0] == last:
+                new = new[1:]
+            else:
+                # log was replaced, the index belongs to another file
+                entries, stored = np.zeros(0, ENTRY), None
+                new, rows = scan(f, 0, size, parse, stride)
+        else:
+            new, rows = scan(f, 0, size, parse, stride)
+    new = np.array(new, ENTRY)
+    if write and stored != len(entries) * ENTRY.itemsize:
+        # cut off, replaced or half written
+        save(path, np.concatenate((entries, new)))
+    elif write and len(new):
+        with open(path + SUFFIX, 'ab') as f:
+            f.write(new.tobytes())
+    return np.concatenate((entries, new)), rows
+
+
+class IndexWriter:
+    # keeps the index of the log the writer appends to up to date
+    def __init__(self, date_fmt, stride=STRIDE):
+        self.parse = time_parser(date_fmt)
+        self.stride = stride
+        self.file = None
+        self.rows = None        # rows since the last entry
+        self.size = 0           # size of the log = offset of the next row
+
+    def open(self, path, size, created=False):
+        # log opened for appending at size, rows written before are indexed first
+        self.close()
+        if created and os.path.exists(path + SUFFIX):
+            os.remove(path + SUFFIX)
+        entries, self.rows = update(path, self.parse, self.stride)
+        self.file = open(path + SUFFIX, 'ab')
+        self.size = size
+
+    def add(self, t, length):
+        # row of length bytes appended to the log at time t
+        if self.rows is None or self.rows >= self.stride:
+            self.file.write(ENTRY_STRUCT.pack(int(t), self.size))
+            self.rows = 1
+        else:
+            self.rows += 1
+        self.size += length
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+
+def read_range(path, keys, start, end, parse, stride=STRIDE, write=False):
+    # (times [ns since epoch], rows of values) of channels in one log from start to end [s since
+    # epoch], nan for channels which are not in the log; reads compressed logs as well
+    try:
+        entries, rows = update(path, parse, stride, write)
+        with open(path, 'rb') as f:
+            header = f.readline()
+            i = np.searchsorted(entries['time'], start, 'right') - 1
+            f.seek(int(entries['offset'][i]) if i >= 0 else 0)
+            return parse_rows(header, f, keys, start, end, parse)
+    except FileNotFoundError:
+        # not there or just archived
+        pass
+    if os.path.isfile(path + archive.SUFFIX):
+        header, lines = archive.read_lines(path + archive.SUFFIX, start, end)
+        return parse_rows(header, lines, keys, start, end, parse)
+    return [], []
+
+
+def parse_rows(header, lines, keys, start, end, parse):
+    # times and values of the rows from start to end, lines (bytes) start before it
+    times = []
+    values = []
+    columns = [name.split('[')[0] for name in header.decode(errors='replace').rstrip('\r\n').split('\t')[1:]]
+    positions = [columns.index(key) + 1 if key in columns else None for key in keys]
+    if not any(positions):
+        return times, values
+    for line in lines:
+        try:
+            t = row_time(line, parse)
+        except ValueError:
+            continue
+        if t > end:
+            break
+        if t < start:
+            continue
+        fields = line.rstrip(b'\r\n').split(b'\t')
+        if len(fields) != len(columns) + 1:
+            # channels which are not logged leave empty fields
+            fields = fields[:1] + [field for field in fields[1:] if field.strip()]
+            if len(fields) != len(columns) + 1:
+                continue
+        row = []
+        for position in positions:
+            try:
+                row.append(float(fields[position]))
+            except (TypeError, ValueError):
+                row.append(float('nan'))
+        times.append(int(t) * 1000000000)
+        values.append(row)
+    return times, values
+
+
+def query(pattern, key, start, end, date_fmt, stride=STRIDE):
+    # (times [ns since epoch], values) of a channel from start to end [s since epoch] as numpy
+    # arrays, over the daily logs of pattern (strftime pattern of the path)
+    times, values = query_columns(pattern, [key], start, end, date_fmt, stride)
+    return times, values[:, 0]
+
+
+def query_columns(pattern, keys, start, end, date_fmt, stride=STRIDE):
+    # the same for several channels, values has a column per channel
+    parse = time_parser(date_fmt)
+    today = dt.date.today()
+    times = []
+    values = []
+    day = dt.datetime.fromtimestamp(start).date()
+    while day <= dt.datetime.fromtimestamp(end).date():
+        t, v = read_range(day.strftime(pattern), keys, start, end, parse, stride, write=day < today)
+        times += t
+        values += v
+        day += dt.timedelta(days=1)
+    return np.array(times, np.int64), np.array(values, np.float64).reshape(len(times), len(keys))
+
+
+if __name__ == '__main__':
+    # python logindex.py [years] [seconds between rows]
+    import shutil
+    import sys
+    import tempfile
+
+    years = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    date_fmt = '%Y-%m-%d_%H:%M:%S'
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    directory = tempfile.mkdtemp()
+    pattern = os.path.join(directory, '%Y', 'pressure-LT-%Y-%m-%d.log')
+
+    # archive of daily logs up to yesterday, a row of 8 channels every step seconds
+    days = int(years * 365)
+    first = dt.date.today() - dt.timedelta(days=days)
+    t = time.time()
+    size = 0
+    for n in range(days):
+        day = first + dt.timedelta(days=n)
+        path = day.strftime(pattern)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        t0 = time.mktime(day.timetuple())
+        rows = ['Time\t' + '\t'.join('{}[mbar]'.format(key) for key in keys) + '\n']
+        for i in range(0, 86400, step):
+            value = 1e-9 * (1 + (n + i / 86400) % 1)
+            rows.append(time.strftime(date_fmt, time.localtime(t0 + i)) + ('\t{: .2e}'.format(value)) * len(keys) + '\n')
+        with open(path, 'w') as f:
+            f.write(''.join(rows))
+        size += os.path.getsize(path)
+    print('archive: {} days, {:.0f} MB, {} rows per day, generated in {:.1f} s'.format(
+        days, size / 2 ** 20, 86400 // step, time.time() - t))
+
+    def full_scan(key, start, end):
+        # without index: parse every row of the days of the range
+        parse = time_parser(date_fmt)
+        times = []
+        values = []
+        day = dt.datetime.fromtimestamp(start).date()
+        while day <= dt.datetime.fromtimestamp(end).date():
+            with open(day.strftime(pattern), 'rb') as f:
+                column = f.readline().decode().split('\t').index(key + '[mbar]')
+                for line in f:
+                    t = parse(line[:line.index(b'\t')].decode())
+                    if start <= t <= end:
+                        times.append(int(t) * 1000000000)
+                        values.append(float(line.split(b'\t')[column]))
+            day += dt.timedelta(days=1)
+        return np.array(times, np.int64), np.array(values)
+
+    # ranges at random places of the archive, the first query of a day builds its index
+    t_archive = time.mktime(first.timetuple())
+    random = np.random.RandomState(1)
+    for length in [600, 3600, 86400, 7 * 86400]:
+        starts = t_archive + random.randint(0, days * 86400 - length, 10)
+        results = {}
+        timings = {}
+        for name, function in [('scan', full_scan),
+                               ('index (first)', lambda *args: query(pattern, *args, date_fmt=date_fmt)),
+                               ('index', lambda *args: query(pattern, *args, date_fmt=date_fmt))]:
+            t = time.time()
+            results[name] = [function(keys[2], start, start + length) for start in starts]
+            timings[name] = (time.time() - t) / len(starts)
+        for (a_times, a_values), (b_times, b_values) in zip(results['scan'], results['index']):
+            assert np.array_equal(a_times, b_times) and np.array_equal(a_values, b_values)
+        print('range {:7d} s ({:5d} rows): full scan {:8.2f} ms, first query {:8.2f} ms, indexed {:7.2f} ms'.format(
+            length, len(results['index'][0][0]), 1000 * timings['scan'], 1000 * timings['index (first)'],
+            1000 * timings['index']))
+
+    # the cost does not grow with the archive
+    for part in [days // 8, days // 2, days]:
+        starts = t_archive + (days - part) * 86400 + random.randint(0, part * 86400 - 3600, 20)
+        for start in starts:
+            query(pattern, keys[0], start, start + 3600, date_fmt)
+        t = time.time()
+        for start in starts:
+            query(pattern, keys[0], start, start + 3600, date_fmt)
+        print('1 h ranges in the last {:4d} days: {:.2f} ms'.format(part, 1000 * (time.time() - t) / len(starts)))
+    shutil.rmtree(directory)
@@ -0,0 +1,310 @@
+# log writer thread
+#
+# save_to_log only puts (time, snapshot) into a bounded queue, if the queue is full (slow or
+# full disk) the row is dropped and counted instead of blocking. The writer thread keeps
+# the file of the day open and writes the rows into its buffer. The buffer is flushed when
+# 'flush_rows' rows are pending or the oldest pending row is 'flush_interval' seconds old,
+# so the SD card gets a few larger writes instead of an open, append and close every row.
+# Files are switched at local midnight, computed once per day instead of a stat per row.
+#
+# What a file looks like is up to a sink: path(t), header(), encode(t, snapshot) and
+# recover(f, size). recover() returns the size of the complete part of an existing file,
+# anything behind it (e.g. a half written row after a crash) is cut off before appending. If
+# it returns None the file cannot be continued (e.g. other channels) and is renamed. A sink
+# can have an index (logindex.IndexWriter), it gets the rows as they are written.
+#
+# run this file directly to compare the write calls with one open per row
+
+import datetime as dt
+import os
+import queue
+import threading
+import time
+
+import logindex
+
+BUFFER_SIZE = 64 * 1024
+
+
+class TSVSink:
+    # tab separated text logs like before, with a time index every index_stride rows
+    def __init__(self, pattern, data, date_fmt, index_stride=None):
+        self.pattern = pattern      # strftime pattern of the file path
+        self.data = data            # channel configuration
+        self.date_fmt = date_fmt
+        self.index = logindex.IndexWriter(date_fmt, index_stride) if index_stride else None
+
+    def path(self, t):
+        return time.strftime(self.pattern, time.localtime(t))
+
+    def header(self):
+        header = 'Time\t'
+        for key in self.data:
+            if self.data[key]['log_to_file']:
+                header += '{0}[{1}]\t'.format(key, self.data[key]['unit'])
+        return (header[:-1] + '\n').encode()
+
+    def encode(self, t, latest):
+        formattedData = [''] * len(self.data)
+        for n, key in enumerate(self.data):
+            if not self.data[key]['log_to_file']:
+                continue
+            value = latest[key].value
+            if isinstance(value, str):
+                formattedData[n] = '%s' % value
+            else:
+                formattedData[n] = '{0: {1}}'.format(float(value), self.data[key]['format'])
+        return ("%s\t" % time.strftime(self.date_fmt, time.localtime(t)) + "\t".join(formattedData) + "\n").encode()
+
+    def recover(self, f, size):
+        # everything up to the last line break
+        position = size
+        while position > 0:
+            chunk = min(4096, position)
+            position -= chunk
+            f.seek(position)
+            end = f.read(chunk).rfind(b'\n')
+            if end >= 0:
+                return position + end + 1
+        return 0
+
+
+class LogWriter:
+    def __init__(self, sinks, queue_size=1000, flush_interval=30, flush_rows=64, fsync=False, retry=60, timing=None):
+        self.sinks = sinks
+        self.indexes = [getattr(sink, 'index', None) for sink in sinks]
+        self.queue = queue.Queue(queue_size)
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.fsync = fsync          # also wait for the card after a flush
+        self.retry = retry          # seconds to wait before opening the files again after an error
+        self.timing = timing        # timing(seconds, 'write' or 'flush') after every row and flush
+        self.files = [None] * len(sinks)
+        self.day_end = 0            # time of the next midnight
+        self.pending = 0            # rows written to the buffers but not flushed
+        self.flush_time = None      # time the pending rows have to be flushed
+        self.error_time = None
+        self.rows = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = None
+
+    def put(self, t, latest):
+        # never blocks, drops the row if the writer does not keep up
+        try:
+            self.queue.put_nowait((t, latest))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='log_writer', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        # write and flush everything queued, then close the files
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.flush_time is not None:
+                timeout = max(self.flush_time - time.time(), 0)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+            if item is None:
+                break
+            self.write(*item)
+        self.flush()
+        self.close()
+
+    def write(self, t, latest):
+        if t >= self.day_end or None in self.files:
+            if not self.rotate(t):
+                self.dropped += 1
+                return
+        start = time.perf_counter()
+        try:
+            for sink, f, index in zip(self.sinks, self.files, self.indexes):
+                row = sink.encode(t, latest)
+                f.write(row)
+                if index is not None:
+                    index.add(t, len(row))
+        except OSError as e:
+            self.error(e)
+            return
+        if self.timing is not None:
+            self.timing(time.perf_counter() - start, 'write')
+        self.rows += 1
+        self.pending += 1
+        if self.flush_time is None:
+            self.flush_time = time.time() + self.flush_interval
+        if self.pending >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            start = time.perf_counter()
+            try:
+                for f, index in zip(self.files, self.indexes):
+                    if f is not None:
+                        f.flush()
+                        if self.fsync:
+                            os.fsync(f.fileno())
+                        if index is not None:
+                            # after the log, entries never point behind the written rows
+                            index.flush()
+            except OSError as e:
+                self.error(e)
+            if self.timing is not None:
+                self.timing(time.perf_counter() - start, 'flush')
+        self.pending = 0
+        self.flush_time = None
+
+    def rotate(self, t):
+        # files of the day of t, returns False if they cannot be opened
+        if self.error_time is not None and time.time() - self.error_time < self.retry:
+            return False
+        self.flush()
+        self.close()
+        try:
+            self.files = [self.open(sink, sink.path(t)) for sink in self.sinks]
+        except OSError as e:
+            self.error(e)
+            return False
+        self.error_time = None
+        day = dt.datetime.fromtimestamp(t).date() + dt.timedelta(days=1)
+        self.day_end = time.mktime(day.timetuple())
+        return True
+
+    def open(self, sink, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        if size:
+            with open(path, 'r+b') as f:
+                valid = sink.recover(f, size)
+                if valid is not None and valid < size:
+                    print('Log: cutting off {} bytes of an incomplete row in {}'.format(size - valid, path))
+                    f.truncate(valid)
+            if valid is None:
+                n = 1
+                while os.path.exists('{}.{}'.format(path, n)):
+                    n += 1
+                print('Log: {} has another layout, renamed to {}.{}'.format(path, path, n))
+                os.rename(path, '{}.{}'.format(path, n))
+                valid = 0
+            size = valid
+        f = open(path, 'ab', buffering=BUFFER_SIZE)
+        if not size:
+            f.write(sink.header())
+        index = getattr(sink, 'index', None)
+        if index is not None:
+            index.open(path, size or len(sink.header()), created=not size)
+        return f
+
+    def close(self):
+        for f, index in zip(self.files, self.indexes):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+            if index is not None:
+                index.close()
+        self.files = [None] * len(self.sinks)
+
+    def error(self, e):
+        # rows are dropped until the files could be opened again
+        self.errors += 1
+        if self.error_time is None:
+            print('Log: {}, retrying every {} s'.format(e, self.retry))
+        self.error_time = time.time()
+        self.pending = 0
+        self.flush_time = None
+        self.close()
+
+
+if __name__ == '__main__':
+    # one row every 2 s for a day of 8 channels, compared with open, append and close for every row
+    import builtins
+    import collections
+    import shutil
+    import tempfile
+
+    Record = collections.namedtuple('Record', ['value', 'status', 'unreliable', 'time'])
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    data = collections.OrderedDict((key, {'unit': 'mbar', 'format': '.2e', 'log_to_file': True}) for key in keys)
+    latest = {key: Record(1.23e-9, 0, False, 0) for key in keys}
+    rows = 43200
+    t_start = time.mktime(dt.date.today().timetuple())
+
+    def io_counters():
+        counters = {}
+        try:
+            with open('/proc/self/io') as f:
+                for line in f:
+                    name, value = line.split(':')
+                    counters[name] = int(value)
+        except OSError:
+            pass
+        return counters
+
+    opens = [0]
+    builtin_open = builtins.open
+
+    def counting_open(*args, **kwargs):
+        opens[0] += 1
+        return builtin_open(*args, **kwargs)
+
+    directory = tempfile.mkdtemp()
+    pattern = os.path.join(directory, '%Y', 'pressure-LT-%Y-%m-%d.log')
+    sink = TSVSink(pattern, data, '%Y-%m-%d_%H:%M:%S')
+
+    def write_per_row():
+        stats = 0
+        for i in range(rows):
+            t = t_start + 2 * i
+            name = sink.path(t)
+            stats += 1
+            if not os.path.isfile(name):
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+                with open(name, 'a') as logfile:
+                    logfile.write(sink.header().decode())
+            with open(name, 'a') as logfile:
+                logfile.write(sink.encode(t, latest).decode())
+        return stats
+
+    def write_buffered():
+        writer = LogWriter([sink])
+        writer.start()
+        for i in range(rows):
+            while not writer.put(t_start + 2 * i, latest):
+                time.sleep(0.001)
+        writer.stop()
+        return 0
+
+    for name, function in [('open per row', write_per_row), ('writer thread', write_buffered)]:
+        shutil.rmtree(directory)
+        os.makedirs(directory)
+        opens[0] = 0
+        before = io_counters()
+        builtins.open = counting_open
+        t = time.time()
+        stats = function()
+        t = time.time() - t
+        builtins.open = builtin_open
+        after = io_counters()
+        print('{:13s}: {:6d} write calls, {:6d} opens, {:6d} stats, {:6.2f} s for {} rows'.format(
+            name, after.get('syscw', 0) - before.get('syscw', 0), opens[0], stats, t, rows))
+    shutil.rmtree(directory)
@@ -0,0 +1,239 @@
+# Continuous output mode for the Pfeiffer MaxiGauge (TPG 256 A)
+#
+# With 'COM,<interval>' the controller sends one line with status and pressure of all
+# six gauges at a fixed rate, so there is no PR<n>/ENQ round trip per channel anymore.
+# A line looks like 'x,x.xxxxEsx,x,x.xxxxEsx,...' followed by <CR><LF>.
+#
+# run this file directly to compare polling and streaming against a fake controller on a pty,
+# python -m pytest test_maxigauge.py for the tests on it
+
+import os
+import random
+import threading
+import time
+
+ACK = b'\x06'
+NAK = b'\x15'
+ENQ = b'\x05'
+ETX = b'\x03'
+
+NUM_CHANNELS = 6
+
+# output intervals of the continuous mode
+INTERVAL_100MS = 0
+INTERVAL_1S = 1
+INTERVAL_1MIN = 2
+INTERVAL_SECONDS = {INTERVAL_100MS: 0.1, INTERVAL_1S: 1, INTERVAL_1MIN: 60}
+
+
+def parse_frame(line):
+    # convert one line of continuous output to a list of (status, pressure) for channels 1..6
+    # returns None for everything that is not a complete frame (acknowledges, noise, partial lines)
+    if isinstance(line, bytes):
+        line = line.decode('ascii', errors='ignore')
+    fields = line.strip().split(',')
+    if len(fields) < 2 or len(fields) % 2:
+        return None
+    frame = []
+    try:
+        for i in range(0, len(fields), 2):
+            frame.append((int(fields[i]), float(fields[i + 1])))
+    except ValueError:
+        return None
+    return frame
+
+
+class MaxigaugeStream:
+    def __init__(self, ser, interval=INTERVAL_100MS, timeout=1.0):
+        self.ser = ser
+        self.interval = interval
+        self.timeout = timeout      # frames older than this are considered lost
+        self.frames = {}            # channel -> (status, pressure, time of arrival)
+        self.latency = {}           # channel -> time between the last two updates
+        self.frame_count = 0
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def start(self, threaded=True):
+        # switch controller to continuous mode, returns False if the controller does not acknowledge
+        # with threaded=False the caller has to pass the received lines to feed()
+        self.ser.reset_input_buffer()
+        self.ser.write('COM,{}\r\n'.format(self.interval).encode('ascii'))
+        answer = self.ser.readline()
+        if not answer.startswith(ACK):
+            return False
+        self.ser.write(ENQ)     # output starts with the enquiry
+        self.running = True
+        if threaded:
+            self.thread = threading.Thread(target=self.run, name='maxigauge_stream', daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self):
+        # any input ends the continuous mode
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        try:
+            self.ser.write(ETX)
+        except Exception:
+            pass
+
+    def run(self):
+        while self.running:
+            try:
+                line = self.ser.readline()
+            except Exception:
+                time.sleep(self.timeout)
+                continue
+            self.feed(line)
+
+    def feed(self, line):
+        # parse one line and store the values of all channels in it
+        frame = parse_frame(line)
+        if frame is None:
+            return False
+        now = time.time()
+        with self.condition:
+            for channel, (status, pressure) in enumerate(frame, 1):
+                if channel in self.frames:
+                    self.latency[channel] = now - self.frames[channel][2]
+                self.frames[channel] = (status, pressure, now)
+            self.frame_count += 1
+            self.condition.notify_all()
+        return True
+
+    def wait_frame(self, timeout=None):
+        # block until the next frame arrived, returns False on timeout
+        if timeout is None:
+            timeout = self.timeout
+        with self.condition:
+            count = self.frame_count
+            return self.condition.wait_for(lambda: self.frame_count != count, timeout)
+
+    def read(self, channel):
+        # latest (status, pressure) of a channel, None if there is no recent frame
+        with self.condition:
+            frame = self.frames.get(channel)
+        if frame is None or time.time() - frame[2] > self.timeout:
+            return None
+        return frame[0], frame[1]
+
+
+class FakeController(threading.Thread):
+    # answers PR<n> / ENQ and COM,<n> like a TPG 256 A with a serial delay per byte
+    def __init__(self, fd, byte_time=1.0 / 960):
+        threading.Thread.__init__(self, daemon=True)
+        self.fd = fd
+        self.byte_time = byte_time      # 9600 baud, 10 bits per byte
+        self.continuous = None
+        self.continuous_requested = None
+        self.pending = None
+
+    def send(self, data):
+        time.sleep(len(data) * self.byte_time)
+        os.write(self.fd, data)
+
+    def value(self, channel):
+        return '0,{:.4E}'.format(1e-9 * channel * (1 + 0.01 * random.random()))
+
+    def run(self):
+        buffer = b''
+        t_next = 0
+        while True:
+            if self.continuous is not None:
+                line = ','.join(self.value(c) for c in range(1, NUM_CHANNELS + 1))
+                self.send(line.encode('ascii') + b'\r\n')
+                t_next = max(t_next + INTERVAL_SECONDS[self.continuous], time.time())
+                time.sleep(max(0, t_next - time.time()))
+                try:
+                    buffer += os.read(self.fd, 64)
+                except BlockingIOError:
+                    pass
+                if ETX in buffer:
+                    # back to answering commands
+                    self.continuous = None
+                    buffer = b''
+                    os.set_blocking(self.fd, True)
+                continue
+            buffer += os.read(self.fd, 64)
+            while buffer:
+                if buffer.startswith(ENQ):
+                    buffer = buffer[1:]
+                    if self.pending is not None:
+                        self.send(self.value(self.pending).encode('ascii') + b'\r\n')
+                    if self.continuous_requested is not None:
+                        self.continuous = self.continuous_requested
+                        self.continuous_requested = None
+                        os.set_blocking(self.fd, False)
+                    continue
+                if b'\r\n' not in buffer:
+                    break
+                command, buffer = buffer.split(b'\r\n', 1)
+                self.continuous_requested = None
+                if command.startswith(b'PR'):
+                    self.pending = int(command[2:])
+                elif command.startswith(b'COM'):
+                    self.pending = None
+                    self.continuous_requested = int(command.split(b',')[1])
+                self.send(ACK + b'\r\n')
+
+
+def open_fake():
+    # serial port to a FakeController on a pty
+    import pty
+    import tty
+    import serial
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    FakeController(master).start()
+    return serial.Serial(os.ttyname(slave), baudrate=9600, timeout=0.5)
+
+
+if __name__ == '__main__':
+    # compare per-channel update latency of PR/ENQ polling and continuous output on a fake controller
+    channels = [1, 2, 3]
+    duration = 3
+
+    # polled like measure.read_maxigauge: PR<n>, sleep, ENQ, sleep, read two lines
+    ser = open_fake()
+    last = {}
+    latencies = {c: [] for c in channels}
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        for c in channels:
+            ser.write('PR{}\r\n'.format(c).encode('ascii'))
+            time.sleep(0.05)
+            ser.write(ENQ)
+            time.sleep(0.05)
+            ser.readline()
+            ser.readline()
+            now = time.time()
+            if c in last:
+                latencies[c].append(now - last[c])
+            last[c] = now
+    ser.close()
+    print('polling:')
+    for c in channels:
+        print('  channel {}: {:6.1f} ms between updates'.format(c, 1000 * sum(latencies[c]) / len(latencies[c])))
+
+    # continuous output
+    ser = open_fake()
+    stream = MaxigaugeStream(ser, INTERVAL_100MS)
+    if not stream.start():
+        raise SystemExit('controller did not acknowledge continuous mode')
+    latencies = {c: [] for c in channels}
+    t_end = time.time() + duration
+    while time.time() < t_end:
+        if stream.wait_frame():
+            for c in channels:
+                if c in stream.latency:
+                    latencies[c].append(stream.latency[c])
+    stream.stop()
+    ser.close()
+    print('continuous output:')
+    for c in channels:
+        print('  channel {}: {:6.1f} ms between updates'.format(c, 1000 * sum(latencies[c]) / len(latencies[c])))
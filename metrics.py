@@ -0,0 +1,237 @@
+# counters and timings of the acquisition in the OpenMetrics text format (GET /metrics)
+#
+# Counters and histograms are updated by the acquisition threads, the text is made when a
+# scraper asks for it. Every series (metric with one set of label values) keeps its lines and
+# makes them again only if it changed since the last scrape, the whole text is kept as long
+# as nothing changed. The values and statuses of the channels are made once per snapshot
+# version. A scrape costs the series which changed, not all of them.
+#
+# run this file directly for scrape times with and without the caches
+
+import bisect
+import itertools
+import math
+import threading
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+PERIOD_BUCKETS = (0.05, 0.075, 0.08, 0.085, 0.09, 0.1, 0.15, 0.2, 0.5, 1, 2, 5)
+
+
+def number(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in zip(names, values)) + '}'
+
+
+class Series:
+    # one set of label values of a family, with the start of its lines made once
+    __slots__ = ('changes', 'rendered', 'text', 'state', 'prefixes')
+
+    def __init__(self, state, prefixes):
+        self.changes = 0
+        self.rendered = -1          # changes when the text was made
+        self.text = ''
+        self.state = state
+        self.prefixes = prefixes
+
+
+class Family:
+    # metric with all its series, kind: 'counter' or 'histogram'
+    def __init__(self, registry, name, help, kind, labels, buckets=None):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.lock = threading.Lock()
+        self.series = {}            # label values -> Series
+        self.head = '# TYPE {0} {1}\n# HELP {0} {2}\n'.format(name, kind, help)
+
+    def get(self, values):
+        series = self.series.get(values)
+        if series is None:
+            with self.lock:
+                series = self.series.get(values)
+                if series is None:
+                    series = self.series[values] = self.new(values)
+        return series
+
+    def new(self, values):
+        labels = label_text(self.labels, values)
+        if self.kind == 'counter':
+            return Series([0], ['{}_total{} '.format(self.name, labels)])
+        prefixes = ['{}_bucket{} '.format(self.name, label_text(self.labels + ('le',), values + (number(float(bound)),)))
+                    for bound in self.buckets + (math.inf,)]
+        prefixes += ['{}_count{} '.format(self.name, labels), '{}_sum{} '.format(self.name, labels)]
+        # counts per bucket (the last: above all buckets), sum
+        return Series([[0] * (len(self.buckets) + 1), 0.0], prefixes)
+
+    def inc(self, *values, amount=1):
+        series = self.get(values)
+        with self.lock:
+            series.state[0] += amount
+            series.changes += 1
+        self.registry.changes += 1
+
+    def observe(self, seconds, *values):
+        series = self.get(values)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series.state[0][i] += 1
+            series.state[1] += seconds
+            series.changes += 1
+        self.registry.changes += 1
+
+    def render(self):
+        parts = [self.head]
+        for series in list(self.series.values()):
+            if series.rendered != series.changes:
+                with self.lock:
+                    if self.kind == 'counter':
+                        numbers = [str(series.state[0])]
+                    else:
+                        counts = list(itertools.accumulate(series.state[0]))
+                        numbers = [str(n) for n in counts] + [str(counts[-1]), number(series.state[1])]
+                    series.rendered = series.changes
+                series.text = ''.join(prefix + n + '\n' for prefix, n in zip(series.prefixes, numbers))
+                self.registry.rendered += 1
+            parts.append(series.text)
+        return ''.join(parts)
+
+
+class ChannelFamilies:
+    # value and status of every channel of the latest snapshot
+    def __init__(self, registry, name, snapshots, keys):
+        self.registry = registry
+        self.name = name
+        self.snapshots = snapshots
+        self.keys = list(keys)
+        self.labels = {key: label_text(('channel',), (key,)) for key in self.keys}
+        self.version = None
+        self.text = ''
+
+    def render(self):
+        latest = self.snapshots.latest()
+        if latest.version != self.version:
+            values = ['# TYPE {0}_value gauge\n# HELP {0}_value Last measured value of the channel.\n'.format(self.name)]
+            statuses = ['# TYPE {0}_status gauge\n# HELP {0}_status Status of the last reading, 0 is ok.\n'.format(self.name)]
+            for key in self.keys:
+                record = latest[key]
+                values.append('{}_value{} {}\n'.format(self.name, self.labels[key], number(float(record.value))))
+                statuses.append('{}_status{} {}\n'.format(self.name, self.labels[key], number(record.status)))
+            self.text = ''.join(values + statuses)
+            self.version = latest.version
+            self.registry.rendered += len(self.keys)
+        return self.text
+
+
+class Registry:
+    def __init__(self, prefix='lab_status'):
+        self.prefix = prefix
+        self.families = []
+        self.lock = threading.Lock()    # one scrape at a time
+        self.changes = 0            # updates of all series, the text is kept while it does not change
+        self.text = None
+        self.text_changes = None
+        self.version = None
+        self.rendered = 0           # series rendered, for the benchmark
+
+    def counter(self, name, help, labels=()):
+        family = Family(self, self.prefix + '_' + name, help, 'counter', labels)
+        self.families.append(family)
+        return family
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        family = Family(self, self.prefix + '_' + name, help, 'histogram', labels, buckets)
+        self.families.append(family)
+        return family
+
+    def channels(self, snapshots, keys):
+        family = ChannelFamilies(self, self.prefix + '_channel', snapshots, keys)
+        self.families.append(family)
+        return family
+
+    def render(self):
+        # exposition text as bytes
+        with self.lock:
+            changes = self.changes
+            versions = [family.snapshots.latest().version for family in self.families if isinstance(family, ChannelFamilies)]
+            if self.text is None or changes != self.text_changes or versions != self.version:
+                self.text = (''.join(family.render() for family in self.families) + '# EOF\n').encode()
+                self.text_changes = changes
+                self.version = versions
+            return self.text
+
+
+if __name__ == '__main__':
+    import time
+
+    import snapshot
+
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB', 'LHE', 'IP1', 'IP2', 'IP3']
+    types = ['maxigauges', 'mvc_prep', 'mvc_stm', 'ser_ion_prep', 'ADC_diods', 'ADC_resistor', 'SPI0', 'SPI1']
+    functions = ['read_maxigauge', 'read_mvcgauge', 'read_ionpump', 'read_analog']
+    store = snapshot.SnapshotStore({key: snapshot.Record(1e-9, 0, False, time.time()) for key in keys})
+    registry = Registry()
+    registry.channels(store, keys)
+    reads = registry.counter('reads', 'Channel reads.', ['sensor_type'])
+    latency = registry.histogram('read_seconds', 'Duration of a channel read.', ['function'])
+    log = registry.histogram('log_seconds', 'Duration of writing a row and of flushing the logs.', ['operation'])
+    period = registry.histogram('main_loop_period_seconds', 'Time between the passes of the main loop.', [], PERIOD_BUCKETS)
+
+    def acquisition(passes):
+        # one pass of the main loop: a read of every type, a snapshot, a log row
+        for i in range(passes):
+            for t, f in zip(types, functions * 2):
+                reads.inc(t)
+                latency.observe(0.003, f)
+            store.publish({keys[i % len(keys)]: snapshot.Record(1e-9 * i, 0, False, time.time())})
+            log.observe(0.0002, 'write')
+            period.observe(0.08)
+
+    def uncached():
+        # every series again, like a registry without caches
+        for family in registry.families:
+            if isinstance(family, ChannelFamilies):
+                family.version = None
+            else:
+                for series in family.series.values():
+                    series.rendered = -1
+        registry.text = None
+        return registry.render()
+
+    acquisition(1)
+    text = registry.render()
+    for line in text.decode().splitlines()[:12]:
+        print(line)
+    print('...')
+    n = 2000
+    one_read = lambda: reads.inc('maxigauges')
+    for name, update, scrape in [('everything again', lambda: acquisition(1), uncached),
+                                 ('after a pass', lambda: acquisition(1), registry.render),
+                                 ('after one read', one_read, registry.render),
+                                 ('no change', lambda: None, registry.render)]:
+        registry.rendered = 0
+        elapsed = 0.0
+        for _ in range(n):
+            update()
+            t = time.perf_counter()
+            scrape()
+            elapsed += time.perf_counter() - t
+        print('{:18s}: {:7.1f} us per scrape, {:5.1f} series rendered, {} bytes'.format(
+            name, 1e6 * elapsed / n, registry.rendered / n, len(registry.text)))
+    t = time.perf_counter()
+    acquisition(n)
+    print('updates of one pass: {:.1f} us'.format(1e6 * (time.perf_counter() - t) / n))
@@ -0,0 +1,128 @@
+# render loop of the Tk GUI
+#
+# The update methods of GUI.MainWindow do not touch the widgets, they leave the new state with
+# the Renderer: set(widget, option, value) for options like the text of a label, call(key,
+# function, *args) for drawing (e.g. a sparkline). Only the latest value of every option and
+# the latest call of every key is kept. At most fps times per second a frame applies them in
+# the Tk thread: options which equal what is shown are not set again, so a label whose text
+# did not change causes no geometry or redraw work.
+#
+# set and call can be used from any thread and only take a lock: the measurement threads never
+# call Tk and never wait for drawing, and a frame does at most one configure per option and
+# one call per key however many updates came in.
+#
+# The next frame is scheduled before the work of a frame. A configure or call which raises
+# (e.g. a destroyed widget) is printed and skipped, the other ones and the next frames are
+# not affected.
+#
+# After every frame the hooks get FrameStats: duration of the frame, options set and left
+# alone, calls, and the frames which were skipped because the previous one or something else
+# in the Tk thread took too long.
+
+import collections
+import threading
+import time
+
+FrameStats = collections.namedtuple('FrameStats', ['time', 'duration', 'changed', 'unchanged', 'calls', 'skipped'])
+
+
+class Renderer:
+    def __init__(self, root, fps=10):
+        self.root = root
+        self.period = 1 / fps
+        self.lock = threading.Lock()
+        self.options = {}           # (widget, option) -> value, waiting for the next frame
+        self.calls = collections.OrderedDict()      # key -> (function, args)
+        self.shown = {}             # (widget, option) -> value on the screen
+        self.hooks = []
+        self.next = None            # time of the next frame
+        self.frames = 0
+        self.skipped = 0
+
+    def start(self):
+        self.next = time.perf_counter()
+        self.root.after(0, self.frame)
+
+    def set(self, widget, option, value):
+        # any thread
+        with self.lock:
+            self.options[(widget, option)] = value
+
+    def call(self, key, function, *args):
+        # function(*args) in the next frame, replaces a call with the same key which is waiting
+        with self.lock:
+            self.calls.pop(key, None)
+            self.calls[key] = (function, args)
+
+    def add_hook(self, function):
+        # function(FrameStats) after every frame, in the Tk thread
+        self.hooks.append(function)
+
+    def forget(self, widget):
+        # widget was destroyed or configured directly
+        for key in [key for key in self.shown if key[0] is widget]:
+            del self.shown[key]
+
+    def frame(self):
+        t = time.perf_counter()
+        skipped = max(int((t - self.next) / self.period), 0)
+        self.next += (skipped + 1) * self.period
+        self.root.after(max(int(1000 * (self.next - t)), 1), self.frame)
+        with self.lock:
+            options, self.options = self.options, {}
+            calls, self.calls = self.calls, collections.OrderedDict()
+        changed = 0
+        for key, value in options.items():
+            if self.shown.get(key) == value:
+                continue
+            widget, option = key
+            try:
+                widget.configure(**{option: value})
+            except Exception as e:
+                print('Renderer: setting {} of {} failed: {}'.format(option, widget, e))
+                continue
+            self.shown[key] = value
+            changed += 1
+        for key, (function, args) in calls.items():
+            try:
+                function(*args)
+            except Exception as e:
+                print('Renderer: {} failed: {}'.format(key, e))
+        now = time.perf_counter()
+        self.frames += 1
+        self.skipped += skipped
+        stats = FrameStats(t, now - t, changed, len(options) - changed, len(calls), skipped)
+        for hook in self.hooks:
+            try:
+                hook(stats)
+            except Exception as e:
+                print('Renderer: hook {} failed: {}'.format(hook, e))
+
+
+class FrameReport:
+    # hook which prints mean and max frame time and the skipped frames every 'interval' seconds
+    def __init__(self, interval=600, name='GUI'):
+        self.interval = interval
+        self.name = name
+        self.clear(time.perf_counter())
+
+    def clear(self, t):
+        self.start = t
+        self.frames = self.busy = self.skipped = self.changed = self.unchanged = 0
+        self.duration = self.max = 0.0
+
+    def __call__(self, stats):
+        self.frames += 1
+        self.duration += stats.duration
+        self.max = max(self.max, stats.duration)
+        self.skipped += stats.skipped
+        self.changed += stats.changed
+        self.unchanged += stats.unchanged
+        if stats.changed or stats.calls:
+            self.busy += 1
+        if stats.time - self.start >= self.interval:
+            print('{}: {} frames ({} with changes), {:.2f} ms mean, {:.2f} ms max, {} skipped, '
+                  '{} options set, {} unchanged'.format(
+                      self.name, self.frames, self.busy, 1000 * self.duration / self.frames, 1000 * self.max,
+                      self.skipped, self.changed, self.unchanged))
+            self.clear(stats.time)
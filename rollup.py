@@ -0,0 +1,309 @@
+# rollup tiers of the pressure logs
+#
+# For every logged channel min, max, mean and count of the valid values (no sentinels like
+# -4000, no nan) per minute, hour and day are kept in files <directory>/<key>-<tier>.bin of
+# fixed size records: time of the bucket start [ns since epoch], min, max, mean, count.
+# Buckets are aligned to local midnight, tiers have to divide a day or be a day.
+#
+# The rows come from the daily logs (see logindex.py), read on from where the tiers end: at
+# the first start the whole archive is backfilled day by day, later update() only reads the
+# rows written since the last call. A bucket is written when a row of a later bucket comes
+# in, the current buckets are kept in memory and are part of query results as well. After
+# a restart the rows of the current day are read again, buckets which are in the files
+# already are skipped.
+#
+# A query takes the coarsest tier which still has the requested resolution, e.g. a month at
+# 1 h resolution is 720 records instead of 1.3 million rows.
+#
+# python rollup.py [days] [seconds between rows]: backfill and queries on a generated archive
+
+import datetime as dt
+import glob
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+import archive
+import logindex
+
+RECORD = np.dtype([('time', '<i8'), ('min', '<f8'), ('max', '<f8'), ('mean', '<f8'), ('count', '<i8')])
+TIERS = (60, 3600, 86400)
+
+
+def tier_name(seconds):
+    for unit, length in [('d', 86400), ('h', 3600), ('min', 60)]:
+        if seconds % length == 0:
+            return '{}{}'.format(seconds // length, unit)
+    return '{}s'.format(seconds)
+
+
+def first_time(pattern, date_fmt):
+    # time of the first row of the oldest log matching the strftime pattern, None without logs
+    parse = logindex.time_parser(date_fmt)
+    times = []
+    for path in glob.glob(re.sub(r'%.', '*', pattern)):
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    times.append(logindex.row_time(line, parse))
+                    break
+                except ValueError:
+                    pass
+    for path in glob.glob(re.sub(r'%.', '*', pattern) + archive.SUFFIX):
+        # compressed logs, see archive.py
+        with open(path, 'rb') as f:
+            starts = archive.read_index(f)[1]['start']
+        times += [int(t) for t in starts if t >= 0][:1]
+    return min(times) if times else None
+
+
+class Tier:
+    def __init__(self, directory, keys, seconds):
+        self.seconds = seconds
+        self.keys = keys
+        self.paths = {key: os.path.join(directory, '{}-{}.bin'.format(key, tier_name(seconds))) for key in keys}
+        self.end = None         # end of the last bucket in the files [s]
+        self.open = None        # [start [s], mins, maxs, sums, counts] of the current bucket
+        for path in self.paths.values():
+            if not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            if size % RECORD.itemsize:
+                # half written record
+                with open(path, 'r+b') as f:
+                    f.truncate(size - size % RECORD.itemsize)
+                size -= size % RECORD.itemsize
+            if size:
+                last = np.fromfile(path, RECORD, count=1, offset=size - RECORD.itemsize)[0]
+                end = int(last['time']) // 1000000000 + seconds
+                self.end = end if self.end is None else max(self.end, end)
+
+    def add(self, times, values, ok, midnight):
+        # rows of the day starting at midnight, times [s], values and ok with a column per channel
+        if self.seconds >= 86400:
+            starts = np.full(len(times), midnight, np.int64)
+        else:
+            starts = midnight + (times - midnight) // self.seconds * self.seconds
+        if self.end is not None:
+            # buckets which are in the files already
+            new = starts >= self.end
+            starts, values, ok = starts[new], values[new], ok[new]
+        if not len(starts):
+            return
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        buckets = [starts[first],
+                   np.minimum.reduceat(np.where(ok, values, np.inf), first),
+                   np.maximum.reduceat(np.where(ok, values, -np.inf), first),
+                   np.add.reduceat(np.where(ok, values, 0.0), first),
+                   np.add.reduceat(ok.astype(np.int64), first)]
+        if self.open is not None:
+            if self.open[0] == buckets[0][0]:
+                buckets[1][0] = np.minimum(buckets[1][0], self.open[1])
+                buckets[2][0] = np.maximum(buckets[2][0], self.open[2])
+                buckets[3][0] += self.open[3]
+                buckets[4][0] += self.open[4]
+            elif self.open[0] < buckets[0][0]:
+                buckets = [np.concatenate(([self.open[0]], buckets[0]))] + [
+                    np.concatenate(([current], rows)) for current, rows in zip(self.open[1:], buckets[1:])]
+        self.write(*[rows[:-1] for rows in buckets])
+        self.open = [rows[-1] for rows in buckets]
+
+    def write(self, starts, mins, maxs, sums, counts):
+        # closed buckets, a record per channel and bucket with valid values
+        if not len(starts):
+            return
+        for j, key in enumerate(self.keys):
+            valid = counts[:, j] > 0
+            records = np.zeros(np.sum(valid), RECORD)
+            records['time'] = starts[valid] * 1000000000
+            records['min'] = mins[valid, j]
+            records['max'] = maxs[valid, j]
+            records['mean'] = sums[valid, j] / counts[valid, j]
+            records['count'] = counts[valid, j]
+            if len(records):
+                with open(self.paths[key], 'ab') as f:
+                    f.write(records.tobytes())
+        self.end = int(starts[-1]) + self.seconds
+
+    def read(self, key, start, end):
+        # records of the buckets of a channel overlapping start to end [s]
+        j = self.keys.index(key)
+        path = self.paths[key]
+        count = os.path.getsize(path) // RECORD.itemsize if os.path.isfile(path) else 0
+        records = np.zeros(0, RECORD)
+        if count:
+            stored = np.memmap(path, RECORD, mode='r', shape=(count,))
+            first = np.searchsorted(stored['time'], (start - self.seconds) * 1000000000, 'right')
+            last = np.searchsorted(stored['time'], end * 1000000000, 'right')
+            records = np.array(stored[first:last])
+            del stored
+        if self.open is not None and start - self.seconds < self.open[0] <= end and self.open[4][j] > 0:
+            current = np.zeros(1, RECORD)
+            current['time'] = self.open[0] * 1000000000
+            current['min'] = self.open[1][j]
+            current['max'] = self.open[2][j]
+            current['mean'] = self.open[3][j] / self.open[4][j]
+            current['count'] = self.open[4][j]
+            records = np.concatenate((records, current))
+        return records
+
+
+class Rollup:
+    def __init__(self, directory, pattern, keys, date_fmt, sentinels=(), tiers=TIERS, delay=120,
+                 stride=logindex.STRIDE):
+        self.pattern = pattern      # strftime pattern of the logs
+        self.keys = list(keys)
+        self.date_fmt = date_fmt
+        self.sentinels = list(sentinels)
+        self.delay = delay          # seconds after midnight until the log of the day is complete
+        self.stride = stride
+        os.makedirs(directory, exist_ok=True)
+        self.tiers = [Tier(directory, self.keys, seconds) for seconds in sorted(tiers)]
+        self.position = None        # rows before this time [s] have been read
+        self.lock = threading.Lock()
+
+    def start(self):
+        # the rows of the first bucket which is not in the files of all tiers
+        ends = [tier.end for tier in self.tiers]
+        if None in ends:
+            first = first_time(self.pattern, self.date_fmt)
+            return None if first is None else int(first)
+        return min(ends)
+
+    def update(self, budget=None):
+        # read the rows written since the last call, returns False if it stopped after budget
+        # seconds before the end of the logs (backfill)
+        t_stop = None if budget is None else time.time() + budget
+        if self.position is None:
+            self.position = self.start()
+            if self.position is None:
+                return True
+        while True:
+            day = dt.datetime.fromtimestamp(self.position).date()
+            midnight = int(time.mktime(day.timetuple()))
+            day_end = int(time.mktime((day + dt.timedelta(days=1)).timetuple()))
+            times, values = logindex.query_columns(self.pattern, self.keys, self.position, day_end - 1,
+                                                   self.date_fmt, self.stride)
+            if len(times):
+                self.add(times // 1000000000, values, midnight)
+                self.position = int(times[-1]) // 1000000000 + 1
+            if day_end + self.delay > time.time():
+                # rows of today are still written
+                return True
+            self.position = day_end
+            if t_stop is not None and time.time() > t_stop:
+                return False
+
+    def add(self, times, values, midnight):
+        # rows of the day starting at midnight: times [s], values with a column per channel
+        ok = np.isfinite(values)
+        for sentinel in self.sentinels:
+            ok &= values != sentinel
+        with self.lock:
+            for tier in self.tiers:
+                tier.add(times, values, ok, midnight)
+
+    def tier(self, resolution):
+        # coarsest tier with buckets up to resolution [s], None if the rows are finer
+        tiers = [tier for tier in self.tiers if tier.seconds <= resolution]
+        return tiers[-1] if tiers else None
+
+    def query(self, key, start, end, resolution=0):
+        # records of a channel from start to end [s since epoch] of the coarsest tier with buckets
+        # up to resolution [s], below the finest tier the rows themselves (count 0 if invalid)
+        tier = self.tier(resolution)
+        if tier is None:
+            times, values = logindex.query(self.pattern, key, start, end, self.date_fmt, self.stride)
+            records = np.zeros(len(times), RECORD)
+            records['time'] = times
+            ok = np.isfinite(values) & ~np.isin(values, self.sentinels)
+            records['min'] = records['max'] = records['mean'] = np.where(ok, values, np.nan)
+            records['count'] = ok
+            return records
+        with self.lock:
+            return tier.read(key, start, end)
+
+
+if __name__ == '__main__':
+    import shutil
+    import sys
+    import tempfile
+
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    date_fmt = '%Y-%m-%d_%H:%M:%S'
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    sentinels = [-4000, -3000, -2000, -1000, -5000]
+    directory = tempfile.mkdtemp()
+    pattern = os.path.join(directory, '%Y', 'pressure-LT-%Y-%m-%d.log')
+
+    # archive up to yesterday, a row every step seconds with some sensor errors
+    first = dt.date.today() - dt.timedelta(days=days)
+    random = np.random.RandomState(1)
+    t = time.time()
+    size = 0
+    for n in range(days):
+        day = first + dt.timedelta(days=n)
+        path = day.strftime(pattern)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        t0 = time.mktime(day.timetuple())
+        seconds = np.arange(0, 86400, step)
+        columns = 1e-9 * (1 + np.sin((n * 86400 + seconds[:, None]) / 5e5 + np.arange(len(keys))) ** 2)
+        columns *= 1 + 0.05 * random.randn(*columns.shape)
+        columns[random.random_sample(columns.shape) < 0.001] = -4000
+        rows = ['Time\t' + '\t'.join('{}[mbar]'.format(key) for key in keys) + '\n']
+        for i, second in enumerate(seconds):
+            rows.append(time.strftime(date_fmt, time.localtime(t0 + second)) +
+                        ''.join('\t{: .3e}'.format(value) for value in columns[i]) + '\n')
+        with open(path, 'w') as f:
+            f.write(''.join(rows))
+        size += os.path.getsize(path)
+    print('archive: {} days, {:.0f} MB, {} rows per day, generated in {:.1f} s'.format(
+        days, size / 2 ** 20, 86400 // step, time.time() - t))
+
+    rollup = Rollup(os.path.join(directory, 'rollup'), pattern, keys, date_fmt, sentinels)
+    t = time.time()
+    rollup.update()
+    t_backfill = time.time() - t
+    files = glob.glob(os.path.join(directory, 'rollup', '*'))
+    print('backfill: {:.1f} s ({:.2f} ms per day), tiers {:.1f} MB'.format(
+        t_backfill, 1000 * t_backfill / days, sum(os.path.getsize(path) for path in files) / 2 ** 20))
+
+    # rows written today, picked up by the next update
+    today = dt.date.today().strftime(pattern)
+    os.makedirs(os.path.dirname(today), exist_ok=True)
+    with open(today, 'w') as f:
+        f.write('Time\t' + '\t'.join('{}[mbar]'.format(key) for key in keys) + '\n')
+    for n in range(5):
+        with open(today, 'a') as f:
+            for i in range(6):
+                f.write(time.strftime(date_fmt, time.localtime(time.time() - 3600 + n * 600 + i * step)) +
+                        '\t 1.000e-09' * len(keys) + '\n')
+        t = time.time()
+        rollup.update()
+        print('update with {} new rows: {:.2f} ms'.format(6, 1000 * (time.time() - t)))
+
+    # a month at 1 h resolution: rollup against reading the rows and averaging them
+    end = time.mktime(dt.date.today().timetuple()) - 1
+    start = end - min(days, 30) * 86400 + 1
+    t = time.time()
+    records = rollup.query(keys[0], start, end, resolution=3600)
+    t_rollup = time.time() - t
+    t = time.time()
+    times, values = logindex.query(pattern, keys[0], start, end, date_fmt)
+    ok = np.isfinite(values) & ~np.isin(values, sentinels)
+    hours = (times // 1000000000 - int(start)) // 3600
+    means = np.bincount(hours[ok], values[ok]) / np.bincount(hours[ok])
+    t_rows = time.time() - t
+    assert len(records) == len(means) and np.allclose(records['mean'], means, rtol=1e-12)
+    print('{} days at 1 h: rollup {:7.2f} ms ({} records), rows {:8.1f} ms ({} rows)'.format(
+        min(days, 30), 1000 * t_rollup, len(records), 1000 * t_rows, len(values)))
+    for length, resolution in [(days * 86400, 86400), (7 * 86400, 60), (3600, 0)]:
+        t = time.time()
+        records = rollup.query(keys[0], end - length, end, resolution)
+        print('{:8d} s at {:5d} s: {:7.2f} ms ({} records)'.format(
+            length, resolution, 1000 * (time.time() - t), len(records)))
+    shutil.rmtree(directory)
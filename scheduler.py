@@ -0,0 +1,113 @@
+# deadline based scheduling of channel reads
+#
+# Every channel has its own poll interval and priority. The scheduler runs on an asyncio
+# loop, starts each read when its deadline comes up (higher priority first if several are
+# due) and keeps track of how late the reads started. Reads returning a coroutine run on
+# the loop, blocking reads in the default executor. A read that is still running when its next
+# deadline comes up is skipped instead of queued twice.
+
+import asyncio
+import heapq
+import itertools
+
+
+class Entry:
+    def __init__(self, name, interval, func, priority, blocking):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.priority = priority
+        self.blocking = blocking
+        self.running = False
+        # statistics
+        self.runs = 0
+        self.skipped = 0
+        self.lateness_sum = 0.0
+        self.lateness_max = 0.0
+        self.duration_sum = 0.0
+
+
+class Scheduler:
+    def __init__(self, loop):
+        self.loop = loop
+        self.entries = {}
+        self.queue = []        # heap of (deadline, -priority, sequence number, entry)
+        self.sequence = itertools.count()
+        self.wakeup = None
+
+    def add(self, name, interval, func, priority=0, blocking=False):
+        # func() may return a coroutine, blocking functions run in the executor
+        entry = Entry(name, interval, func, priority, blocking)
+        self.entries[name] = entry
+        self.loop.call_soon_threadsafe(self._push, entry, self.loop.time())
+
+    def _push(self, entry, deadline):
+        heapq.heappush(self.queue, (deadline, -entry.priority, next(self.sequence), entry))
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+
+    async def run(self):
+        while True:
+            if not self.queue:
+                delay = None
+            else:
+                delay = self.queue[0][0] - self.loop.time()
+            if delay is None or delay > 0:
+                # sleep until the next deadline or until a new entry arrives
+                self.wakeup = self.loop.create_future()
+                try:
+                    await asyncio.wait_for(self.wakeup, delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup = None
+                continue
+            # start everything that is due, higher priority first however late the reads are
+            now = self.loop.time()
+            due = []
+            while self.queue and self.queue[0][0] <= now:
+                deadline, _, _, entry = heapq.heappop(self.queue)
+                due.append((deadline, entry))
+            due.sort(key=lambda item: -item[1].priority)
+            for deadline, entry in due:
+                self._start(entry, deadline, now)
+                # next deadline keeps the grid, but never lies in the past
+                deadline_next = deadline + entry.interval
+                if deadline_next < now:
+                    deadline_next = now + entry.interval
+                self._push(entry, deadline_next)
+
+    def _start(self, entry, deadline, now):
+        if entry.running:
+            entry.skipped += 1
+            return
+        lateness = now - deadline
+        entry.runs += 1
+        entry.lateness_sum += lateness
+        entry.lateness_max = max(entry.lateness_max, lateness)
+        entry.running = True
+        self.loop.create_task(self._execute(entry))
+
+    async def _execute(self, entry):
+        t_start = self.loop.time()
+        try:
+            if entry.blocking:
+                await self.loop.run_in_executor(None, entry.func)
+            else:
+                result = entry.func()
+                if asyncio.iscoroutine(result):
+                    await result
+        except Exception as e:
+            print('Scheduler: {} failed: {}'.format(entry.name, e))
+        finally:
+            entry.duration_sum += self.loop.time() - t_start
+            entry.running = False
+
+    def report(self):
+        # lateness of every entry: runs, mean and max lateness [ms], mean duration [ms], skipped runs
+        lines = []
+        for name, entry in self.entries.items():
+            runs = max(entry.runs, 1)
+            lines.append('{0: >6} every {1:6.2f}s: {2:6d} runs, late {3:7.2f} ms (max {4:7.2f} ms), takes {5:7.2f} ms, {6} skipped'.format(
+                name, entry.interval, entry.runs, 1000 * entry.lateness_sum / runs, 1000 * entry.lateness_max,
+                1000 * entry.duration_sum / runs, entry.skipped))
+        return lines
@@ -0,0 +1,126 @@
+# asyncio event loop for all serial instruments
+#
+# One thread runs the loop, every port is registered as a reader on it. Incoming bytes are
+# collected per port and a waiting coroutine resumes as soon as its terminator arrived,
+# so there are no fixed sleeps between command and answer anymore.
+
+import asyncio
+import os
+import threading
+import time
+
+
+class _Port:
+    def __init__(self, ser):
+        self.ser = ser
+        self.fd = ser.fileno()
+        self.buffer = bytearray()
+        self.waiter = None      # future of a coroutine waiting for data
+        self.lock = None        # serializes command/answer transactions, created on the loop
+
+
+class SerialEngine:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.ports = {}
+        self.tasks = []
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='serial_engine', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        # cancel all running tasks and stop the loop
+        if not self.running:
+            return
+        self.running = False
+
+        def _stop():
+            for task in self.tasks:
+                task.cancel()
+            for port in self.ports.values():
+                self.loop.remove_reader(port.fd)
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(_stop)
+        self.thread.join()
+
+    def add_port(self, ser):
+        # register an open serial port, does nothing if it is already registered or not open
+        if ser is None or ser in self.ports:
+            return
+        try:
+            port = _Port(ser)
+        except Exception:
+            return
+        self.ports[ser] = port
+        self.loop.call_soon_threadsafe(self._register, port)
+
+    def _register(self, port):
+        port.lock = asyncio.Lock()
+        self.loop.add_reader(port.fd, self._on_readable, port)
+
+    def _on_readable(self, port):
+        try:
+            data = os.read(port.fd, 4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            # device vanished, stop listening and let waiting readers time out
+            self.loop.remove_reader(port.fd)
+            return
+        port.buffer.extend(data)
+        if port.waiter is not None and not port.waiter.done():
+            port.waiter.set_result(None)
+
+    def submit(self, coro):
+        # run coroutine on the loop, returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        # run coroutine on the loop and wait for its result (not from within the loop)
+        return self.submit(coro).result(timeout)
+
+    def spawn(self, coro):
+        # start a long running task, it is cancelled by stop()
+        def _spawn():
+            self.tasks.append(self.loop.create_task(coro))
+        self.loop.call_soon_threadsafe(_spawn)
+
+    def transaction(self, ser):
+        # lock for a command/answer sequence on one port, use with 'async with'
+        return self.ports[ser].lock
+
+    def flush_input(self, ser):
+        # drop everything received so far
+        del self.ports[ser].buffer[:]
+
+    def write(self, ser, data):
+        ser.write(data)
+
+    async def readline(self, ser, terminator=b'\n', timeout=1.0):
+        # wait until terminator arrives, returns the line including the terminator or b'' on timeout
+        port = self.ports[ser]
+        t_end = time.time() + timeout
+        while True:
+            index = port.buffer.find(terminator)
+            if index >= 0:
+                line = bytes(port.buffer[:index + len(terminator)])
+                del port.buffer[:index + len(terminator)]
+                return line
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                return b''
+            port.waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(port.waiter, remaining)
+            except asyncio.TimeoutError:
+                return b''
+            finally:
+                port.waiter = None
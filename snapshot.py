@@ -0,0 +1,110 @@
+# versioned snapshots of the measurement state
+#
+# Readers (GUI, log, checks) used to iterate self.data while acquisition threads wrote values
+# and statuses in place. Now a reader only sees complete, immutable snapshots: writers merge
+# the records of one sweep into a new snapshot under a lock and publish it by replacing
+# a single reference. Readers take latest() without locking and keep using it for as long
+# as they like. wait_next() blocks until a newer version is published.
+#
+# run this file directly to count torn reads (mixed sweeps) with in place writes vs snapshots
+
+import collections
+import threading
+import time
+from types import MappingProxyType
+
+# value, status and reliability of one channel at the time it was measured
+Record = collections.namedtuple('Record', ['value', 'status', 'unreliable', 'time'])
+
+
+class Snapshot:
+    __slots__ = ('version', 'time', 'records')
+
+    def __init__(self, version, time, records):
+        self.version = version
+        self.time = time            # time of publishing
+        self.records = records      # key -> Record, read only
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+
+class SnapshotStore:
+    def __init__(self, records):
+        self.condition = threading.Condition()      # serializes writers, readers never take it
+        self.current = Snapshot(0, time.time(), MappingProxyType(dict(records)))
+
+    def publish(self, records):
+        # merge records (key -> Record) into a new snapshot
+        if not records:
+            return self.current
+        with self.condition:
+            merged = dict(self.current.records)
+            merged.update(records)
+            self.current = Snapshot(self.current.version + 1, time.time(), MappingProxyType(merged))
+            self.condition.notify_all()
+            return self.current
+
+    def latest(self):
+        return self.current
+
+    def wait_next(self, version, timeout=None):
+        # snapshot newer than version, the latest one if it times out
+        with self.condition:
+            self.condition.wait_for(lambda: self.current.version > version, timeout)
+            return self.current
+
+
+if __name__ == '__main__':
+    # writers store sweep n as value n and status n of every key, a reader checks that it sees one sweep
+    import sys
+    sys.setswitchinterval(1e-5)     # switch threads often, like with many busy acquisition threads
+    keys = ['PSTM', 'PROU', 'PPRP', 'TSTM', 'TCRY', 'TSAM', 'TMAN', 'TLAB']
+    duration = 2
+
+    def run(write, read):
+        running = [True]
+
+        def writer(offset):
+            n = offset
+            while running[0]:
+                write(n)
+                n += 2
+
+        threads = [threading.Thread(target=writer, args=(offset,)) for offset in range(2)]
+        for thread in threads:
+            thread.start()
+        reads = torn = 0
+        t_end = time.time() + duration
+        while time.time() < t_end:
+            reads += 1
+            torn += not read()
+        running[0] = False
+        for thread in threads:
+            thread.join()
+        return reads, torn
+
+    data = {key: {'value': 0, 'status': 0} for key in keys}
+
+    def write_in_place(n):
+        for key in keys:
+            data[key]['value'] = n
+            data[key]['status'] = n
+
+    def read_in_place():
+        n = data[keys[0]]['value']
+        return all(data[key]['value'] == n and data[key]['status'] == n for key in keys)
+
+    store = SnapshotStore({key: Record(0, 0, False, 0) for key in keys})
+
+    def write_snapshot(n):
+        store.publish({key: Record(n, n, False, 0) for key in keys})
+
+    def read_snapshot():
+        snapshot = store.latest()
+        n = snapshot[keys[0]].value
+        return all(snapshot[key].value == n and snapshot[key].status == n for key in keys)
+
+    for name, write, read in [('in place', write_in_place, read_in_place), ('snapshots', write_snapshot, read_snapshot)]:
+        reads, torn = run(write, read)
+        print('{:9s}: {:8d} reads, {:6d} torn ({:.3f} %)'.format(name, reads, torn, 100 * torn / reads))
@@ -0,0 +1,183 @@
+# history sparklines: min/max decimation and incremental drawing
+#
+# A sparkline shows the last 'seconds' of a channel in 'width' columns. Decimator keeps min
+# and max of the valid samples of every column. Columns are fixed slots of time (number =
+# time // length of a column), so old columns stay as they are when time goes on: new samples
+# of the history change the newest column or add columns. An update costs the new samples,
+# drawing costs the width, neither depends on the number of samples in the window.
+#
+# Sparkline draws the columns as vertical lines on a tk canvas. An update moves the drawing
+# left by the number of new columns, deletes what scrolled out and draws the new columns and
+# those which changed. Everything is drawn again only if the value range or the size changed.
+#
+# run gui_bench.py for render times
+
+import collections
+
+import numpy as np
+
+
+def same(a, b):
+    # elementwise equal, nan equals nan
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def value_range(mins, maxs):
+    # lowest and highest value of the columns, (None, None) without values
+    valid = mins <= maxs
+    if not np.any(valid):
+        return None, None
+    return np.min(mins[valid]), np.max(maxs[valid])
+
+
+def padded(low, high):
+    # range of a drawing of values from low to high
+    margin = max(0.1 * (high - low), 1e-3 * max(abs(high), abs(low)), 1e-12)
+    return low - margin, high + margin
+
+
+class Decimator:
+    # min/max per column of the last seconds of a channel history, pressures in log10
+    def __init__(self, channel, width=120, seconds=3600, sentinels=(), log=False):
+        self.channel = channel      # history.ChannelHistory
+        self.width = width
+        self.step = int(seconds * 1e9 / width)      # length of a column [ns]
+        self.sentinels = list(sentinels)
+        self.log = log
+        self.mins = np.full(width, np.nan)
+        self.maxs = np.full(width, np.nan)
+        self.last = None            # number of the newest column
+        self.head = 0               # number of the next sample of the history
+
+    def update(self):
+        # add the samples appended to the history since the last update
+        count = self.channel.count
+        if count == self.head:
+            return
+        if self.last is None or self.head < count - min(count, self.channel.capacity):
+            # first update or missed samples: the whole window again
+            times = self.channel.last()[0]
+            self.head = count - len(times) + np.searchsorted(times, times[-1] - self.width * self.step)
+            self.last = None
+        times, values, status = self.channel.last(count - self.head)
+        self.head = count
+        self.advance(int(times[-1]) // self.step)
+        ok = np.isfinite(values)
+        for sentinel in self.sentinels:
+            ok &= values != sentinel
+        if self.log:
+            ok &= values > 0
+        if not np.any(ok):
+            return
+        y = np.log10(values[ok]) if self.log else values[ok]
+        columns = times[ok] // self.step - (self.last - self.width + 1)
+        first = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+        columns = columns[first]
+        mins = np.minimum.reduceat(y, first)
+        maxs = np.maximum.reduceat(y, first)
+        shown = columns >= 0
+        columns = columns[shown]
+        self.mins[columns] = np.fmin(self.mins[columns], mins[shown])
+        self.maxs[columns] = np.fmax(self.maxs[columns], maxs[shown])
+
+    def advance(self, newest):
+        # columns up to number newest, older ones scroll out
+        shift = self.width if self.last is None else newest - self.last
+        if shift >= self.width:
+            self.mins[:] = self.maxs[:] = np.nan
+        elif shift > 0:
+            self.mins[:-shift] = self.mins[shift:]
+            self.maxs[:-shift] = self.maxs[shift:]
+            self.mins[-shift:] = self.maxs[-shift:] = np.nan
+        if self.last is None or newest > self.last:
+            self.last = newest
+
+    def columns(self):
+        # (number of the newest column, mins, maxs) as lists, nan for columns without samples
+        return self.last, self.mins.tolist(), self.maxs.tolist()
+
+
+class Sparkline:
+    # columns of a Decimator drawn on a tk canvas, one item per column
+    def __init__(self, canvas, color, width=120):
+        self.canvas = canvas
+        self.color = color
+        self.width = width
+        self.items = collections.deque()
+        self.last = None            # number of the newest column drawn
+        self.mins = self.maxs = None
+        self.low = self.high = None     # value range of the drawing
+        self.size = None            # (width, height) of the canvas in pixels
+        self.redraws = 0
+        self.calls = 0              # canvas calls of the last update
+        canvas.bind('<Configure>', self.resize)
+
+    def resize(self, event):
+        if (event.width, event.height) != self.size:
+            self.size = (event.width, event.height)
+            if self.last is not None:
+                self.redraw(self.last, self.mins, self.maxs)
+
+    def coords(self, i, low, high):
+        # line of column i from high to low, off the canvas if there are no values
+        if not (low <= high):
+            return -10, -10, -10, -10
+        width, height = self.size
+        x = (i + 0.5) * width / self.width
+        scale = (height - 2) / (self.high - self.low)
+        return x, height - 1 - (high - self.low) * scale, x, height - (low - self.low) * scale
+
+    def update(self, last, mins, maxs):
+        mins = np.asarray(mins, np.float64)
+        maxs = np.asarray(maxs, np.float64)
+        self.calls = 0
+        if self.size is None or self.size[1] < 2:
+            # not mapped yet
+            self.last, self.mins, self.maxs = last, mins, maxs
+            return
+        low, high = value_range(mins, maxs)
+        shift = None if self.last is None else last - self.last
+        redraw = shift is None or not self.items or not 0 <= shift < self.width
+        if (low is None) != (self.low is None):
+            redraw = True
+        elif low is not None:
+            new_low, new_high = padded(low, high)
+            if low < self.low or high > self.high or new_high - new_low < 0.5 * (self.high - self.low):
+                # out of range or the range shrank a lot
+                redraw = True
+        if redraw:
+            self.redraw(last, mins, maxs)
+            return
+        canvas = self.canvas
+        if shift:
+            canvas.move('sparkline', -shift * self.size[0] / self.width, 0)
+            for _ in range(shift):
+                canvas.delete(self.items.popleft())
+            for i in range(self.width - shift, self.width):
+                self.items.append(canvas.create_line(*self.coords(i, mins[i], maxs[i]), fill=self.color,
+                                                     width=max(self.size[0] // self.width, 1), tags='sparkline'))
+            self.calls += 1 + 2 * shift
+        # columns which changed since they were drawn
+        kept = self.width - shift
+        changed = ~(same(self.mins[shift:], mins[:kept]) & same(self.maxs[shift:], maxs[:kept]))
+        for i in np.flatnonzero(changed):
+            canvas.coords(self.items[i], *self.coords(i, mins[i], maxs[i]))
+            self.calls += 1
+        self.last, self.mins, self.maxs = last, mins, maxs
+
+    def redraw(self, last, mins, maxs):
+        # everything, with a new value range
+        self.last, self.mins, self.maxs = last, mins, maxs
+        self.canvas.delete('sparkline')
+        self.items.clear()
+        self.calls += 1
+        if self.size is None:
+            return
+        low, high = value_range(mins, maxs)
+        self.low, self.high = (None, None) if low is None else padded(low, high)
+        for i in range(self.width):
+            coords = self.coords(i, mins[i], maxs[i]) if self.low is not None else (-10, -10, -10, -10)
+            self.items.append(self.canvas.create_line(*coords, fill=self.color,
+                                                      width=max(self.size[0] // self.width, 1), tags='sparkline'))
+        self.calls += self.width
+        self.redraws += 1
@@ -4,14 +4,13 @@
 #
 # enalbe GPIO and SPI on your RPi
 
+import asyncio
 import collections
-import copy
 import datetime as dt
 from functools import wraps
 import numpy as np
-import pandas as pd
-import pickle as pk
 import os
+import sys
 import threading
 import time
 import serial
@@ -22,10 +21,39 @@ from Adafruit_MAX31856 import MAX31856 as MAX31856
 import adafruit_ads1x15.single_ended
 
 import config as CFG    # config file - individual for every machine
-import GUI              # GUI for visualization and interaction on screen
+import adc_sampler      # background sampling of the adc chips
+import archive          # compression of old logs
+import binlog           # binary log files
+import devices          # shared handles of serial ports, i2c and spi devices
+import gradient         # incremental gradients over several windows
+import gui_process      # GUI in a separate process
+import history          # history of all measured values
+import http_status      # snapshot and event stream over HTTP
+import logwriter        # log files written by a thread
+import maxigauge        # continuous output mode of the maxigauge controller
+import metrics          # counters and timings for /metrics
+import rollup           # min/max/mean tiers of the logs
+import scheduler        # deadline based scheduling of channel reads
+import serial_engine    # asyncio loop for all serial instruments
+import snapshot         # consistent snapshots of all measured values
+import sparkline        # history next to the values in the GUI
+import tail             # last records of the logs
+import thermocouple     # automatic conversion mode of the temperature chips
+import workers          # worker threads for the periodic tasks
 
 
 class measure:
+    # sensor types read over serial ports, every type has its own port
+    serial_types = ['maxigauges', 'mvc_prep', 'mvc_stm', 'ser_ion_prep', 'ser_ion_cryo', 'ser_ion_stm']
+    serial_ports = {'maxigauges': (CFG.COM_PORT_MAXIGAUGE, 9600),           # maxigauges (pfeiffer)
+                    'mvc_prep': (CFG.COM_PORT_MVC_GAUGE_PREP, 19200),       # pressure gauge (vacom) in prep chamber
+                    'mvc_stm': (CFG.COM_PORT_MVC_GAUGE_STM, 19200),         # pressure gauge (vacom) in stm/afm chamber
+                    'ser_ion_prep': (CFG.COM_PORT_ION_PREP, 9600),          # ion pump (gamma vacuum) in prep chamber (AFM/XPS)
+                    'ser_ion_cryo': (CFG.COM_PORT_ION_CRYO, 9600),          # ion pump (gamma vacuum) in cryo chamber (AFM)
+                    'ser_ion_stm': (CFG.COM_PORT_ION_STM, 9600)}            # ion pump (gamma vacuum) in stm chamber (XPS)
+    # sensor types read from adc and temperature chips
+    analog_types = ['ADC_diods', 'ADC_resistor', 'SPI0', 'SPI1']
+
     # decoding
     conv_to_decode = CFG.conv_to_decode
     decoding_dict = CFG.decoding_dict       # converts values to labels like 'Overrange', 'Off', ...
@@ -43,41 +71,73 @@ class measure:
 
         self.init_data_dict()       # get dictionary of values, which should be measured
 
-        # for displaying gradients
-        self.gradient_data_current = 0
-        self.gradient_data_num = int(np.max(CFG.GRADIENT / CFG.GRADIENT_RUNEVERY))
-        self.gradient_data = [copy.deepcopy(self.data) for _ in range(self.gradient_data_num)]  # we dont want references
-        now = dt.datetime.now()
-        self.gradient_data_timestamp = [now] * self.gradient_data_num
+        # measured values, readers take the latest snapshot
+        self.snapshots = snapshot.SnapshotStore({
+            key: snapshot.Record(self.data[key]['value'], self.data[key]['status'], False, time.time()) for key in self.data})
+
+        # counters and timings of the acquisition, served on /metrics
+        self.metrics = metrics.Registry()
+        self.metrics.channels(self.snapshots, self.data.keys())
+        self.metric_reads = self.metrics.counter('reads', 'Channel reads.', ['sensor_type'])
+        self.metric_read_time = self.metrics.histogram('read_seconds', 'Duration of a channel read.', ['function'])
+        self.metric_log_time = self.metrics.histogram(
+            'log_seconds', 'Duration of writing a row to the logs and of flushing them.', ['operation'])
+        self.metric_loop_period = self.metrics.histogram(
+            'main_loop_period_seconds', 'Time between the passes of the main loop.', buckets=metrics.PERIOD_BUCKETS)
+
+        # every measured value is kept for a while, e.g. for displaying gradients
+        self.history = history.History(self.data, CFG.HISTORY_MEMORY * 2 ** 20)
+        # gradients of all channels, updated from the history
+        windows = sorted(set(CFG.GRADIENT_WINDOWS) | {CFG.GRADIENT})
+        self.gradients = {key: gradient.GradientEngine(self.history[key], windows, self.decoding_dict.keys(),
+                                                       log=CFG.GRADIENT_LOG and self.data[key]['unit'] == 'mbar')
+                          for key in self.data}
+        # min/max per pixel column of the history for the sparklines of the large values
+        self.sparklines = {}
+        if CFG.SPARKLINE_SECONDS is not None:
+            self.sparklines = {key: sparkline.Decimator(self.history[key], CFG.SPARKLINE_WIDTH, CFG.SPARKLINE_SECONDS,
+                                                        self.decoding_dict.keys(), log=self.data[key]['unit'] == 'mbar')
+                               for key in self.data if self.data[key]['gui_size'] >= 2}
 
         self.sensor_types=list(set([self.data[key]['sensor_type'] for key in self.data]))   # get sensor types
 
-        # initialize sensors
+        # initialize sensors, devices used by several channels are opened only once
+        self.devices = devices.DeviceRegistry()
+        self.handles = {}
+        self.ser_maxi = None
         for key in self.data:
             if self.data[key]['sensor_type'] in ['ADC_diods','ADC_resistor']:
                 self.init_adc(key)
-            if self.data[key]['sensor_type'] == 'maxigauges':
-                self.init_serial_maxigauge(key)
-            if self.data[key]['sensor_type'] == 'mvc_prep':
-                self.init_serial_mvc_prep(key)
-            if self.data[key]['sensor_type'] == 'mvc_stm':
-                self.init_serial_mvc_stm(key)
-            if self.data[key]['sensor_type'] == 'ser_ion_prep':
-                self.init_serial_ion_prep(key)
-            if self.data[key]['sensor_type'] == 'ser_ion_cryo':
-                self.init_serial_ion_cryo(key)
-            if self.data[key]['sensor_type'] == 'ser_ion_stm':
-                self.init_serial_ion_stm(key)
-            if self.data[key]['sensor_type'] == 'SPI0':
-                if self.data[key]['sensor'] == 'CS0':
-                    self.init_SPI0_CS0(key)
-                if self.data[key]['sensor'] == 'CS1':
-                    self.init_SPI0_CS1(key)
-            if self.data[key]['sensor_type'] == 'SPI1':
-                if self.data[key]['sensor'] == 'CS0':
-                    self.init_SPI1_CS0(key)
-                if self.data[key]['sensor'] == 'CS1':
-                    self.init_SPI1_CS1(key)
+            if self.data[key]['sensor_type'] in self.serial_types:
+                self.init_serial(key)
+            if self.data[key]['sensor_type'] in ['SPI0', 'SPI1']:
+                self.init_SPI(key)
+        self.adc = None
+        if CFG.HELIUM != None:
+            self.init_adc_helium()
+
+        # adc channels are sampled in the background, readers average the latest samples
+        self.adc_sampler = adc_sampler.ADCSampler(data_rate=CFG.ADC_DATA_RATE, size=CFG.ADC_BUFFER)
+        for key in self.data:
+            if self.data[key]['sensor_type'] in ['ADC_diods','ADC_resistor'] and self.data[key]['used_sensor'] is not None:
+                self.adc_sampler.add_channel(key, self.data[key]['used_sensor'], self.data[key]['sensor'],
+                                             gain=2, lock=self.handles[key].lock)
+        if self.adc is not None:
+            self.adc_sampler.add_channel('LHE', self.adc, 0, gain=1, lock=self.adc_handle.lock)
+        self.adc_sampler.start()
+
+        self.maxigauge_stream = None
+        if 'maxigauges' in self.sensor_types and CFG.MAXIGAUGE_STREAM:
+            self.init_maxigauge_stream()
+
+        # all serial ports are read from one event loop
+        self.serial_engine = serial_engine.SerialEngine()
+        for key in self.data:
+            if self.data[key]['sensor_type'] in self.serial_types:
+                self.serial_engine.add_port(self.data[key]['used_sensor'])
+        self.serial_engine.start()
+
+        self.scheduler = None
 
         self.first_run = True
 
@@ -90,10 +150,29 @@ class measure:
             self.helium_turn_sensor_off_retries = 0
 
         # threads
-        self.threads_running = {}
+        self.workers = workers.WorkerPool(CFG.WORKERS)
         self.lock = threading.Lock()
 
-        self.log_writing_header = False
+        # rows are written and flushed by a thread, see LOG_FLUSH_INTERVAL and LOG_FLUSH_ROWS
+        log_sinks = [logwriter.TSVSink(os.getcwd() + CFG.PRESSURE_LOGS, self.data, CFG.date_fmt,
+                                       index_stride=CFG.LOG_INDEX_STRIDE)]
+        if CFG.BINARY_LOGS is not None:
+            log_sinks.append(binlog.BinarySink(os.getcwd() + CFG.BINARY_LOGS, self.data, self.conv_to_decode))
+        self.log_writer = logwriter.LogWriter(
+            log_sinks,
+            queue_size=CFG.LOG_QUEUE, flush_interval=CFG.LOG_FLUSH_INTERVAL, flush_rows=CFG.LOG_FLUSH_ROWS,
+            fsync=CFG.LOG_FSYNC, timing=self.metric_log_time.observe)
+        self.log_writer.start()
+
+        # finished days are compressed by a separate process at low priority
+        self.archive_process = None
+
+        # long term aggregates read from the logs, backfilled from the archive at the first start
+        self.rollup = None
+        if CFG.ROLLUP is not None:
+            self.rollup = rollup.Rollup(os.getcwd() + CFG.ROLLUP, os.getcwd() + CFG.PRESSURE_LOGS,
+                                        [key for key in self.data if self.data[key]['log_to_file']], CFG.date_fmt,
+                                        self.decoding_dict.keys(), delay=CFG.LOG_FLUSH_INTERVAL + 60)
 
         # loop properties
         self.main_loop_time = 0.08
@@ -109,247 +188,153 @@ class measure:
         # initialize data dictionary with for values which should be measured
         self.data=CFG.data
 
-    def init_adc(self,key):
-        # initialize analog-to-digital converter chip (adafruit_ads1x15)
-        try:
-            i2c = busio.I2C(board.SCL, board.SDA)
-            self.adc = adafruit_ads1x15.single_ended.ADS1115(i2c, address=CFG.ADC_ADDR_VARIOUS)
-            if self.data[key]['sensor_type'] not in ['ADC_diods','ADC_resistor']:
-                self.data[key]['used_sensor']=self.adc
-        except:
-            self.adc = None
-        try:
-            self.adc2 = adafruit_ads1x15.single_ended.ADS1115(i2c, address=CFG.ADC_ADDR_DIODS)
-            if self.data[key]['sensor_type'] in ['ADC_diods','ADC_resistor']:
-                self.data[key]['used_sensor']=self.adc2
-        except:
-            self.adc2 = None
-
-    def init_serial_maxigauge(self,key):
-        # initialize maxigauges (pfeiffer)
-        self.ser_maxi = None
-        try:
-            self.ser_maxi = serial.Serial(timeout=0.5,
-                                     baudrate=9600,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_maxi.port = CFG.COM_PORT_MAXIGAUGE
-            self.ser_maxi.open()
-            self.ser_maxi.reset_input_buffer()
-            self.ser_maxi.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_maxi
-        except:
-            pass
-
-    def init_serial_mvc_prep(self,key):
-        # initialize pressure gauge (vacom) in prep chamber
-        self.ser_mvc_prep = None
-        try:
-            self.ser_mvc_prep = serial.Serial(timeout=0.5,
-                                     baudrate=19200,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_mvc_prep.port = CFG.COM_PORT_MVC_GAUGE_PREP
-            self.ser_mvc_prep.open()
-            self.ser_mvc_prep.reset_input_buffer()
-            self.ser_mvc_prep.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_mvc_prep
-        except:
-            pass
-
-    def init_serial_mvc_stm(self,key):
-        # initialize mvc pressure gauge (vacom) in stm/afm chamber
-        self.ser_mvc_stm = None
+    def open_device(self, key, name, opener, bus=None, close=None):
+        # get shared handle of device 'name' for channel 'key', used_sensor stays None if it cannot be opened
+        self.data[key]['used_sensor'] = None
         try:
-            self.ser_mvc_stm = serial.Serial(timeout=0.5,
-                                     baudrate=19200,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_mvc_stm.port = CFG.COM_PORT_MVC_GAUGE_STM
-            self.ser_mvc_stm.open()
-            self.ser_mvc_stm.reset_input_buffer()
-            self.ser_mvc_stm.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_mvc_stm
-        except:
-            pass
+            handle = self.devices.acquire(name, opener, bus=bus, close=close)
+        except Exception:
+            return None
+        self.handles[key] = handle
+        self.data[key]['used_sensor'] = handle.device
+        return handle
 
-    def init_serial_ion_prep(self,key):
-        # initialize ion pump (gamma vacuum) in prep chamber (AFM/XPS)
-        self.ser_ion_prep = None
+    def open_adc(self, address):
+        # analog-to-digital converter chip (adafruit_ads1x15), all chips share one i2c bus
+        i2c = self.devices.acquire('i2c', lambda: busio.I2C(board.SCL, board.SDA), close=lambda i2c: i2c.deinit())
         try:
-            self.ser_ion_prep = serial.Serial(timeout=0.5,
-                                     baudrate=9600,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_ion_prep.port = CFG.COM_PORT_ION_PREP
-            self.ser_ion_prep.open()
-            self.ser_ion_prep.reset_input_buffer()
-            self.ser_ion_prep.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_ion_prep
-        except:
-            pass
+            return adafruit_ads1x15.single_ended.ADS1115(i2c.device, address=address)
+        except Exception:
+            i2c.release()
+            raise
 
-    def init_serial_ion_cryo(self,key):
-        # initialize ion pump (gamma vacuum) in cryo chamber (AFM)
-        self.ser_ion_cryo = None
-        try:
-            self.ser_ion_cryo = serial.Serial(timeout=0.5,
-                                     baudrate=9600,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_ion_cryo.port = CFG.COM_PORT_ION_CRYO
-            self.ser_ion_cryo.open()
-            self.ser_ion_cryo.reset_input_buffer()
-            self.ser_ion_cryo.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_ion_cryo
-        except:
-            pass
+    def close_adc(self, adc):
+        self.devices.release('i2c')
 
-    def init_serial_ion_stm(self,key):
-        # initialize ion pump (gamma vacuum) in stm chamber (XPS)
-        self.ser_ion_stm = None
-        try:
-            self.ser_ion_stm = serial.Serial(timeout=0.5,
-                                     baudrate=9600,
-                                     stopbits=serial.STOPBITS_ONE,
-                                     bytesize=serial.EIGHTBITS,
-                                     parity=serial.PARITY_NONE
-                                     )
-            self.ser_ion_stm.port = CFG.COM_PORT_ION_STM
-            self.ser_ion_stm.open()
-            self.ser_ion_stm.reset_input_buffer()
-            self.ser_ion_stm.reset_output_buffer()
-            self.data[key]['used_sensor']=self.ser_ion_stm
-        except:
-            pass
+    def init_adc(self, key):
+        # initialize adc chip for diodes and resistors
+        self.open_device(key, ('ADS1115', CFG.ADC_ADDR_DIODS), lambda: self.open_adc(CFG.ADC_ADDR_DIODS),
+                         bus='i2c', close=self.close_adc)
 
-    def init_SPI0_CS0(self,key):
-        # initialize temperature measuremeant via MAX31856 chip
-        self.sensor_temp_sample = None
+    def init_adc_helium(self):
+        # initialize adc chip for the helium level meter
         try:
-            self.sensor_temp_sample = MAX31856(hardware_spi=Adafruit_GPIO.SPI.SpiDev(
-                CFG.SPI0_DEV, CFG.SPI0_CS0), tc_type=CFG.SPI0_CS0_temp_type, avgsel=0xF)  # 0x8 for 8 samples average, 0xF for 16
-            self.data[key]['used_sensor']=self.sensor_temp_sample
-        except:
-            pass
+            self.adc_handle = self.devices.acquire(('ADS1115', CFG.ADC_ADDR_VARIOUS), lambda: self.open_adc(CFG.ADC_ADDR_VARIOUS),
+                                                   bus='i2c', close=self.close_adc)
+            self.adc = self.adc_handle.device
+        except Exception:
+            self.adc = None
 
-    def init_SPI0_CS1(self,key):
-        # initialize temperature measuremeant via MAX31856 chip
-        self.sensor_temp_OMBE1 = None
+    def open_serial(self, port, baudrate):
+        ser = serial.Serial(timeout=0.5,
+                            baudrate=baudrate,
+                            stopbits=serial.STOPBITS_ONE,
+                            bytesize=serial.EIGHTBITS,
+                            parity=serial.PARITY_NONE
+                            )
+        ser.port = port
+        ser.open()
+        ser.reset_input_buffer()
+        ser.reset_output_buffer()
+        return ser
+
+    def init_serial(self, key):
+        # initialize serial device, channels of the same device share the port
+        port, baudrate = self.serial_ports[self.data[key]['sensor_type']]
+        handle = self.open_device(key, ('serial', port), lambda: self.open_serial(port, baudrate))
+        if handle is not None and self.data[key]['sensor_type'] == 'maxigauges':
+            self.ser_maxi = handle.device
+
+    def init_maxigauge_stream(self):
+        # switch maxigauge controller to continuous output, keep polling if it does not answer
+        if self.ser_maxi is None:
+            return
+        stream = maxigauge.MaxigaugeStream(self.ser_maxi, interval=CFG.MAXIGAUGE_STREAM_INTERVAL)
         try:
-            self.sensor_temp_OMBE1 = MAX31856(hardware_spi=Adafruit_GPIO.SPI.SpiDev(
-                CFG.SPI0_DEV, CFG.SPI0_CS1), tc_type=CFG.SPI0_CS1_temp_type, avgsel=0xF)  # 0x8 for 8 samples average, 0xF for 16
-            self.data[key]['used_sensor']=self.sensor_temp_OMBE1
-        except:
+            if stream.start(threaded=False):     # lines are fed from the serial engine
+                self.maxigauge_stream = stream
+            else:
+                print('Maxigauge: no continuous output, polling channels.')
+        except Exception:
             pass
 
-    def init_SPI1_CS0(self,key):
-        # initialize temperature measuremeant via MAX31856 chip
-        self.sensor_temp_OMBE2 = None
-        try:
-            self.sensor_temp_OMBE2 = MAX31856(hardware_spi=Adafruit_GPIO.SPI.SpiDev(
-                CFG.SPI1_DEV, CFG.SPI1_CS0), tc_type=CFG.SPI1_CS0_temp_type, avgsel=0xF)  # 0x8 for 8 samples average, 0xF for 16
-            self.data[key]['used_sensor']=self.sensor_temp_OMBE2
-        except:
-            pass
+    def init_SPI(self, key):
+        # initialize temperature measuremeant via MAX31856 chip, channels on the same chip share it (e.g. TSAM and TLAB)
+        bus = self.data[key]['sensor_type']         # SPI0 or SPI1
+        chip = '{}_{}'.format(bus, self.data[key]['sensor'])       # e.g. SPI0_CS0
 
-    def init_SPI1_CS1(self,key):
-        # initialize temperature measuremeant via MAX31856 chip
-        self.sensor_temp_OMBE3 = None
-        try:
-            self.sensor_temp_OMBE3 = MAX31856(hardware_spi=Adafruit_GPIO.SPI.SpiDev(
-                CFG.SPI1_DEV, CFG.SPI1_CS1), tc_type=CFG.SPI1_CS1_temp_type, avgsel=0xF)  # 0x8 for 8 samples average, 0xF for 16
-            self.data[key]['used_sensor']=self.sensor_temp_OMBE3
-        except:
-            pass
+        def open_chip():
+            sensor = MAX31856(hardware_spi=Adafruit_GPIO.SPI.SpiDev(getattr(CFG, bus + '_DEV'), getattr(CFG, chip)),
+                              tc_type=getattr(CFG, chip + '_temp_type'), avgsel=0xF)  # 0x8 for 8 samples average, 0xF for 16
+            if CFG.SPI_AUTO_CONVERSION:
+                sensor = thermocouple.MAX31856Auto(sensor)
+            return sensor
+        self.open_device(key, chip, open_chip, bus=bus, close=lambda chip: None)
 
     def _start_async(interval, check_lastrun=False):
-        # decorator to start function as thread
+        # decorator to run function on the worker pool after interval seconds
+        # calls while it is scheduled are dropped, with check_lastrun also calls within interval / 2 of the last one
         def decorator(func):
             @wraps(func)
             def wrapper(*args, **kwargs):
                 self = args[0]
-                if func.__name__ not in self.threads_running:
-                    self.threads_running[func.__name__] = {}
-                    self.threads_running[func.__name__]['lastrun'] = dt.datetime.now() - dt.timedelta(days=365 * 10)
-                run_thread = False
-                if 'thread' not in self.threads_running[func.__name__]:
-                    run_thread = True
-                elif not self.threads_running[func.__name__]['thread'].is_alive():
-                    if check_lastrun:
-                        if dt.datetime.now() - self.threads_running[func.__name__]['lastrun'] > dt.timedelta(seconds=interval / 2):
-                            run_thread = True
-                    else:
-                        run_thread = True
-
-                if run_thread:
-                    # we always need to create a new thread-object because threads cant be re-run
-                    self.threads_running[func.__name__]['lastrun'] = dt.datetime.now()
-                    self.threads_running[func.__name__]['thread'] = threading.Timer(interval, func, args=args, kwargs=kwargs)
-                    self.threads_running[func.__name__]['thread'].start()
+                min_interval = interval / 2 if check_lastrun else 0
+                self.workers.schedule(func.__name__, interval, func, args, kwargs, min_interval=min_interval)
             return wrapper
         return decorator
 
     def cancel_all_threads(self):
-        for name, tdict in self.threads_running:
-            if 'thread' in tdict:
-                if tdict['thread'].is_alive():
-                    tdict['thread'].cancel()
-
-    def read_maxigauge(self, key):
+        self.workers.shutdown()
+        self.serial_engine.stop()
+        if self.maxigauge_stream is not None:
+            self.maxigauge_stream.stop()
+        self.adc_sampler.stop()
+        self.log_writer.stop()
+        if self.archive_process is not None and self.archive_process.poll() is None:
+            # a day is replaced only when it is complete, it is compressed again next time
+            self.archive_process.terminate()
+        self.devices.close_all()
+
+    async def read_maxigauge(self, key):
         # controller returns something like 'x,x.xxxEsx <CR><LF>'
         # first digit is the error code, then comma, then pressure followed by Carrige return <CR>, Line feed <LF>
         # x,x.xxxEsx <CR><LF> x[Status],[x.xxxEsx] Measurement value (always engeneers' format)
         # 0 Measurement data okay, 1 Underrange, 2 Overrange
         # 3 Sensor error, 4 Sensor off, 5 No sensor, 6 Identification error
+        if self.maxigauge_stream is not None:
+            # continuous output: just take the latest frame
+            frame = self.maxigauge_stream.read(self.data[key]['sensor'])
+            if frame is None:
+                return -2000, -2000
+            return self.conv_to_decode[frame[0]], frame[1]
         if self.data[key]['used_sensor'] != None:
-            self.data[key]['used_sensor'].flushInput()
-            self.send_command(self.data[key]['used_sensor'],'PR%i\r\n' % self.data[key]['sensor'])  # request channel
-            self.send_command(self.data[key]['used_sensor'],'\x05')  # enquire data
-            #~ self.send_command('PR%i\r\n\x05' % (channel))  # request channel
-            start_time = time.time()
-            string_out = ''
-            while string_out == '':
-                if time.time()-start_time > 1:
-                    return -2000, -2000
-                try:
-                    string_out = self.read_port(self.data[key]['used_sensor'])
-                    if string_out == '':
-                        time.sleep(0.01)
-                        continue
-                    string_split = string_out.split(',')          # splits read string into string[-1],string[0]
-                    string_pres = str(string_split[1])            # pressure value converted to string
-                    string_sta = int(string_split[0][-1])         # status value converted to int
-                    pressure = float(string_pres)                 # float of pressure
-                    status = int(string_sta)                      # status as integer value
-                except ValueError:
-                    pass
-                except IndexError:
-                    pass
-                time.sleep(0.01)
+            sensor = self.data[key]['used_sensor']
+            async with self.serial_engine.transaction(sensor):
+                self.serial_engine.flush_input(sensor)
+                string_out = await self.read_port(sensor, 'PR%i\r\n' % self.data[key]['sensor'])  # request channel and enquire data
+            try:
+                string_split = string_out.split(',')          # splits read string into string[-1],string[0]
+                string_pres = str(string_split[1])            # pressure value converted to string
+                string_sta = int(string_split[0][-1])         # status value converted to int
+                pressure = float(string_pres)                 # float of pressure
+                status = int(string_sta)                      # status as integer value
+            except (ValueError, IndexError):
+                return -2000, -2000
             return self.conv_to_decode[status], pressure
         else:
             return -4000,-4000
 
-    def read_mvcgauge(self, key):
+    async def read_mvcgauge(self, key):
         # communication described in MVC - manual
         if self.data[key]['used_sensor'] != None:
+            sensor = self.data[key]['used_sensor']
             input_command = 'rpv{}\r'.format(self.data[key]['sensor']).encode('utf-8')             # encode as utf-8
             convinput = self.to_bytes(input_command)                                               # convert to byte sequence
-            self.data[key]['used_sensor'].write(convinput)                                         # send to wire
-            time.sleep(0.05)
-            out = ''                                                                               # string to hold the received message, empty one for new reading
-            out += self.data[key]['used_sensor'].readline().decode('utf-8',errors='ignore')
+            async with self.serial_engine.transaction(sensor):
+                self.serial_engine.flush_input(sensor)
+                self.serial_engine.write(sensor, convinput)                                        # send to wire
+                out = ''                                                                           # string to hold the received message, empty one for new reading
+                out += (await self.serial_engine.readline(sensor, timeout=0.5)).decode('utf-8',errors='ignore')
             try:
                 current=float(out.split(',')[1])
                 if out.split(',')[0] != '0':
@@ -360,16 +345,18 @@ class measure:
         else:
             return -4000,-4000
 
-    def read_ionpump(self, key):
+    async def read_ionpump(self, key):
         # communication described in Gamma Vacuum - manual
         # important here: use crossed-rs232 cabel
         if self.data[key]['used_sensor']!= None:
+            sensor = self.data[key]['used_sensor']
             input_command = '~ 05 0A 01 00\r'.encode('utf-8')             # encode as utf-8
             convinput = self.to_bytes(input_command)                   # convert to byte sequence
-            self.data[key]['used_sensor'].write(convinput)                                # send to wire
-            time.sleep(0.05)
-            out = ''                                            # string to hold the received message, empty one for new reading
-            out += self.data[key]['used_sensor'].readline().decode('utf-8',errors='ignore')
+            async with self.serial_engine.transaction(sensor):
+                self.serial_engine.flush_input(sensor)
+                self.serial_engine.write(sensor, convinput)                 # send to wire
+                out = ''                                            # string to hold the received message, empty one for new reading
+                out += (await self.serial_engine.readline(sensor, timeout=0.5)).decode('utf-8',errors='ignore')
             try:
                 current=float(out.split(' ')[3])
                 if out.split(' ')[1] != 'OK':
@@ -385,15 +372,16 @@ class measure:
         # Takes ascii string 'command' and converts it to bytes to send it over serial connection
         input_command = command.encode('utf-8')             # encode as utf-8
         convinput = self.to_bytes(input_command)                   # convert to byte sequence
-        sensor.write(convinput)                                # send to wire
-        time.sleep(0.05)
+        self.serial_engine.write(sensor, convinput)            # send to wire
 
-    def read_port(self, sensor):
+    async def read_port(self, sensor, command):
         # read port from maxigauges
-        # Reads serial port, gets bytes over wire, decodes them with utf-8 and returns string with received message
+        # sends command, waits for the acknowledge, enquires the data and returns string with received message
         out = ''                                            # string to hold the received message, empty one for new reading
-        out += sensor.readline().decode('utf-8')
-        out += sensor.readline().decode('utf-8')               # we have to read twice
+        self.send_command(sensor, command)
+        out += (await self.serial_engine.readline(sensor)).decode('utf-8', errors='ignore')    # acknowledge
+        self.send_command(sensor, '\x05')                   # enquire data
+        out += (await self.serial_engine.readline(sensor)).decode('utf-8', errors='ignore')
         return out
 
     def to_bytes(self, seq):
@@ -429,104 +417,158 @@ class measure:
             code = CFG.A_ON
         else:
             code = CFG.A_OFF
-        for t in range(NUM_ATTEMPTS):
-            self.lock.acquire()  # timing is critical
-            for i in code:
-                if i == '1':
-                    gpio.output(CFG.TRANSMIT_PIN, 1)
-                    self.sleep_precise(CFG.short_delay)
-                    gpio.output(CFG.TRANSMIT_PIN, 0)
-                    self.sleep_precise(CFG.long_delay)
-                elif i == '0':
-                    gpio.output(CFG.TRANSMIT_PIN, 1)
-                    self.sleep_precise(CFG.long_delay)
+        self.adc_sampler.pause()    # keep the i2c traffic away from the transmission
+        try:
+            for t in range(NUM_ATTEMPTS):
+                with self.lock:  # timing is critical
+                    for i in code:
+                        if i == '1':
+                            gpio.output(CFG.TRANSMIT_PIN, 1)
+                            self.sleep_precise(CFG.short_delay)
+                            gpio.output(CFG.TRANSMIT_PIN, 0)
+                            self.sleep_precise(CFG.long_delay)
+                        elif i == '0':
+                            gpio.output(CFG.TRANSMIT_PIN, 1)
+                            self.sleep_precise(CFG.long_delay)
+                            gpio.output(CFG.TRANSMIT_PIN, 0)
+                            self.sleep_precise(CFG.short_delay)
+                        else:
+                            continue
                     gpio.output(CFG.TRANSMIT_PIN, 0)
-                    self.sleep_precise(CFG.short_delay)
-                else:
-                    continue
-            gpio.output(CFG.TRANSMIT_PIN, 0)
-            self.lock.release()
-            self.sleep_precise(CFG.extended_delay)
-        gpio.cleanup()
+                self.sleep_precise(CFG.extended_delay)
+        finally:
+            # a failed transmission must not stop the analog channels
+            self.adc_sampler.resume()
+            gpio.cleanup()
 
     @_start_async(CFG.GRADIENT_RUNEVERY)
     def measure_gradient(self):
-        for key in self.data.keys():
-            self.gradient_data[self.gradient_data_current][key]['value'] = self.data[key]['value']
-        self.gradient_data_timestamp[self.gradient_data_current] = dt.datetime.now()
-        self.gradient_data_current += 1
-        if self.gradient_data_current >= self.gradient_data_num:
-            self.gradient_data_current = 0
+        for engine in self.gradients.values():
+            engine.update()
         self.update_values_gradient()
 
-    @_start_async(0.001)
-    def measure_values_maxigauge(self):
-        self.data_unreliable = collections.OrderedDict()
-        for key in self.data:
-            if self.data[key]['sensor_type'] == 'maxigauges':
-                self.data[key]['status'], self.data[key]['value'] = self.read_maxigauge(key)
-
-    @_start_async(0.001)
-    def measure_values_ionpumps(self):
-        self.data_unreliable = collections.OrderedDict()
-        for key in self.data:
-            if self.data[key]['sensor_type'] in ['ser_ion_cryo','ser_ion_prep','ser_ion_stm']:
-                self.data[key]['status'], self.data[key]['value'] = self.read_ionpump(key)
-
-    @_start_async(0.001)
-    def measure_values_mvc_gauge_prep(self):
-        if not self.ser_mvc_prep.is_open:
-            self.init_serial_mvc_prep()
-
-        self.data_unreliable = collections.OrderedDict()
+    def publish(self, records):
+        # new measurements (key -> snapshot.Record) for the readers and the history
+        self.history.append_records(records)
+        self.snapshots.publish(records)
+
+    async def read_serial(self, key):
+        # read one channel of a serial device
+        sensor_type = self.data[key]['sensor_type']
+        if sensor_type == 'maxigauges':
+            read = self.read_maxigauge
+        elif sensor_type in ['mvc_prep', 'mvc_stm']:
+            read = self.read_mvcgauge
+        else:
+            read = self.read_ionpump
+        t = time.perf_counter()
+        result = await read(key)
+        self.metric_read_time.observe(time.perf_counter() - t, read.__name__)
+        self.metric_reads.inc(sensor_type)
+        return result
+
+    async def feed_maxigauge_stream(self):
+        # wait for the next frame of the continuous output
+        line = await self.serial_engine.readline(self.ser_maxi, timeout=self.maxigauge_stream.timeout)
+        self.maxigauge_stream.feed(line)
+
+    async def loop_maxigauge_stream(self):
+        while self.serial_engine.running:
+            await self.feed_maxigauge_stream()
+
+    async def measure_channel_serial(self, key):
+        status, value = await self.read_serial(key)
+        return snapshot.Record(value, status, False, time.time())
+
+    async def update_channel_serial(self, key):
+        # read one channel and publish it on its own
+        self.publish({key: await self.measure_channel_serial(key)})
+
+    async def measure_values_serial(self, sensor_type):
+        # read all channels of one serial device, published together
+        if sensor_type == 'maxigauges' and self.maxigauge_stream is not None:
+            await self.feed_maxigauge_stream()
+        records = {}
         for key in self.data:
-            if self.data[key]['sensor_type'] == 'mvc_prep':
-                self.data[key]['status'], self.data[key]['value'] = self.read_mvcgauge(key)
+            if self.data[key]['sensor_type'] == sensor_type:
+                records[key] = await self.measure_channel_serial(key)
+        self.publish(records)
 
-    @_start_async(0.001)
-    def measure_values_mvc_gauge_stm(self):
-        if not self.ser_mvc_stm.is_open:
-            self.init_serial_mvc_stm()
+    async def measure_values_serial_all(self):
+        # one reading of all serial devices, devices are read concurrently
+        await asyncio.gather(*[self.measure_values_serial(t) for t in self.sensor_types if t in self.serial_types])
 
-        self.data_unreliable = collections.OrderedDict()
-        for key in self.data:
-            if self.data[key]['sensor_type'] == 'mvc_stm':
-                self.data[key]['status'], self.data[key]['value'] = self.read_mvcgauge(key)
+    async def loop_values_serial(self, sensor_type):
+        # read one serial device for as long as the engine runs
+        while self.serial_engine.running:
+            await self.measure_values_serial(sensor_type)
+            if sensor_type != 'maxigauges' or self.maxigauge_stream is None:
+                await asyncio.sleep(self.main_loop_time)
 
     @_start_async(0.001)
     def measure_values_analog(self):
-        self.data_unreliable = collections.OrderedDict()
+        records = {}
+        for key in self.data:
+            if self.data[key]['sensor_type'] in self.analog_types:
+                records[key] = self.measure_channel_analog(key)
+        self.publish(records)
+
+    def measure_channel_analog(self, key):
+        t = time.perf_counter()
+        value, status, unreliable = self.read_analog(key)
+        self.metric_read_time.observe(time.perf_counter() - t, 'read_analog')
+        self.metric_reads.inc(self.data[key]['sensor_type'])
+        return snapshot.Record(value, status, unreliable, time.time())
+
+    def update_channel_analog(self, key):
+        self.publish({key: self.measure_channel_analog(key)})
+
+    def init_scheduler(self):
+        # every channel is read when its deadline comes up, see poll_interval and priority in the config
+        self.scheduler = scheduler.Scheduler(self.serial_engine.loop)
         for key in self.data:
-            if self.data[key]['sensor_type'] in ['ADC_diods', 'SPI0', 'SPI1', 'ADC_resistor']:
-                self.data[key]['value'], self.data[key]['status'], self.data_unreliable[key] = self.read_analog(key)
+            interval = self.data[key].get('poll_interval', self.main_loop_time_normal)
+            priority = self.data[key].get('priority', 0)
+            if self.data[key]['sensor_type'] in self.serial_types:
+                self.scheduler.add(key, interval, lambda key=key: self.update_channel_serial(key), priority)
+            elif self.data[key]['sensor_type'] in self.analog_types:
+                self.scheduler.add(key, interval, lambda key=key: self.update_channel_analog(key), priority, blocking=True)
+        if self.maxigauge_stream is not None:
+            self.serial_engine.spawn(self.loop_maxigauge_stream())
+        self.serial_engine.spawn(self.scheduler.run())
+        self.scheduler_report_time = time.time()
 
 
     def read_analog(self, key):
         # measure values from adc chips and temperature chips
-        measurement_points = 15
+        measurement_points = CFG.ADC_AVERAGE
         extra_feature_multi = np.zeros(measurement_points)
         val_unreliable = False
-        for cycle in range(measurement_points):
-            # average over several values (measurement_points)
-            if self.data[key]['sensor_type'] in ['ADC_diods','ADC_resistor']:
-                # ADC chip
-                if self.data[key]['used_sensor'] is None:
-                    extra_feature_multi[cycle] = -4000
-                else:
-                    try:
-                        extra_feature_multi[cycle] = self.data[key]['used_sensor'].read_volts(channel=self.data[key]['sensor'], gain=2)
-                    except:
-                        extra_feature_multi[cycle] = -4000
-            elif self.data[key]['sensor_type'] in ['SPI0', 'SPI1']:
-                # temperatuer chip
+        if self.data[key]['sensor_type'] in ['ADC_diods','ADC_resistor']:
+            # ADC chip, average over the latest samples of the background sampler
+            if self.data[key]['used_sensor'] is None:
+                extra_feature_multi[:] = -4000
+            else:
+                extra_feature_multi = self.adc_sampler.last(key, measurement_points)
+                if len(extra_feature_multi) == 0:
+                    extra_feature_multi = np.array([-4000.0])
+        elif self.data[key]['sensor_type'] in ['SPI0', 'SPI1']:
+            # temperatuer chip
+            if CFG.SPI_AUTO_CONVERSION:
+                # chip converts and averages continuously, take its latest result
+                extra_feature_multi = np.zeros(1)
+            for cycle in range(len(extra_feature_multi)):
+                # average over several values (measurement_points)
                 if key == 'TLAB':
                     try:
-                        extra_feature_multi[cycle] = self.data[key]['used_sensor'].read_internal_temp_c()
+                        with self.handles[key].lock:
+                            extra_feature_multi[cycle] = self.data[key]['used_sensor'].read_internal_temp_c()
                     except:
                         extra_feature_multi[cycle] = -4000
                 else:
                     try:
-                        extra_feature_multi[cycle] = self.data[key]['used_sensor'].read_temp_c()
+                        with self.handles[key].lock:
+                            extra_feature_multi[cycle] = self.data[key]['used_sensor'].read_temp_c()
                     except:
                         extra_feature_multi[cycle] = -4000
         if min(extra_feature_multi) <= -1000:
@@ -582,12 +624,14 @@ class measure:
     def update_values(self):
         # update label values in GUI
         values = {}
+        latest = self.snapshots.latest()
         for key in self.data:
-            if int(self.data[key]['value']) in self.decoding_dict.keys():
-                values[key] = self.decoding_dict[self.data[key]['value']]
+            record = latest[key]
+            if int(record.value) in self.decoding_dict.keys():
+                values[key] = self.decoding_dict[record.value]
             else:
-                values[key] = '{0: {1}}'.format(float(self.data[key]['value']), self.data[key]['format'])
-                if key in self.data_unreliable and self.data_unreliable[key] is not False:
+                values[key] = '{0: {1}}'.format(float(record.value), self.data[key]['format'])
+                if record.unreliable is not False:
                     values[key] += '*'
         for key in values:
             values[key] = '{0: >10}'.format(values[key])
@@ -597,23 +641,32 @@ class measure:
     def update_values_gradient(self):
         # update gradient values in GUI
         values = {}
+        latest = self.snapshots.latest()
         for key in self.data:
             if self.data[key]['gui_size'] < 2:
                 continue
             values[key] = '-'
-            now = dt.datetime.now()
-            if int(self.data[key]['value']) in self.decoding_dict.keys():
+            value = latest[key].value
+            if int(value) in self.decoding_dict.keys():
                 continue
-            yvalues = [gdata[key]['value'] if int(gdata[key]['value']) not in self.decoding_dict.keys() else np.nan for gdata in self.gradient_data]
-            xvalues = [(gtime-now).seconds for gtime in self.gradient_data_timestamp]
-            if np.nan not in yvalues:
-                k = np.polyfit(xvalues, yvalues, 1)[0] * CFG.GRADIENT_SHOW
-                if np.abs(k/self.data[key]['value']) > 1e-3:
+            k = self.gradients[key].slope(CFG.GRADIENT)
+            if k is not None:
+                k *= CFG.GRADIENT_SHOW
+                if np.abs(k/value) > 1e-3:
                     values[key] = '{0: {1}}'.format(k, self.data[key]['format_gradient'])
         for key in values:
             values[key] = '{0:^6}'.format(values[key])
         self.gui.update_values_gradient(values)
 
+    @_start_async(CFG.SPARKLINE_RUNEVERY)
+    def update_sparklines(self):
+        columns = {}
+        for key, decimator in self.sparklines.items():
+            decimator.update()
+            if decimator.last is not None:
+                columns[key] = decimator.columns()
+        self.gui.update_sparklines(columns)
+
     @_start_async(0.1, check_lastrun=True)
     def measure_helium(self):
         # measure helium
@@ -625,6 +678,8 @@ class measure:
                 self.helium_check = True
                 self.helium_save = False
                 self.heliums = []
+                if 'LHE' in self.adc_sampler.buffers:
+                    self.helium_sample_count = self.adc_sampler.buffers['LHE'].count
                 self.main_loop_time = self.main_loop_time_slow
                 time.sleep(0.8)
                 self.transmit_outlet_code(turn_on=True)
@@ -650,16 +705,12 @@ class measure:
                 helium = -3000
                 self.helium_save = True
                 print('Helium check: timeout.')
-            elif self.t_hchk2 - self.t_hchk1 > 5:
-                for i in range(5):
-                    # print(self.adc[0].volts * 1000.0 / 2.0)
-                    try:
-                        helium = self.adc[0].volts * 1000.0 / 2.0
-                    except Exception:
-                        pass
-                    finally:
-                        if helium > 0:
-                            self.heliums.append(helium)
+            elif self.t_hchk2 - self.t_hchk1 > 5 and 'LHE' in self.adc_sampler.buffers:
+                # take all samples of the helium channel since the last pass
+                samples, self.helium_sample_count = self.adc_sampler.buffers['LHE'].since(self.helium_sample_count)
+                for helium in samples * 1000.0 / 2.0:
+                    if helium > 0:
+                        self.heliums.append(helium)
         if self.helium_save:
             # save helium level to log
             now = dt.datetime.now()
@@ -681,7 +732,13 @@ class measure:
             self.display_helium_now()
         if self.helium_turn_sensor_off:
             time.sleep(2 ** self.helium_turn_sensor_off_retries)
-            if self.adc[0].volts < 0.02:  # baseline should be below this
+            samples = self.adc_sampler.last('LHE', 5) if 'LHE' in self.adc_sampler.buffers else []
+            baseline = np.max(samples) if len(samples) > 0 else -4000
+            if baseline <= -1000:
+                # no samples of the helium channel, the sensor cannot be checked
+                self.helium_turn_sensor_off = False
+                print('Helium check: finished, sensor not checked: {}.'.format(self.decoding_dict[baseline]))
+            elif baseline < 0.02:  # baseline should be below this
                 self.helium_turn_sensor_off = False
                 print('Helium check: finished and sensor off.')
             else:
@@ -694,11 +751,11 @@ class measure:
 
     @_start_async(0.001)  # but it is not in the main loop
     def read_helium_from_log(self):
-        data = self.measure_getlast()
-        if data is not None and data.shape[0] > 0:
-            date_last_measured = data.tail(1).index.to_pydatetime()[0]
-            column_name = 'LHE[mm]'
-            value = float(data.tail(1)[column_name])
+        last = self.measure_getlast()
+        if last is not None:
+            date_last_measured, value = last
+        else:
+            date_last_measured, value = dt.datetime.now(), -4000
         self.helium_status['date_last_measured'] = date_last_measured
         self.helium_status['value'] = value
         self.display_helium_now()
@@ -717,7 +774,7 @@ class measure:
         else:
             str_value = '{:.0f}'.format(value)
         str_out = "LHe: {} mm ({})".format(str_value, self.date_format_bot(date_last_measured))
-        gui.update_helium(str_out) # forward helium lavel value to gui
+        self.gui.update_helium(str_out) # forward helium lavel value to gui
 
     def date_format_bot(self, this_date):
         # returns a formatted date according to the config
@@ -726,87 +783,54 @@ class measure:
         else:
             return this_date.strftime(CFG.date_fmt_display_he)
 
-    def str2date(self, x):
-        # convert string from log to datetime object
-        return dt.datetime(int(x[0:4]), int(x[5:7]), int(x[8:10]), int(x[11:13]), int(x[14:16]), int(x[17:19]))
-
     def measure_getlast(self):
-        # reads last log entries for a specific measure entity
-        helium_log = os.getcwd() + dt.datetime.now().strftime(CFG.HELIUM_LOG)
-        df = pd.DataFrame()
-        try:
-            df = pd.read_csv(helium_log,
-                             sep='\t',
-                             comment='#',
-                             parse_dates=True,
-                             date_parser=self.str2date,
-                             index_col=0,
-                             dtype=np.float,
-                             error_bad_lines=False)
-        except pd.errors.EmptyDataError:
-            return None
-        return df[-1:]
-
-    def check_day(self):
-        self.pressurelogfile_name = dt.datetime.now().strftime(os.getcwd() + CFG.PRESSURE_LOGS)
-        return(os.path.isfile(self.pressurelogfile_name))
-
-    def save_header_to_log(self):
-        if not self.check_day():  # write header if logfile doesnt exist
-            self.log_writing_header = True
-            header = 'Time\t'
-            for key in self.data:
-                if self.data[key]['log_to_file']:
-                    header += '{0}[{1}]\t'.format(key, self.data[key]['unit'])
-            header = header[:-1] + '\n'
-
-            os.makedirs(os.path.dirname(self.pressurelogfile_name), exist_ok=True)
-            with open(self.pressurelogfile_name, "a") as logfile:
-                logfile.write(header)
-            self.log_writing_header = False
+        # (date, level) of the last helium measurement, from the log of this or of last year
+        now = dt.datetime.now()
+        for date in [now, now.replace(year=now.year - 1, month=1, day=1)]:
+            records = tail.last_records(os.getcwd() + date.strftime(CFG.HELIUM_LOG), 1, CFG.date_fmt)
+            if records:
+                date_last_measured, values = records[-1]
+                return date_last_measured, values[0]
+        return None
 
     @_start_async(2, check_lastrun=True)
     def save_to_log(self):
-        self.save_header_to_log()
-        formattedData = [''] * len(self.data)
-        for n, key in enumerate(self.data):
-            if not self.data[key]['log_to_file']:
-                continue
-            if isinstance(self.data[key]['value'], str):
-                formattedData[n] = '%s' % self.data[key]['value']
-            else:
-                formattedData[n] = '{0: {1}}'.format(float(self.data[key]['value']), self.data[key]['format'])
-        with open(self.pressurelogfile_name, "a") as logfile:
-            logfile.write("%s\t" % dt.datetime.now().strftime(CFG.date_fmt) + "\t".join(formattedData) + "\n")
-        self.thread_save_to_log_running = False
+        # formatted and written by the log writer, files and headers are handled there
+        self.log_writer.put(time.time(), self.snapshots.latest())
+
+    @_start_async(CFG.ROLLUP_RUNEVERY)
+    def update_rollup(self):
+        # the backfill of an archive runs in steps of ROLLUP_BUDGET seconds
+        self.rollup.update(budget=CFG.ROLLUP_BUDGET)
+
+    @_start_async(CFG.ARCHIVE_RUNEVERY)
+    def archive_logs(self):
+        if self.archive_process is None or self.archive_process.poll() is not None:
+            self.archive_process = archive.start(os.getcwd() + CFG.PRESSURE_LOGS, CFG.date_fmt, CFG.ARCHIVE_KEEP_DAYS)
 
     @_start_async(1, check_lastrun=True)
     def sanity_checks(self):
         # checks for values exceeding limits and initialize warning
+        latest = self.snapshots.latest()
         for key, ddict in self.data.items():
             if 'limit_max' in ddict:
-                if ddict['value'] > ddict['limit_max']:
+                if latest[key].value > ddict['limit_max']:
                     self.gui.warning(key, 'Warning: {}'.format(ddict['limit_max_warning']), key)
                 else:
                     self.gui.dewarning(key)
 
     def thread_main_loop_sensors_start(self):
-        self.thread_main_loop_sensors = threading.Timer(self.main_loop_time, self.main_loop_sensors)
-        self.thread_main_loop_sensors.start()
+        self.workers.schedule('main_loop_sensors', self.main_loop_time, self.main_loop_sensors)
 
     def main_loop_sensors(self):
         # measurement
 
-        if ('ADC_diods' in self.sensor_types) or ('ADC_resistor' in self.sensor_types) or ('temp_chip' in self.sensor_types):
-            self.measure_values_analog()
-        if 'maxigauges' in self.sensor_types:
-            self.measure_values_maxigauge()
-        if 'mvc_prep' in self.sensor_types:
-            self.measure_values_mvc_gauge_prep()
-        if 'mvc_stm' in self.sensor_types:
-            self.measure_values_mvc_gauge_stm()
-        if ('ser_ion_prep' in self.sensor_types) or ('ser_ion_cryo' in self.sensor_types) or ('ser_ion_stm' in self.sensor_types):
-            self.measure_values_ionpumps()
+        if self.scheduler is None:
+            if ('ADC_diods' in self.sensor_types) or ('ADC_resistor' in self.sensor_types) or ('temp_chip' in self.sensor_types):
+                self.measure_values_analog()
+        elif CFG.SCHEDULER_REPORT and time.time() - self.scheduler_report_time > CFG.SCHEDULER_REPORT:
+            print('\n'.join(self.scheduler.report()))
+            self.scheduler_report_time = time.time()
         if CFG.HELIUM != None:
             self.measure_helium()
 
@@ -815,15 +839,22 @@ class measure:
 
         # display
         self.update_values()
+        if self.sparklines:
+            self.update_sparklines()
         if CFG.HELIUM != None:
             self.display_helium()
 
         # log
         self.save_to_log()
+        if self.rollup is not None:
+            self.update_rollup()
+        if CFG.ARCHIVE_KEEP_DAYS is not None:
+            self.archive_logs()
 
         # sanity checks and warnings
         self.sanity_checks()
 
+        self.metric_loop_period.observe(time.time() - self.time_loop)
         if CFG.FPS_SHOW:
             self.fps = ' fps:{:4.1f}'.format(1 / (time.time() - self.time_loop))
         self.time_loop = time.time()
@@ -836,32 +867,26 @@ class measure:
     def main_loop_init(self):
         # if loop runs for the first time
         print('Reading initial sensor data.')
+        self.adc_sampler.wait(CFG.ADC_AVERAGE, timeout=5)
         if ('ADC_diods' in self.sensor_types) or ('ADC_resistor' in self.sensor_types) or ('temp_chip' in self.sensor_types):
             self.measure_values_analog()
-        if 'maxigauges' in self.sensor_types:
-            self.measure_values_maxigauge()
-        if 'mvc_prep' in self.sensor_types:
-            self.measure_values_mvc_gauge_prep()
-        if 'mvc_stm' in self.sensor_types:
-            self.measure_values_mvc_gauge_stm()
-        if ('ser_ion_prep' in self.sensor_types) or ('ser_ion_cryo' in self.sensor_types) or ('ser_ion_stm' in self.sensor_types):
-            self.measure_values_ionpumps()
         if CFG.HELIUM != None:
             self.read_helium_from_log()
 
         # wait for the first measurements
+        self.serial_engine.run(self.measure_values_serial_all())
         if ('ADC_diods' in self.sensor_types) or ('ADC_resistor' in self.sensor_types) or ('temp_chip' in self.sensor_types):
-            self.threads_running['measure_values_analog']['thread'].join()
-        if 'maxigauges' in self.sensor_types:
-            self.threads_running['measure_values_maxigauge']['thread'].join()
-        if 'mvc_prep' in self.sensor_types:
-            self.threads_running['measure_values_mvc_gauge_prep']['thread'].join()
-        if 'mvc_stm' in self.sensor_types:
-            self.threads_running['measure_values_mvc_gauge_stm']['thread'].join()
-        if ('ser_ion_prep' in self.sensor_types) or ('ser_ion_cryo' in self.sensor_types) or ('ser_ion_stm' in self.sensor_types):
-            self.threads_running['measure_values_ionpumps']['thread'].join()
-
-        # self.threads_running['read_helium_from_log']['thread'].join()
+            self.workers.wait('measure_values_analog')
+
+        if CFG.SCHEDULER_PROFILE == 'deadline':
+            self.init_scheduler()
+        else:
+            # single rate: serial devices keep reading on the event loop, analog values with every main loop
+            for sensor_type in self.sensor_types:
+                if sensor_type in self.serial_types:
+                    self.serial_engine.spawn(self.loop_values_serial(sensor_type))
+
+        # self.workers.wait('read_helium_from_log')
 
         print('Starting main loop.')
         global APP_RUNNING
@@ -872,8 +897,46 @@ class measure:
 if __name__ == '__main__':
     print('Initializing measurement system.')
     msr = measure()
-    print('Initializing GUI.')
-    gui = GUI.initGUI()
-    msr.init_labels(gui)
-    gui.root.after(10, msr.main_loop_init)
-    gui.startApp()
+    if CFG.HTTP_STATUS_PORT is not None:
+        channels = {key: (msr.data[key]['unit'], msr.data[key]['format']) for key in msr.data}
+        http_status.StatusServer(msr.snapshots, channels, msr.decoding_dict, host=CFG.HTTP_STATUS_HOST,
+                                 port=CFG.HTTP_STATUS_PORT, interval=CFG.HTTP_STATUS_INTERVAL,
+                                 metrics=msr.metrics).start()
+        print('Serving status on {}:{}.'.format(CFG.HTTP_STATUS_HOST or '*', CFG.HTTP_STATUS_PORT))
+    if CFG.HEADLESS or '--headless' in sys.argv[1:]:
+        # no window, the values are served over HTTP
+        if CFG.HTTP_STATUS_PORT is None:
+            print('Headless without HTTP_STATUS_PORT: the values are only logged.')
+        msr.init_labels(http_status.NoGUI())
+        msr.main_loop_init()
+        try:
+            while APP_RUNNING:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        APP_RUNNING = False
+        msr.workers.wait('main_loop_sensors', timeout=10)
+        msr.cancel_all_threads()
+    elif CFG.GUI_SEPARATE_PROCESS:
+        print('Initializing GUI.')
+        # window runs in its own process, this one only measures and logs
+        gui = gui_process.GUIProxy()
+        gui.start()
+        msr.init_labels(gui)
+        msr.main_loop_init()
+        gui.wait_closed()
+        APP_RUNNING = False
+        msr.workers.wait('main_loop_sensors', timeout=10)
+        msr.cancel_all_threads()
+    else:
+        print('Initializing GUI.')
+        import GUI          # GUI for visualization and interaction on screen, tkinter only if needed
+        gui = GUI.initGUI()
+        msr.init_labels(gui)
+        gui.root.after(10, msr.main_loop_init)
+        gui.startApp()
+        # window closed: the last pass of the main loop stops the threads, or nothing does if
+        # the window closed before the loop started
+        APP_RUNNING = False
+        msr.workers.wait('main_loop_sensors', timeout=10)
+        msr.cancel_all_threads()
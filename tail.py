@@ -0,0 +1,113 @@
+# last records of a log file
+#
+# Reads blocks backwards from the end of the file until enough valid records are found, so
+# the time does not depend on the size of the log. Lines which cannot be parsed (header,
+# comments, ...) are skipped. The text after the last newline is a row still being written or
+# cut off by a crash and is never parsed, a cut off value could parse as a wrong one. Works
+# for the helium log as well as for the pressure logs.
+#
+# run this file directly for a comparison with parsing the whole file on synthetic logs
+
+import datetime as dt
+import os
+
+BLOCK_SIZE = 4096
+
+
+def parse_row(date_fmt):
+    # parser for tab separated rows: time, then values; returns (datetime, [values])
+    def parse(line):
+        fields = line.split('\t')
+        values = [float(field) for field in fields[1:] if field.strip()]
+        if not values:
+            raise ValueError('no values')
+        return dt.datetime.strptime(fields[0], date_fmt), values
+    return parse
+
+
+def tail(path, n=1, parse=None, comment='#', block_size=BLOCK_SIZE):
+    # last n records of the file, oldest first, parse(line) raises ValueError for invalid lines
+    records = []
+    if not os.path.isfile(path):
+        return records
+
+    def add(line):
+        line = line.decode(errors='replace').rstrip('\r')
+        if not line.strip() or line.startswith(comment):
+            return
+        try:
+            records.append(parse(line) if parse is not None else line)
+        except ValueError:
+            pass
+
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        rest = b''
+        partial = True          # no newline found yet, the text so far is not a complete row
+        while position > 0 and len(records) < n:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + rest).split(b'\n')
+            rest = lines[0]     # might start in the previous block
+            if partial:
+                if len(lines) == 1:
+                    continue
+                lines.pop()
+                partial = False
+            for line in reversed(lines[1:]):
+                add(line)
+                if len(records) >= n:
+                    break
+        if position == 0 and len(records) < n and not partial:
+            add(rest)
+    return records[::-1]
+
+
+def last_records(path, n, date_fmt):
+    # last n rows of a log as (datetime, [values])
+    return tail(path, n, parse_row(date_fmt))
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    import time
+
+    date_fmt = '%Y-%m-%d_%H:%M:%S'
+    directory = tempfile.mkdtemp()
+
+    def full_parse(path):
+        # what reading the whole log does: parse every row, keep the last one
+        parse = parse_row(date_fmt)
+        last = None
+        with open(path) as f:
+            for line in f:
+                try:
+                    last = parse(line.rstrip('\n'))
+                except ValueError:
+                    pass
+        return last
+
+    # helium log with a row every hour, pressure log with a row every 2 s
+    for name, step, lengths, columns in [('helium', 3600, [365, 730, 1825, 3650], 1), ('pressure', 2, [1], 8)]:
+        for days in lengths:
+            path = os.path.join(directory, '{}-{}.log'.format(name, days))
+            t = time.time() - days * 86400
+            with open(path, 'w') as f:
+                f.write('Time\t' + '\t'.join('C{}[mm]'.format(i) for i in range(columns)) + '\n')
+                for i in range(int(days * 86400 / step)):
+                    f.write(time.strftime(date_fmt, time.localtime(t + i * step)) +
+                            '\t 123.4' * columns + '\n')
+                f.write('2026-10-1')    # cut off by a crash
+            t = time.time()
+            expected = full_parse(path)
+            t_full = time.time() - t
+            t = time.time()
+            for _ in range(100):
+                last = last_records(path, 1, date_fmt)[-1]
+            t_tail = (time.time() - t) / 100
+            assert last == expected
+            print('{:8s} log of {:4d} days ({:4.1f} MB): whole file {:6.1f} ms, tail {:5.3f} ms'.format(
+                name, days, os.path.getsize(path) / 2 ** 20, 1000 * t_full, 1000 * t_tail))
+    shutil.rmtree(directory)
@@ -0,0 +1,85 @@
+# python -m pytest test_adc_sampler.py
+
+import time
+
+import numpy as np
+
+import adc_sampler
+
+
+def expected(channel, first, n):
+    # volts of the conversions number first to first + n - 1 of the fake adc
+    return channel + 0.001 * np.arange(first, first + n)
+
+
+def test_ring_buffer():
+    buffer = adc_sampler.RingBuffer(8)
+    assert len(buffer.last(5)) == 0
+    for i in range(5):
+        buffer.append(i)
+    assert buffer.last(3).tolist() == [2, 3, 4]
+    assert buffer.last(10).tolist() == [0, 1, 2, 3, 4]
+    for i in range(5, 13):
+        buffer.append(i)
+    # wrapped around, only the latest 8 are kept
+    assert buffer.last(3).tolist() == [10, 11, 12]
+    assert buffer.last(100).tolist() == list(range(5, 13))
+    samples, count = buffer.since(10)
+    assert samples.tolist() == [10, 11, 12] and count == 13
+    samples, count = buffer.since(count)
+    assert len(samples) == 0 and count == 13
+
+
+def test_sampler_with_fake_adc():
+    adc = adc_sampler.FakeADS1115(i2c_time=0)
+    sampler = adc_sampler.ADCSampler(data_rate=8600, size=64)
+    sampler.add_channel('TSTM', adc, 0)
+    sampler.add_channel('TMAN', adc, 1)
+    sampler.start()
+    try:
+        assert sampler.wait(100, timeout=5)
+        sampler.pause()
+        time.sleep(0.01)
+        # every channel is sampled once per scan, in scan order
+        counts = [sampler.buffers[name].count for name in ('TSTM', 'TMAN')]
+        assert counts[0] == counts[1] >= 100
+        for name, channel in (('TSTM', 0), ('TMAN', 1)):
+            count = sampler.buffers[name].count
+            assert np.allclose(sampler.last(name, 10), expected(channel, count - 10, 10))
+            # the buffer keeps the latest 64 samples
+            assert np.allclose(sampler.last(name, 1000), expected(channel, count - 64, 64))
+        # paused: no new samples
+        assert sampler.buffers['TSTM'].count == counts[0]
+        sampler.resume()
+        assert sampler.wait(5, timeout=5)
+        samples, count = sampler.buffers['TSTM'].since(counts[0])
+        assert count >= counts[0] + 5
+        assert np.allclose(samples, expected(0, counts[0], count - counts[0]))
+    finally:
+        sampler.stop()
+
+
+def test_failed_conversions():
+    class BrokenADC:
+        def read_volts(self, channel, gain=1, data_rate=128):
+            raise OSError('i2c error')
+
+    sampler = adc_sampler.ADCSampler(size=16)
+    sampler.add_channel('TCRY', BrokenADC(), 2)
+    sampler.start()
+    try:
+        assert sampler.wait(3, timeout=5)
+        assert np.all(sampler.last('TCRY', 3) == adc_sampler.ERROR_VALUE)
+    finally:
+        sampler.stop()
+
+
+def test_stop_while_paused():
+    sampler = adc_sampler.ADCSampler(data_rate=8600)
+    sampler.add_channel('TSTM', adc_sampler.FakeADS1115(i2c_time=0), 0)
+    sampler.start()
+    assert sampler.wait(1, timeout=5)
+    sampler.pause()
+    thread = sampler.thread
+    sampler.stop()
+    assert not thread.is_alive()
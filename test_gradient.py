@@ -0,0 +1,81 @@
+# python -m pytest test_gradient.py
+
+import numpy as np
+
+import gradient
+import history
+
+SENTINELS = [-4000, -3000, -2000, -1000, -5000]
+WINDOWS = (30, 300, 3600)
+TOLERANCE = 1e-6        # relative to the slope, at least 1 ppb/s of the value for flat curves
+
+
+def pump_down(seconds, rate=10, seed=1):
+    # pressure with noise and sensor dropouts, like the __main__ comparison
+    random = np.random.RandomState(seed)
+    t = 1.7e9 + np.arange(0, seconds, 1 / rate)
+    p = 1e-9 * (1 + 50 * np.exp(-(t - t[0]) / 2000)) * (1 + 0.02 * random.randn(len(t)))
+    p[random.random_sample(len(t)) < 0.001] = -4000
+    return t, p
+
+
+def deviation(engine, channel, seconds, log):
+    reference = gradient.polyfit_slope(channel, seconds, SENTINELS, log)
+    slope = engine.slope(seconds)
+    assert (slope is None) == (reference is None)
+    if reference is None:
+        return 0.0
+    scale = max(abs(reference), 1e-9 * abs(channel.last(1)[1][0]))
+    return abs(slope - reference) / scale
+
+
+def compare(log, capacity, steps, **options):
+    # max relative deviation from np.polyfit for every window, checked after every step
+    t, p = pump_down(2 * 3600)
+    channel = history.ChannelHistory(capacity)
+    engine = gradient.GradientEngine(channel, WINDOWS, SENTINELS, log=log, **options)
+    worst = {seconds: 0.0 for seconds in WINDOWS}
+    start = 0
+    for end in steps:
+        for i in range(start, end):
+            channel.append(t[i], p[i], 0)
+        start = end
+        engine.update()
+        for seconds in WINDOWS:
+            worst[seconds] = max(worst[seconds], deviation(engine, channel, seconds, log))
+    return worst
+
+
+def test_linear_space():
+    steps = list(range(10, 2000, 10)) + list(np.linspace(2000, 72000, 40).astype(int))
+    for seconds, worst in compare(False, 72000, steps).items():
+        assert worst < TOLERANCE, seconds
+
+
+def test_log_space():
+    steps = list(range(10, 2000, 10)) + list(np.linspace(2000, 72000, 40).astype(int))
+    for seconds, worst in compare(True, 72000, steps).items():
+        assert worst < TOLERANCE, seconds
+
+
+def test_one_sample_at_a_time():
+    # many small updates, old samples leave the windows one by one
+    for seconds, worst in compare(True, 72000, range(35000, 35300), recompute=100000).items():
+        assert worst < TOLERANCE, seconds
+
+
+def test_history_shorter_than_window():
+    # the 1 h window only sees what is left in a 20 min history, samples are missed between updates
+    steps = list(np.linspace(1000, 72000, 30).astype(int))
+    for seconds, worst in compare(False, 12000, steps).items():
+        assert worst < TOLERANCE, seconds
+
+
+def test_too_few_samples():
+    channel = history.ChannelHistory(100)
+    engine = gradient.GradientEngine(channel, WINDOWS, SENTINELS)
+    channel.append(1.7e9, 1e-9, 0)
+    channel.append(1.7e9 + 0.1, -4000, 0)
+    engine.update()
+    assert engine.slope(30) is None
+    assert gradient.polyfit_slope(channel, 30, SENTINELS) is None
@@ -0,0 +1,51 @@
+# python -m pytest test_maxigauge.py
+
+import time
+
+import maxigauge
+
+
+def test_parse_frame():
+    assert maxigauge.parse_frame(b'0,1.0000E-09,1,2.5000E-03\r\n') == [(0, 1e-9), (1, 2.5e-3)]
+    assert maxigauge.parse_frame(maxigauge.ACK + b'\r\n') is None
+    assert maxigauge.parse_frame(b'0,1.0000E-09,1') is None       # partial line
+    assert maxigauge.parse_frame(b'0,1.00#0E-09\r\n') is None
+
+
+def test_stream_from_fake_controller():
+    # continuous output every 100 ms: every channel is updated with every frame
+    ser = maxigauge.open_fake()
+    stream = maxigauge.MaxigaugeStream(ser, maxigauge.INTERVAL_100MS)
+    try:
+        assert stream.start()
+        latencies = {channel: [] for channel in range(1, maxigauge.NUM_CHANNELS + 1)}
+        t_end = time.time() + 1.5
+        while time.time() < t_end:
+            assert stream.wait_frame(timeout=0.5)
+            for channel in latencies:
+                if channel in stream.latency:
+                    latencies[channel].append(stream.latency[channel])
+        assert stream.frame_count >= 10
+        for channel, values in latencies.items():
+            # the fake reads 1e-9 * channel mbar with 1 % noise
+            status, pressure = stream.read(channel)
+            assert status == 0
+            assert 1e-9 * channel <= pressure <= 1.01e-9 * channel
+            interval = maxigauge.INTERVAL_SECONDS[maxigauge.INTERVAL_100MS]
+            assert len(values) >= 8
+            assert 0.5 * interval < sum(values) / len(values) < 1.5 * interval
+            assert max(values) < 3 * interval
+    finally:
+        stream.stop()
+        ser.close()
+    # stop ends the reader thread
+    assert stream.thread is None
+
+
+def test_old_frames_are_lost():
+    stream = maxigauge.MaxigaugeStream(None, timeout=0.05)
+    assert stream.read(1) is None
+    assert stream.feed(b'0,1.0000E-09,0,2.0000E-09,0,3.0000E-09,0,4.0000E-09,0,5.0000E-09,0,6.0000E-09\r\n')
+    assert stream.read(3) == (0, 3e-9)
+    time.sleep(0.1)
+    assert stream.read(3) is None
@@ -0,0 +1,38 @@
+# python -m pytest test_scheduler.py
+
+import asyncio
+import time
+
+import scheduler
+
+
+def test_priority_of_late_reads():
+    # both reads are late after the loop was blocked, the one with the higher priority starts first
+    started = []
+
+    async def main():
+        s = scheduler.Scheduler(asyncio.get_running_loop())
+        task = asyncio.ensure_future(s.run())
+        s.add('low', 0.2, lambda: started.append('low'), priority=0)
+        s.add('high', 0.2, lambda: started.append('high'), priority=9)
+        time.sleep(0.3)
+        await asyncio.sleep(0.35)
+        task.cancel()
+
+    asyncio.run(main())
+    assert started[:4] == ['high', 'low', 'high', 'low']
+
+
+def test_skipped_while_running():
+    # a read still running when its next deadline comes up is not started twice
+    async def main():
+        s = scheduler.Scheduler(asyncio.get_running_loop())
+        task = asyncio.ensure_future(s.run())
+        s.add('slow', 0.05, lambda: asyncio.sleep(0.12))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        return s.entries['slow']
+
+    entry = asyncio.run(main())
+    assert entry.runs >= 3
+    assert entry.skipped >= entry.runs
@@ -0,0 +1,45 @@
+# python -m pytest test_tail.py
+
+import datetime as dt
+
+import tail
+
+DATE_FMT = '%Y-%m-%d_%H:%M:%S'
+ROWS = ''.join('2026-10-17_12:00:0{0}\t {0}.5\n'.format(i) for i in range(5))
+
+
+def write_log(directory, text):
+    path = directory / 'pressure.log'
+    path.write_text('Time\tPSTM[mbar]\n' + text)
+    return str(path)
+
+
+def records(path, n, block_size=tail.BLOCK_SIZE):
+    return tail.tail(path, n, tail.parse_row(DATE_FMT), block_size=block_size)
+
+
+def test_last_rows(tmp_path):
+    path = write_log(tmp_path, ROWS)
+    for block_size in (5, 16, tail.BLOCK_SIZE):
+        assert records(path, 2, block_size) == [(dt.datetime(2026, 10, 17, 12, 0, 3), [3.5]),
+                                                (dt.datetime(2026, 10, 17, 12, 0, 4), [4.5])]
+        assert len(records(path, 10, block_size)) == 5
+
+
+def test_row_without_newline_is_skipped(tmp_path):
+    # a row cut off in the middle of a value parses, but its value is wrong
+    path = write_log(tmp_path, ROWS + '2026-10-17_12:00:05\t 12')
+    for block_size in (5, 16, tail.BLOCK_SIZE):
+        assert records(path, 1, block_size) == [(dt.datetime(2026, 10, 17, 12, 0, 4), [4.5])]
+        assert len(records(path, 10, block_size)) == 5
+
+
+def test_file_without_newline(tmp_path):
+    path = tmp_path / 'helium.log'
+    path.write_text('2026-10-17_12:00:00\t 12')
+    assert records(str(path), 1) == []
+    assert records(str(path), 1, 4) == []
+
+
+def test_missing_file(tmp_path):
+    assert records(str(tmp_path / 'missing.log'), 1) == []
@@ -0,0 +1,134 @@
+# MAX31856 thermocouple chip in automatic conversion mode
+#
+# read_temp_c() of the Adafruit driver starts a one-shot conversion and waits for it, with
+# 16 samples averaging that takes more than half a second per call. In automatic conversion
+# mode the chip converts continuously (every 100 ms) and the results are just read out.
+# Thermocouple and cold junction temperature are read in one transfer, so one chip serves
+# both the thermocouple channel and the internal temperature channel (TSAM and TLAB).
+#
+# run this file directly for a comparison on a simulated chip
+
+import threading
+import time
+
+REG_WRITE_CR0 = 0x80
+CR0_AUTO_CONVERSION = 0x80
+REG_READ_CJTH = 0x0A        # CJTH, CJTL, LTCBH, LTCBM, LTCBL, SR follow each other
+READ_LENGTH = 6
+# fault status register (SR)
+FAULT_CJ = 0x80 | 0x20 | 0x10                  # CJRANGE, CJHIGH, CJLOW
+FAULT_TC = 0x40 | 0x08 | 0x04 | 0x02 | 0x01    # TCRANGE, TCHIGH, TCLOW, OVUV, OPEN
+
+
+def cold_junction_temp(high, low):
+    # 14 bit two's complement, 0.015625 C per bit, left justified
+    value = ((high << 8) | low) >> 2
+    if value & 0x2000:
+        value -= 0x4000
+    return value * 0.015625
+
+
+def thermocouple_temp(high, mid, low):
+    # 19 bit two's complement, 0.0078125 C per bit, left justified
+    value = ((high << 16) | (mid << 8) | low) >> 5
+    if value & 0x40000:
+        value -= 0x80000
+    return value * 0.0078125
+
+
+class MAX31856Auto:
+    def __init__(self, chip, period=0.1):
+        self.chip = chip            # Adafruit_MAX31856.MAX31856
+        self.period = period        # time between two conversions of the chip
+        self.lock = threading.Lock()
+        self.result = None          # (thermocouple, cold junction, fault) of the last conversion
+        self.time_read = 0
+        self.reads = 0
+        self.chip._write_register(REG_WRITE_CR0, CR0_AUTO_CONVERSION)
+
+    def read_registers(self):
+        spi = getattr(self.chip, '_spi', None)
+        if spi is not None:
+            # one transfer for all result registers, first byte is the address
+            return list(spi.transfer([REG_READ_CJTH] + [0x00] * READ_LENGTH))[1:]
+        return [self.chip._read_register(REG_READ_CJTH + i) for i in range(READ_LENGTH)]
+
+    def read(self, faults=FAULT_CJ | FAULT_TC):
+        # (thermocouple, cold junction) temperature, read from the chip only if there is a new conversion,
+        # raises IOError if one of the faults is set
+        with self.lock:
+            now = time.time()
+            if self.result is None or now - self.time_read >= self.period:
+                cjth, cjtl, ltcbh, ltcbm, ltcbl, fault = self.read_registers()
+                self.result = (thermocouple_temp(ltcbh, ltcbm, ltcbl), cold_junction_temp(cjth, cjtl), fault)
+                self.time_read = now
+                self.reads += 1
+            tc, cj, fault = self.result
+        if fault & faults:
+            raise IOError('MAX31856 fault 0x{:02x}'.format(fault))
+        return tc, cj
+
+    def read_temp_c(self):
+        # an open thermocouple does not make the cold junction temperature (TLAB) invalid
+        return self.read(FAULT_TC)[0]
+
+    def read_internal_temp_c(self):
+        return self.read(FAULT_CJ)[1]
+
+
+if __name__ == '__main__':
+    # simulated chip with the conversion times of the MAX31856 (60 Hz filter, 16 samples averaging)
+    import random
+
+    class SimulatedSPI:
+        def __init__(self, chip):
+            self.chip = chip
+            self.transfers = 0
+
+        def transfer(self, data):
+            self.transfers += 1
+            registers = self.chip.registers()
+            return [0] + [registers[data[0] + i - REG_READ_CJTH] for i in range(len(data) - 1)]
+
+    class SimulatedMAX31856:
+        one_shot_time = 0.143 + 15 * 0.0333
+
+        def __init__(self):
+            self._spi = SimulatedSPI(self)
+
+        def _write_register(self, address, value):
+            pass
+
+        def registers(self):
+            tc = int((21.0 + random.random() * 0.1) / 0.0078125) << 5
+            cj = int((22.0 + random.random() * 0.1) / 0.015625) << 2
+            return [cj >> 8, cj & 0xFF, tc >> 16, (tc >> 8) & 0xFF, tc & 0xFF, 0]
+
+        def read_temp_c(self):
+            time.sleep(self.one_shot_time)
+            return 21.0
+
+        def read_internal_temp_c(self):
+            return 22.0
+
+    # like read_analog did: 15 one-shot reads for TSAM, 15 register reads for TLAB
+    chip = SimulatedMAX31856()
+    t = time.time()
+    for _ in range(15):
+        chip.read_temp_c()
+    for _ in range(15):
+        chip.read_internal_temp_c()
+    print('one-shot:        {:8.1f} ms per pass'.format(1000 * (time.time() - t)))
+
+    # automatic conversion, one read serves TSAM and TLAB
+    chip = SimulatedMAX31856()
+    driver = MAX31856Auto(chip)
+    passes = 100
+    t = time.time()
+    for _ in range(passes):
+        tsam = driver.read_temp_c()
+        tlab = driver.read_internal_temp_c()
+        time.sleep(0.02)
+    t_pass = (time.time() - t) / passes - 0.02
+    print('auto conversion: {:8.3f} ms per pass, {} spi transfers in {} passes, TSAM {:.2f} C, TLAB {:.2f} C'.format(
+        1000 * t_pass, chip._spi.transfers, passes, tsam, tlab))
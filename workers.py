@@ -0,0 +1,201 @@
+# pool of long-lived worker threads for periodic tasks
+#
+# A task is a named function which is scheduled to run after a delay. While a task is
+# scheduled, further requests are dropped (coalescing), so it never waits in the queue
+# twice and never runs twice at the same time. Scheduling a task from within itself
+# is allowed, the next run starts after the current one has finished.
+#
+# run this file directly for a comparison with one threading.Timer per call
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class Task:
+    def __init__(self, name):
+        self.name = name
+        self.func = None
+        self.args = ()
+        self.kwargs = {}
+        self.due = None             # time of the next run, None if not scheduled
+        self.running = False
+        self.last_scheduled = 0
+
+
+class WorkerPool:
+    def __init__(self, num_workers=4):
+        self.tasks = {}
+        self.queue = []             # heap of (due, sequence number, task)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.workers = [threading.Thread(target=self._work, name='worker{}'.format(i), daemon=True)
+                        for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def schedule(self, name, delay, func, args=(), kwargs=None, min_interval=0):
+        # run func(*args, **kwargs) after delay seconds, returns False if the task is already scheduled
+        # or if it was scheduled less than min_interval seconds ago
+        now = time.time()
+        with self.condition:
+            if not self.running:
+                return False
+            task = self.tasks.get(name)
+            if task is None:
+                task = self.tasks[name] = Task(name)
+            if task.due is not None or now - task.last_scheduled < min_interval:
+                return False
+            task.func, task.args, task.kwargs = func, args, kwargs or {}
+            task.due = now + delay
+            task.last_scheduled = now
+            if not task.running:
+                self._push(task)
+            return True
+
+    def _push(self, task):
+        heapq.heappush(self.queue, (task.due, next(self.sequence), task))
+        self.condition.notify()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    if self.queue:
+                        delay = self.queue[0][0] - time.time()
+                        if delay <= 0:
+                            break
+                    else:
+                        delay = None
+                    self.condition.wait(delay)
+                if not self.running:
+                    return
+                _, _, task = heapq.heappop(self.queue)
+                func, args, kwargs = task.func, task.args, task.kwargs
+                task.due = None
+                task.running = True
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print('Worker: {} failed: {}'.format(task.name, e))
+            finally:
+                with self.condition:
+                    task.running = False
+                    if task.due is not None and self.running:
+                        # was scheduled again while running
+                        self._push(task)
+                    self.condition.notify_all()
+
+    def wait(self, name, timeout=None):
+        # wait until task is neither scheduled nor running
+        with self.condition:
+            task = self.tasks.get(name)
+            if task is None:
+                return True
+            return self.condition.wait_for(lambda: task.due is None and not task.running, timeout)
+
+    def shutdown(self, wait=True, timeout=5):
+        # drop scheduled tasks and stop the workers after their current task
+        with self.condition:
+            self.running = False
+            self.queue = []
+            for task in self.tasks.values():
+                task.due = None
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                if worker is not threading.current_thread():
+                    worker.join(timeout)
+
+
+if __name__ == '__main__':
+    # six tasks triggered like main_loop_sensors does (12.5 times per second) on an otherwise idle system
+    from functools import wraps
+
+    def _start_async_timer(interval):
+        # the previous decorator: a new threading.Timer for every run
+        def decorator(func):
+            @wraps(func)
+            def wrapper(self):
+                thread = self.threads.get(func.__name__)
+                if thread is None or not thread.is_alive():
+                    self.threads[func.__name__] = threading.Timer(interval, func, args=(self,))
+                    self.threads[func.__name__].start()
+            return wrapper
+        return decorator
+
+    def _start_async_pool(interval):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(self):
+                self.pool.schedule(func.__name__, interval, func, args=(self,))
+            return wrapper
+        return decorator
+
+    def make_tasks(start_async):
+        class Tasks:
+            def __init__(self):
+                self.threads = {}
+                self.pool = None
+
+            @start_async(0.001)
+            def analog(self):
+                time.sleep(0.002)
+
+            @start_async(5)
+            def gradient(self):
+                pass
+
+            @start_async(2)
+            def save_to_log(self):
+                pass
+
+            @start_async(1)
+            def sanity_checks(self):
+                pass
+
+            @start_async(0.1)
+            def helium(self):
+                pass
+
+            @start_async(0.001)
+            def main_loop(self):
+                pass
+
+            def run_all(self):
+                self.analog()
+                self.gradient()
+                self.save_to_log()
+                self.sanity_checks()
+                self.helium()
+                self.main_loop()
+        return Tasks()
+
+    thread_start = threading.Thread.start
+    started = [0]
+
+    def counting_start(self):
+        started[0] += 1
+        thread_start(self)
+    threading.Thread.start = counting_start
+
+    duration = 5
+    for name, start_async in [('threading.Timer', _start_async_timer), ('worker pool', _start_async_pool)]:
+        tasks = make_tasks(start_async)
+        if start_async is _start_async_pool:
+            tasks.pool = WorkerPool(6)
+        # the pool starts its threads once, only count the ones started while running
+        started[0] = 0
+        cpu = time.process_time()
+        t_end = time.time() + duration
+        while time.time() < t_end:
+            tasks.run_all()
+            time.sleep(0.08)
+        cpu = time.process_time() - cpu
+        if tasks.pool is not None:
+            tasks.pool.shutdown()
+        time.sleep(0.1)
+        print('{:16s}: {:6.0f} thread creations per minute, cpu {:5.1f} %'.format(
+            name, started[0] * 60 / duration, 100 * cpu / duration))